@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - ベンチマーク
+録画フレームを使って推論処理・類似度計算の所要時間を計測
+"""
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+def load_frames(frames_dir, count, size=(640, 360)):
+    """計測用フレームを読み込み（未指定時はランダム画像）"""
+    if frames_dir:
+        paths = sorted(
+            p for p in Path(frames_dir).iterdir()
+            if p.suffix.lower() in ('.jpg', '.jpeg', '.png')
+        )
+        frames = [cv2.imread(str(p)) for p in paths[:count]]
+        frames = [f for f in frames if f is not None]
+        if not frames:
+            raise SystemExit(f"❌ フレームが見つかりません: {frames_dir}")
+        return frames
+
+    rng = np.random.default_rng(0)
+    width, height = size
+    return [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def measure(func, repeat, warmup=1):
+    """関数の実行時間を計測（ミリ秒のリスト）"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings, items=1):
+    """計測結果を表示"""
+    mean = statistics.mean(timings)
+    p95 = sorted(timings)[int(len(timings) * 0.95) - 1] if len(timings) > 1 else mean
+    throughput = items * 1000 / mean if mean > 0 else 0
+    print(f"  {name:<24} 平均 {mean:8.1f}ms  p95 {p95:8.1f}ms  {throughput:7.1f} 枚/秒")
+    return mean
+
+
+def bench_scan(args):
+    """スキャン1回分の推論: 位置ごとの逐次推論 vs 一括推論"""
+    from ultralytics import YOLO
+
+    model = YOLO(args.model)
+    frames = load_frames(args.frames, args.positions)
+    while len(frames) < args.positions:
+        frames += frames[:args.positions - len(frames)]
+    frames = frames[:args.positions]
+
+    print(f"📊 スキャン推論（{args.positions}位置, {args.repeat}回）")
+    sequential = report(
+        "逐次 (batch=1)",
+        measure(lambda: [model(f, verbose=False) for f in frames], args.repeat),
+        len(frames)
+    )
+    batch = report(
+        f"一括 (batch={len(frames)})",
+        measure(lambda: model(frames, verbose=False), args.repeat),
+        len(frames)
+    )
+    print(f"  ⚡ 一括推論の速度比: {sequential / batch:.2f}x")
+
+
+def bench_roi(args):
+    """追尾1回分の推論: 全体推論 vs 前回ボックス周辺の縮小推論"""
+    from ultralytics import YOLO
+    from detection import padded_roi
+
+    model = YOLO(args.model)
+    frame = load_frames(args.frames, 1)[0]
+    height, width = frame.shape[:2]
+    # 画面中央に人物がいると仮定した前回ボックス
+    bbox = (width * 0.4, height * 0.2, width * 0.6, height * 0.9)
+    rx1, ry1, rx2, ry2 = padded_roi(bbox, frame.shape, args.padding)
+    roi = frame[ry1:ry2, rx1:rx2]
+
+    print(f"📊 追尾推論（{width}x{height} → ROI {rx2 - rx1}x{ry2 - ry1}, {args.repeat}回）")
+    full = report("全体 (imgsz=640)", measure(lambda: model(frame, verbose=False, classes=[0]), args.repeat))
+    cropped = report(
+        f"ROI (imgsz={args.imgsz})",
+        measure(lambda: model(roi, verbose=False, classes=[0], imgsz=args.imgsz), args.repeat)
+    )
+    print(f"  ⚡ ROI推論の速度比: {full / cropped:.2f}x")
+
+
+def bench_backends(args):
+    """検出バックエンドごとの遅延とスループット"""
+    from detection import create_detector
+
+    frames = load_frames(args.frames, max(args.batch, 1))
+    while len(frames) < args.batch:
+        frames += frames[:args.batch - len(frames)]
+    batch = frames[:args.batch]
+
+    print(f"📊 検出バックエンド（{len(frames)}フレーム, バッチ{args.batch}, {args.repeat}回）")
+    for spec in args.backend or ['ultralytics:yolov8n.pt']:
+        backend, _, model = spec.partition(':')
+        config = {'backend': backend, 'threads': args.threads}
+        if model:
+            config['model'] = model
+        detector = create_detector(config)
+
+        print(f"\n  [{spec}]")
+        report("遅延 (1枚)", measure(lambda: detector.detect(frames[0]), args.repeat))
+        report(f"スループット (バッチ{len(batch)})", measure(lambda: detector.detect_batch(batch), args.repeat), len(batch))
+
+
+def similarity_pairs(frames, count, size=(90, 200), seed=0):
+    """人物領域の組（ノイズ・明るさ・数画素のずれを加えた同じ領域と、別の領域）"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    pairs = []
+    for index in range(count):
+        frame = frames[index % len(frames)]
+        frame_h, frame_w = frame.shape[:2]
+        x = int(rng.integers(0, max(1, frame_w - width - 4)))
+        y = int(rng.integers(0, max(1, frame_h - height - 4)))
+        crop = frame[y:y + height, x:x + width]
+
+        # 同じ位置: 撮影ごとの揺らぎを加える
+        dx, dy = rng.integers(0, 4, size=2)
+        same = frame[y + dy:y + dy + height, x + dx:x + dx + width].astype(np.float32)
+        same = same * rng.uniform(0.9, 1.1) + rng.normal(0, rng.uniform(2, 8), same.shape)
+        pairs.append((crop, np.clip(same, 0, 255).astype(np.uint8), True))
+
+        # 別の位置
+        other = frames[(index + 1) % len(frames)]
+        ox = int(rng.integers(0, max(1, other.shape[1] - width)))
+        oy = int(rng.integers(0, max(1, other.shape[0] - height)))
+        pairs.append((crop, other[oy:oy + height, ox:ox + width], False))
+    return pairs
+
+
+def calibrate(scores, reference):
+    """基準の判定と最もよく一致するしきい値と一致率"""
+    candidates = np.unique(np.round(scores, 3))
+    best = (0.0, 0.0)
+    for threshold in candidates:
+        agreement = float(np.mean((scores > threshold) == reference))
+        if agreement > best[1]:
+            best = (float(threshold), agreement)
+    return best
+
+
+def bench_similarity(args):
+    """同じ位置判定の類似度: 従来の skimage SSIM vs ボックスSSIM・知覚ハッシュ・ヒストグラム"""
+    from similarity import SimilarityEngine, ssim_box, to_gray
+
+    frames = load_frames(args.frames, 8)
+    if not args.frames:
+        # ランダム画像は構造がないためぼかして画像らしくする
+        frames = [cv2.GaussianBlur(frame, (15, 15), 0) for frame in frames]
+    pairs = similarity_pairs(frames, args.pairs)
+
+    try:
+        from skimage.metrics import structural_similarity
+    except ImportError:
+        structural_similarity = None
+
+    def legacy(crop1, crop2):
+        # 従来の compare_with_previous と同じ処理（全解像度・SSIMマップあり）
+        resized = cv2.resize(crop2, (crop1.shape[1], crop1.shape[0]))
+        score, _ = structural_similarity(to_gray(crop1), to_gray(resized), full=True)
+        return score
+
+    # 基準: 全解像度SSIMで similarity_threshold を超えるか
+    reference = np.array([ssim_box(to_gray(a), to_gray(b)) > args.threshold for a, b, _ in pairs])
+
+    print(f"📊 類似度（{len(pairs)}組, {args.repeat}回, 基準: 全解像度SSIM > {args.threshold}）")
+    results = {}
+    if structural_similarity is not None:
+        results['skimage (従来)'] = (
+            report("skimage (従来)", measure(lambda: [legacy(a, b) for a, b, _ in pairs], args.repeat), len(pairs)),
+            None
+        )
+    else:
+        print("  ℹ️ scikit-image がないため従来方式は計測しません")
+
+    for method in SimilarityEngine.METHODS:
+        engine = SimilarityEngine(method, size=tuple(args.size))
+        mean = report(
+            f"{method} ({args.size[0]}x{args.size[1]})" if method != 'histogram' else method,
+            measure(lambda: [engine.similarity(a, b) for a, b, _ in pairs], args.repeat),
+            len(pairs)
+        )
+        # 前回分の特徴を保持している場合（監視中はこちら）
+        previous = [engine.features(a) for a, _, _ in pairs]
+        cached = report(
+            "  └ 前回の特徴を再利用",
+            measure(lambda: [engine.compare(f, engine.features(b)) for f, (_, b, _) in zip(previous, pairs)], args.repeat),
+            len(pairs)
+        )
+        scores = np.array([engine.similarity(a, b) for a, b, _ in pairs])
+        results[method] = (min(mean, cached), calibrate(scores, reference))
+
+    print("\n  方式ごとのしきい値（基準と最もよく一致する値）")
+    for method, (_, calibration) in results.items():
+        if calibration is None:
+            continue
+        threshold, agreement = calibration
+        print(f"  {method:<10} しきい値 {threshold:.3f}  一致率 {agreement * 100:5.1f}%")
+
+    if 'skimage (従来)' in results:
+        legacy_mean = results['skimage (従来)'][0]
+        for method in SimilarityEngine.METHODS:
+            print(f"  ⚡ {method} の速度比: {legacy_mean / results[method][0]:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="見守りハロ ベンチマーク")
+    parser.add_argument('--frames', help="録画フレーム（jpg/png）のディレクトリ")
+    parser.add_argument('--repeat', type=int, default=10, help="計測回数")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan = subparsers.add_parser('scan', help="逐次推論と一括推論の比較")
+    scan.add_argument('--model', default='yolov8n.pt')
+    scan.add_argument('--positions', type=int, default=3, help="スキャン位置数")
+    scan.set_defaults(func=bench_scan)
+
+    roi = subparsers.add_parser('roi', help="全体推論と追尾用ROI推論の比較")
+    roi.add_argument('--model', default='yolov8n.pt')
+    roi.add_argument('--padding', type=float, default=0.5)
+    roi.add_argument('--imgsz', type=int, default=320)
+    roi.set_defaults(func=bench_roi)
+
+    backends = subparsers.add_parser('backends', help="検出バックエンドの比較")
+    backends.add_argument(
+        '--backend', action='append',
+        help="バックエンド:モデル（例: onnx:yolov8n.onnx）。複数指定可"
+    )
+    backends.add_argument('--threads', type=int, help="ONNX Runtime / OpenVINO のスレッド数")
+    backends.add_argument('--batch', type=int, default=3, help="スループット計測のバッチサイズ")
+    backends.set_defaults(func=bench_backends)
+
+    similarity = subparsers.add_parser('similarity', help="同じ位置判定の類似度計算の比較としきい値の較正")
+    similarity.add_argument('--pairs', type=int, default=50, help="比較する人物領域の組数（同じ・別それぞれ）")
+    similarity.add_argument('--threshold', type=float, default=0.85, help="基準とするSSIMのしきい値")
+    similarity.add_argument('--size', type=int, nargs=2, default=[48, 96], metavar=('W', 'H'), help="比較前の縮小サイズ")
+    similarity.set_defaults(func=bench_similarity)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
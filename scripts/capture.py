@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - フレーム取得
+RTSPストリームを常時受信し、最新フレームをメモリ上に保持する
+"""
+
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+# RTSPはTCPで受信（VideoCapture生成前に設定が必要）
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp")
+
+import cv2
+import numpy as np
+
+
+def rtsp_url(camera):
+    """カメラ設定からRTSP URLを生成"""
+    return (
+        f"rtsp://{camera['username']}:{camera['password']}"
+        f"@{camera['host']}:{camera['rtsp_port']}/stream1"
+    )
+
+
+class FrameGrabber:
+    """常駐フレーム取得スレッド
+
+    ストリームを開いたままデコードを続け、最新フレームだけを保持する。
+    接続が切れた場合は指数バックオフで再接続する。
+    source に動画ファイルを指定すると、実時間でループ再生する
+    オフライン用の代替カメラとして動作する。
+    """
+
+    def __init__(self, source, reconnect_min=1.0, reconnect_max=30.0):
+        self.source = str(source)
+        self.is_file = Path(self.source).is_file()
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._frame_time = 0.0
+        self._frame_count = 0
+        self._running = False
+        self._thread = None
+
+        # 統計
+        self.reconnects = 0
+
+    def start(self):
+        """受信スレッドを開始"""
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """受信スレッドを停止"""
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def read(self, newer_than=None, timeout=5.0):
+        """最新フレームを取得
+
+        newer_than（time.monotonic() の値）を指定すると、それ以降に
+        デコードされたフレームが届くまで待つ。タイムアウト時は None。
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._frame is None or (newer_than is not None and self._frame_time < newer_than):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    return None
+                self._cond.wait(remaining)
+            return self._take()
+
+    @property
+    def frame_count(self):
+        return self._frame_count
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.source, cv2.CAP_FFMPEG)
+        if cap.isOpened():
+            # 古いフレームを溜め込まない
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _take(self):
+        """read() の待機と同じロック内で返すフレームを取り出す"""
+        return self._frame
+
+    def _publish(self, frame):
+        with self._cond:
+            self._frame = frame
+            self._frame_time = time.monotonic()
+            self._frame_count += 1
+            self._cond.notify_all()
+
+    def _run(self):
+        backoff = self.reconnect_min
+
+        while self._running:
+            cap = self._open()
+            if not cap.isOpened():
+                cap.release()
+                print(f"⚠️ ストリーム接続失敗 - {backoff:g}秒後に再接続")
+                self._sleep(backoff)
+                backoff = min(backoff * 2, self.reconnect_max)
+                self.reconnects += 1
+                continue
+
+            # ファイル再生時は元のフレームレートで送出
+            fps = cap.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+            frame_interval = 1.0 / fps if fps and fps > 0 else 0
+            next_frame_at = time.monotonic()
+            rewound = False
+
+            while self._running:
+                ok, frame = cap.read()
+                if not ok:
+                    if self.is_file and self._frame_count > 0 and not rewound:
+                        # ファイル終端: 先頭に戻ってループ（戻しても読めなければ開き直す）
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        rewound = True
+                        continue
+                    break
+
+                rewound = False
+                backoff = self.reconnect_min
+                self._publish(frame)
+
+                if frame_interval:
+                    next_frame_at += frame_interval
+                    delay = next_frame_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_frame_at = time.monotonic()
+
+            cap.release()
+            if self._running:
+                print(f"⚠️ ストリーム切断 - {backoff:g}秒後に再接続")
+                self._sleep(backoff)
+                backoff = min(backoff * 2, self.reconnect_max)
+                self.reconnects += 1
+
+    def _sleep(self, seconds):
+        """停止要求で中断できる待機"""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._running, timeout=seconds)
+
+
+class PipeFrameGrabber(FrameGrabber):
+    """ffmpegの rawvideo(bgr24) 出力をパイプで受け取るフレーム取得
+
+    JPEGエンコード・一時ファイル・デコードを経由せず、事前確保した
+    NumPyバッファへ readinto で直接読み込む。バッファは3面を使い回し、
+    最新フレームと利用中のフレームを上書きしないため、フレームごとの
+    メモリ確保は発生しない。上書きから保護されるのは最後に read() で
+    返したフレーム1面だけなので、読み出し側は1つを想定しており、返した
+    フレームは次の read()（どのスレッドからでも）まで有効。それ以上保持する
+    場合や複数のスレッドから読む場合は呼び出し側でコピーする。
+    """
+
+    BUFFER_COUNT = 3
+
+    def __init__(self, source, width=None, height=None, reconnect_min=1.0, reconnect_max=30.0):
+        super().__init__(source, reconnect_min=reconnect_min, reconnect_max=reconnect_max)
+        self.width = width
+        self.height = height
+        self.scale = width is not None and height is not None
+        self._buffers = None
+        self._latest = None
+        self._leased = None
+        self._proc = None
+
+    def _take(self):
+        # 選んだフレームと同じバッファを同じロック内で貸し出す
+        self._leased = self._latest
+        return self._buffers[self._latest]
+
+    def stop(self):
+        # 先に停止を知らせてから ffmpeg を終了する（パイプの終端を切断と誤認しない）
+        self._running = False
+        proc = self._proc
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+        super().stop()
+
+    def _probe_size(self):
+        """ffprobeで映像サイズを取得"""
+        cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+               '-show_entries', 'stream=width,height', '-of', 'csv=p=0']
+        if self.source.startswith('rtsp://'):
+            cmd += ['-rtsp_transport', 'tcp']
+        result = subprocess.run(cmd + [self.source], capture_output=True, text=True, timeout=15)
+        width, height = result.stdout.strip().splitlines()[0].split(',')[:2]
+        return int(width), int(height)
+
+    def _allocate(self):
+        if self._buffers is not None:
+            return
+        if not self.scale:
+            self.width, self.height = self._probe_size()
+        self._buffers = [np.empty((self.height, self.width, 3), dtype=np.uint8)
+                         for _ in range(self.BUFFER_COUNT)]
+        self._views = [memoryview(buf).cast('B') for buf in self._buffers]
+
+    def _command(self):
+        cmd = ['ffmpeg', '-loglevel', 'error', '-nostdin']
+        if self.source.startswith('rtsp://'):
+            cmd += ['-rtsp_transport', 'tcp']
+        if self.is_file:
+            # 実時間でループ再生（オフライン用）
+            cmd += ['-re', '-stream_loop', '-1']
+        cmd += ['-i', self.source, '-an', '-f', 'rawvideo', '-pix_fmt', 'bgr24']
+        if self.scale:
+            cmd += ['-s', f'{self.width}x{self.height}']
+        return cmd + ['pipe:1']
+
+    def _next_index(self):
+        """最新・利用中のどちらでもないバッファを選ぶ"""
+        with self._cond:
+            busy = (self._latest, self._leased)
+        for index in range(self.BUFFER_COUNT):
+            if index not in busy:
+                return index
+
+    def _publish_index(self, index):
+        """読み込んだバッファを最新フレームとして公開"""
+        with self._cond:
+            self._latest = index
+            self._frame = self._buffers[index]
+            self._frame_time = time.monotonic()
+            self._frame_count += 1
+            self._cond.notify_all()
+
+    def _read_frame(self, stdout, index):
+        """1フレーム分を指定バッファへ読み込む"""
+        view = self._views[index]
+        size = len(view)
+        filled = 0
+        while filled < size:
+            n = stdout.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    def _run(self):
+        backoff = self.reconnect_min
+
+        while self._running:
+            try:
+                self._allocate()
+                self._proc = subprocess.Popen(
+                    self._command(), stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL, bufsize=0
+                )
+            except (OSError, ValueError, IndexError, subprocess.TimeoutExpired) as e:
+                print(f"⚠️ ffmpeg起動失敗: {e} - {backoff:g}秒後に再接続")
+                self._sleep(backoff)
+                backoff = min(backoff * 2, self.reconnect_max)
+                self.reconnects += 1
+                continue
+
+            stdout = self._proc.stdout
+            while self._running:
+                index = self._next_index()
+                if not self._read_frame(stdout, index):
+                    break
+
+                backoff = self.reconnect_min
+                self._publish_index(index)
+
+            if self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.wait()
+            stdout.close()
+            if self._running:
+                print(f"⚠️ ストリーム切断 - {backoff:g}秒後に再接続")
+                self._sleep(backoff)
+                backoff = min(backoff * 2, self.reconnect_max)
+                self.reconnects += 1
+
+
+def create_grabber(capture_config, source):
+    """設定に応じたフレーム取得を生成（snapshot 指定時は None）"""
+    backend = capture_config.get('backend', 'stream')
+    options = {
+        'reconnect_min': capture_config.get('reconnect_min', 1.0),
+        'reconnect_max': capture_config.get('reconnect_max', 30.0)
+    }
+    if backend == 'stream':
+        return FrameGrabber(source, **options)
+    if backend == 'pipe':
+        return PipeFrameGrabber(
+            source,
+            width=capture_config.get('width'),
+            height=capture_config.get('height'),
+            **options
+        )
+    return None
+
+
+if __name__ == "__main__":
+    # オフライン確認用: python3 scripts/capture.py <動画ファイル or RTSP URL> [stream|pipe]
+    import sys
+
+    if len(sys.argv) < 2:
+        print("使い方: python3 scripts/capture.py <動画ファイル or RTSP URL> [stream|pipe]")
+        sys.exit(1)
+
+    backend = sys.argv[2] if len(sys.argv) > 2 else 'stream'
+    grabber = create_grabber({'backend': backend}, sys.argv[1]).start()
+    try:
+        start = time.monotonic()
+        for _ in range(10):
+            t0 = time.monotonic()
+            frame = grabber.read(newer_than=t0)
+            if frame is None:
+                print("❌ フレーム取得タイムアウト")
+                break
+            print(f"📷 {frame.shape[1]}x{frame.shape[0]} 取得 {(time.monotonic() - t0) * 1000:.1f}ms")
+        elapsed = time.monotonic() - start
+        print(f"✅ デコード {grabber.frame_count}フレーム / {elapsed:.1f}秒")
+    finally:
+        grabber.stop()
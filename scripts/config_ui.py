@@ -25,7 +25,58 @@ DEFAULT_CONFIG = {
         "username": "",
         "password": "",
         "scan_positions": [-30, 0, 30],
-        "home_position": 0
+        "home_position": 0,
+        "settle_time": 0.5,
+        "use_presets": True,
+        "preset_prefix": "mimamori",
+        "fov": 60,
+        "ptz_mode": "auto",
+        "pan_limit": 180,
+        "degrees_per_second": 200,
+        "position_tolerance": 1.0,
+        "onvif_timeout": 5,
+        "simulated": False
+    },
+    "cameras": [],
+    "detector": {
+        "backend": "ultralytics",
+        "model": "yolov8n.pt",
+        "threads": None,
+        "imgsz": 640,
+        "conf": 0.25,
+        "iou": 0.7
+    },
+    "inference": {
+        "max_batch": 8,
+        "max_wait": 0.02,
+        "server": False,
+        "workers": 1,
+        "slots": 8,
+        "max_frame": [1080, 1920],
+        "timeout": 10,
+        "start_timeout": 120,
+        "max_start_failures": 3
+    },
+    "capture": {
+        "backend": "stream",
+        "source": None,
+        "width": None,
+        "height": None,
+        "read_timeout": 5,
+        "reconnect_min": 1,
+        "reconnect_max": 30
+    },
+    "scan": {
+        "mode": "sequential",
+        "early_exit": True
+    },
+    "motion_gate": {
+        "enabled": True,
+        "threshold": 0.01,
+        "pixel_threshold": 25,
+        "width": 160,
+        "max_skips": 6,
+        "pan_tolerance": 1.0
     },
     "scan_intervals": {
         "not_detected": 300,
@@ -41,13 +92,27 @@ DEFAULT_CONFIG = {
     "tracking": {
         "enabled": True,
         "duration": 60,
-        "center_tolerance": 0.1
+        "center_tolerance": 0.1,
+        "max_speed": 0.3,
+        "command_hold": 1.0,
+        "pid": {"kp": 0.4, "ki": 0.05, "kd": 0.05},
+        "roi_enabled": True,
+        "roi_padding": 0.5,
+        "roi_imgsz": 320
+    },
+    "tracker": {
+        "iou_threshold": 0.2,
+        "max_age": 600,
+        "max_misses": 5
     },
     "fall_detection": {
         "recheck_delay": 30,
         "lying_threshold": 60,
         "position_tolerance": 50,
-        "similarity_threshold": 0.85
+        "similarity_threshold": 0.85,
+        "similarity_method": "ssim",
+        "similarity_size": None,
+        "similarity_thresholds": {"ssim": 0.92, "phash": 0.90, "histogram": 0.93}
     },
     "alerts": {
         "morning_check_time": "10:00",
@@ -62,9 +127,31 @@ DEFAULT_CONFIG = {
             "smtp_port": 587,
             "sender": "",
             "password": "",
-            "recipient": ""
+            "recipient": "",
+            "allow_plaintext_auth": False
         },
-        "daily_report_time": "21:00"
+        "daily_report_time": "21:00",
+        "dispatch": {
+            "queue_size": 100,
+            "max_retries": 8,
+            "backoff_base": 5,
+            "backoff_max": 600,
+            "timeout": 10,
+            "spool_dir": None
+        },
+        "sinks": []
+    },
+    "startup": {
+        "parallel": True,
+        "onvif_cache": True,
+        "warmup": True
+    },
+    "scheduler": {
+        "late_warning": 5
+    },
+    "storage": {
+        "backend": "jsonl",
+        "path": None
     },
     "privacy": {
         "save_images": False,
@@ -459,6 +546,7 @@ HTML_TEMPLATE = """
                         <div class="form-group">
                             <label for="fall_similarity">画像類似度閾値（0-1）</label>
                             <input type="number" step="0.01" id="fall_similarity" name="fall_detection.similarity_threshold" value="0.85">
+                            <div class="help-text">全解像度SSIM（既定）での値。similarity_size を指定した縮小比較や他の方式は similarity_thresholds を使います</div>
                         </div>
                     </div>
                 </div>
@@ -624,6 +712,16 @@ HTML_TEMPLATE = """
 </html>
 """
 
+def merge_config(base, updates):
+    """フォームにない設定項目を残したまま上書き"""
+    merged = dict(base)
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
 @app.route('/')
 def index():
     """メインページ"""
@@ -652,6 +750,13 @@ def save_config():
     try:
         config = request.get_json()
 
+        # 既存の設定（フォーム対象外の項目を含む）に重ねる
+        if CONFIG_FILE.exists():
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                config = merge_config(json.load(f), config)
+        else:
+            config = merge_config(DEFAULT_CONFIG, config)
+
         # ディレクトリ作成
         CONFIG_DIR.mkdir(parents=True, exist_ok=True)
 
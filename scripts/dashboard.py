@@ -4,11 +4,17 @@
 リアルタイムで監視状態を表示
 """
 
-from flask import Flask, render_template_string, jsonify
+from flask import Flask, Response, render_template_string, jsonify, request, stream_with_context
 import json
 from pathlib import Path
 from datetime import datetime, timedelta
+import copy
 import os
+import threading
+import time
+from collections import deque
+
+from event_store import create_store
 
 app = Flask(__name__)
 
@@ -28,47 +34,33 @@ def load_config():
         pass
     return None
 
+store = create_store(load_config(), DATA_DIR, LOG_DIR)
+
 def load_today_data():
     """本日のデータを読み込み"""
     today = datetime.now().strftime("%Y-%m-%d")
-    data_file = DATA_DIR / f"{today}.json"
 
-    if data_file.exists():
+    try:
+        return store.load_day(today)
+    except json.JSONDecodeError as e:
+        print(f"Warning: JSON decode error in data file: {e}")
+        # JSONが破損している場合、1日前のデータを試す
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
         try:
-            with open(data_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                # JSONが破損している場合も処理できるようにする
-                if content.strip():
-                    return json.loads(content)
-        except json.JSONDecodeError as e:
-            print(f"Warning: JSON decode error in {data_file}: {e}")
-            # JSONが破損している場合、1日前のデータを試す
-            yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-            yesterday_file = DATA_DIR / f"{yesterday}.json"
-            if yesterday_file.exists():
-                try:
-                    with open(yesterday_file, 'r', encoding='utf-8') as f:
-                        return json.load(f)
-                except:
-                    pass
-        except Exception as e:
-            print(f"Warning: Error loading data file: {e}")
+            return store.load_day(yesterday)
+        except:
+            pass
+    except Exception as e:
+        print(f"Warning: Error loading data file: {e}")
     return None
 
 def load_recent_alerts():
-    """最近のアラートを読み込み"""
-    alerts = []
-    current_month = datetime.now().strftime("%Y-%m")
-    log_file = LOG_DIR / f"alerts_{current_month}.log"
-
-    if log_file.exists():
-        with open(log_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            # 最新10件
-            for line in lines[-10:]:
-                alerts.append(line.strip())
-
-    return alerts
+    """最近のアラートを読み込み（最新10件）"""
+    try:
+        return store.recent_alerts(limit=10)
+    except Exception as e:
+        print(f"Warning: Error loading alerts: {e}")
+        return []
 
 def get_status_color(minutes_since_last):
     """最終活動からの経過時間に基づいてステータス色を返す"""
@@ -442,6 +434,8 @@ HTML_TEMPLATE = """
 
     <script>
         let autoRefreshInterval;
+        let eventSource = null;
+        let latestData = null;
 
         async function refreshData() {
             const btn = document.getElementById('refreshBtn');
@@ -450,6 +444,7 @@ HTML_TEMPLATE = """
             try {
                 const response = await fetch('/api/status');
                 const data = await response.json();
+                latestData = data;
                 updateDashboard(data);
             } catch (error) {
                 console.error('Error fetching data:', error);
@@ -527,11 +522,35 @@ HTML_TEMPLATE = """
             }
         }
 
+        // サーバーからの即時更新（変化した項目だけが届く）
+        function startStream() {
+            if (!window.EventSource) return;
+
+            eventSource = new EventSource('/api/stream');
+            eventSource.addEventListener('status', (e) => {
+                latestData = JSON.parse(e.data);
+                updateDashboard(latestData);
+            });
+            eventSource.addEventListener('delta', (e) => {
+                if (!latestData) return;
+                Object.assign(latestData, JSON.parse(e.data));
+                updateDashboard(latestData);
+            });
+            // 切断時はブラウザが自動で再接続し、その間は定期取得で補う
+        }
+
+        function streamConnected() {
+            return eventSource && eventSource.readyState === EventSource.OPEN;
+        }
+
         // 初回読み込み
         refreshData();
+        startStream();
 
-        // 自動更新（30秒ごと）
-        autoRefreshInterval = setInterval(refreshData, 30000);
+        // 自動更新（30秒ごと、即時更新が切断されている間のみ）
+        autoRefreshInterval = setInterval(() => {
+            if (!streamConnected()) refreshData();
+        }, 30000);
     </script>
 </body>
 </html>
@@ -542,12 +561,71 @@ def index():
     """ダッシュボードメインページ"""
     return render_template_string(HTML_TEMPLATE)
 
-@app.route('/api/status')
-def get_status():
-    """現在の状態をJSON形式で返す"""
-    today_data = load_today_data()
-    config = load_config()
+POSTURE_LABELS = {
+    'standing': '立位',
+    'sitting': '座位',
+    'lying': '臥位'
+}
+
+class DailyAggregate:
+    """1日分の集計値（追記されたイベントだけを順次反映）"""
+
+    RECENT_EVENTS = 20
+
+    def __init__(self, date):
+        self.date = date
+        self.cursor = None
+        self.count = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.hourly_counts = [0] * 24
+        self.posture_counts = {}
+        self.interval_sum = 0.0
+        self.interval_count = 0
+        self.recent = deque(maxlen=self.RECENT_EVENTS)
+        self._last_time = None
+
+    def add(self, event):
+        """イベント1件を集計に反映（時刻の解析は1回だけ）"""
+        self.count += 1
+        self.recent.append(event)
+        posture = event.get('posture', 'unknown')
+        self.posture_counts[posture] = self.posture_counts.get(posture, 0) + 1
+        timestamp = event.get('timestamp')
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+
+        try:
+            event_time = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        except:
+            self._last_time = None
+            return
+
+        self.hourly_counts[event_time.hour] += 1
+        if self._last_time is not None:
+            self.interval_sum += (event_time - self._last_time).total_seconds() / 60
+            self.interval_count += 1
+        self._last_time = event_time
+
+    def update(self):
+        """前回の読み込み位置以降のイベントを反映"""
+        events, cursor, reset = store.read_events_since(self.date, self.cursor)
+        if reset:
+            self.__init__(self.date)
+        for event in events:
+            self.add(event)
+        self.cursor = cursor
+
+    @classmethod
+    def from_events(cls, date, events):
+        aggregate = cls(date)
+        for event in events:
+            aggregate.add(event)
+        return aggregate
 
+def build_status(summary, aggregate):
+    """サマリーと集計値から状態を作成（現在時刻に依存する項目は除く）"""
     # デフォルト値
     status = {
         "current_status": "データなし",
@@ -563,123 +641,318 @@ def get_status():
         "avg_interval": "-",
         "recent_events": [],
         "hourly_activity": [],
-        "alerts": []
+        "alerts": [],
+        "monitor_state": None
     }
 
-    if today_data:
-        summary = today_data.get('summary', {})
-        events = today_data.get('events', [])
-
-        # 基本統計
-        status['total_detections'] = summary.get('total_detections', 0)
-        status['first_activity'] = summary.get('first_activity')
-        status['last_activity'] = summary.get('last_activity')
-        status['lying_events'] = summary.get('lying_events', 0)
-        status['alert_count'] = len(summary.get('alerts', []))
-
-        # 最終活動からの経過時間
-        if status['last_activity']:
-            try:
-                last_time = datetime.strptime(status['last_activity'], "%Y-%m-%d %H:%M:%S")
-                now = datetime.now()
-                diff = now - last_time
-                minutes = int(diff.total_seconds() / 60)
-
-                if minutes < 60:
-                    status['last_activity_label'] = f"{minutes}分前"
-                else:
-                    hours = minutes // 60
-                    status['last_activity_label'] = f"{hours}時間前"
-
-                status['status_color'] = get_status_color(minutes)
+    if summary is None and aggregate.count == 0:
+        return status
+    summary = summary or {}
+
+    # 基本統計（サマリーの保存前に追記されたイベントも反映）
+    status['total_detections'] = max(summary.get('total_detections', 0), aggregate.count)
+    status['first_activity'] = summary.get('first_activity') or aggregate.first_timestamp
+    status['last_activity'] = summary.get('last_activity')
+    if aggregate.count > summary.get('total_detections', 0):
+        status['last_activity'] = aggregate.last_timestamp
+    status['lying_events'] = summary.get('lying_events', 0)
+    status['alert_count'] = len(summary.get('alerts', []))
+    status['monitor_state'] = summary.get('monitor_state')
+
+    # 活動時間計算
+    if status['first_activity'] and status['last_activity']:
+        try:
+            first = datetime.strptime(status['first_activity'], "%Y-%m-%d %H:%M:%S")
+            last = datetime.strptime(status['last_activity'], "%Y-%m-%d %H:%M:%S")
+            diff = last - first
+            status['active_hours'] = round(diff.total_seconds() / 3600, 1)
+        except:
+            pass
+
+    # 平均検出間隔
+    if aggregate.interval_count:
+        avg = aggregate.interval_sum / aggregate.interval_count
+        status['avg_interval'] = f"{int(avg)}分"
+
+    # 最近のイベント（最新20件）
+    for event in reversed(aggregate.recent):
+        posture = event.get('posture', 'unknown')
+        status['recent_events'].append({
+            'timestamp': event.get('timestamp', ''),
+            'description': f"カメラ角度: {event.get('camera_angle', 0)}°, 信頼度: {event.get('confidence', 0):.2f}",
+            'posture': posture,
+            'posture_label': POSTURE_LABELS.get(posture, '不明')
+        })
+
+    # 時間別活動グラフ（0-23時）
+    for hour in range(24):
+        status['hourly_activity'].append({
+            'hour': hour,
+            'count': aggregate.hourly_counts[hour]
+        })
+
+    # アラート
+    if status['lying_events'] > 0:
+        status['alerts'].append({
+            'type': 'danger',
+            'icon': '🚨',
+            'title': '転倒検知',
+            'message': f'本日{status["lying_events"]}件の横たわり姿勢を検出しました'
+        })
+
+    return status
+
+def apply_activity_status(status):
+    """最終活動からの経過時間に応じた項目を設定"""
+    if not status['last_activity']:
+        return
 
-                if minutes < 30:
-                    status['current_status'] = "活動中"
-                    status['status_label'] = "正常に活動が検出されています"
-                elif minutes < 120:
-                    status['current_status'] = "様子見"
-                    status['status_label'] = f"最後の検出から{minutes}分経過"
-                else:
-                    status['current_status'] = "要確認"
-                    status['status_label'] = f"最後の検出から{minutes}分経過"
-                    status['alerts'].append({
-                        'type': 'warning',
-                        'icon': '⚠️',
-                        'title': '長時間未検出',
-                        'message': f'最後の活動検出から{minutes}分経過しています'
-                    })
-            except:
-                pass
-
-        # 活動時間計算
-        if status['first_activity'] and status['last_activity']:
-            try:
-                first = datetime.strptime(status['first_activity'], "%Y-%m-%d %H:%M:%S")
-                last = datetime.strptime(status['last_activity'], "%Y-%m-%d %H:%M:%S")
-                diff = last - first
-                status['active_hours'] = round(diff.total_seconds() / 3600, 1)
-            except:
-                pass
-
-        # 平均検出間隔
-        if len(events) > 1:
-            intervals = []
-            for i in range(1, len(events)):
-                try:
-                    t1 = datetime.strptime(events[i-1]['timestamp'], "%Y-%m-%d %H:%M:%S")
-                    t2 = datetime.strptime(events[i]['timestamp'], "%Y-%m-%d %H:%M:%S")
-                    diff = (t2 - t1).total_seconds() / 60
-                    intervals.append(diff)
-                except:
-                    pass
-
-            if intervals:
-                avg = sum(intervals) / len(intervals)
-                status['avg_interval'] = f"{int(avg)}分"
-
-        # 最近のイベント（最新20件）
-        posture_labels = {
-            'standing': '立位',
-            'sitting': '座位',
-            'lying': '臥位'
-        }
-
-        for event in reversed(events[-20:]):
-            posture = event.get('posture', 'unknown')
-            status['recent_events'].append({
-                'timestamp': event.get('timestamp', ''),
-                'description': f"カメラ角度: {event.get('camera_angle', 0)}°, 信頼度: {event.get('confidence', 0):.2f}",
-                'posture': posture,
-                'posture_label': posture_labels.get(posture, '不明')
+    try:
+        last_time = datetime.strptime(status['last_activity'], "%Y-%m-%d %H:%M:%S")
+        now = datetime.now()
+        diff = now - last_time
+        minutes = int(diff.total_seconds() / 60)
+
+        if minutes < 60:
+            status['last_activity_label'] = f"{minutes}分前"
+        else:
+            hours = minutes // 60
+            status['last_activity_label'] = f"{hours}時間前"
+
+        status['status_color'] = get_status_color(minutes)
+
+        if minutes < 30:
+            status['current_status'] = "活動中"
+            status['status_label'] = "正常に活動が検出されています"
+        elif minutes < 120:
+            status['current_status'] = "様子見"
+            status['status_label'] = f"最後の検出から{minutes}分経過"
+        else:
+            status['current_status'] = "要確認"
+            status['status_label'] = f"最後の検出から{minutes}分経過"
+            status['alerts'].insert(0, {
+                'type': 'warning',
+                'icon': '⚠️',
+                'title': '長時間未検出',
+                'message': f'最後の活動検出から{minutes}分経過しています'
             })
+    except:
+        pass
 
-        # 時間別活動グラフ
-        hourly_counts = {}
-        for event in events:
-            try:
-                hour = datetime.strptime(event['timestamp'], "%Y-%m-%d %H:%M:%S").hour
-                hourly_counts[hour] = hourly_counts.get(hour, 0) + 1
-            except:
-                pass
-
-        # 0-23時のデータを生成
-        for hour in range(24):
-            status['hourly_activity'].append({
-                'hour': hour,
-                'count': hourly_counts.get(hour, 0)
-            })
+# 集計結果のキャッシュ（データファイルの更新時刻・サイズが変わるまで再利用）
+status_cache = {'key': None, 'status': None, 'hits': 0, 'misses': 0}
+status_cache_lock = threading.Lock()
+aggregate = None
 
-        # アラート
-        if status['lying_events'] > 0:
-            status['alerts'].append({
-                'type': 'danger',
-                'icon': '🚨',
-                'title': '転倒検知',
-                'message': f'本日{status["lying_events"]}件の横たわり姿勢を検出しました'
-            })
+def load_today_status(today):
+    """本日の状態を集計（前回以降に追記されたイベントだけを処理）"""
+    global aggregate
+
+    try:
+        if aggregate is None or aggregate.date != today:
+            aggregate = DailyAggregate(today)
+        aggregate.update()
+        return build_status(store.load_summary(today), aggregate)
+    except json.JSONDecodeError:
+        # 旧形式ファイルが破損している場合は従来の読み込み（前日へのフォールバック）
+        aggregate = None
+        today_data = load_today_data()
+        if not today_data:
+            return build_status(None, DailyAggregate(today))
+        return build_status(
+            today_data.get('summary'),
+            DailyAggregate.from_events(today_data['date'], today_data.get('events', []))
+        )
+
+def get_cached_status():
+    """集計済みの状態を取得（監視側が書き込んだ時だけ再集計）"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    key = (today, store.signature(today))
+
+    with status_cache_lock:
+        if status_cache['key'] == key:
+            status_cache['hits'] += 1
+            return copy.deepcopy(status_cache['status'])
 
+        status = load_today_status(today)
+        status_cache['key'] = key
+        status_cache['status'] = status
+        status_cache['misses'] += 1
+        return copy.deepcopy(status)
+
+@app.route('/api/status')
+def get_status():
+    """現在の状態をJSON形式で返す"""
+    status = get_cached_status()
+    apply_activity_status(status)
     return jsonify(status)
 
+# 日次集計のキャッシュ（集計ファイル / DBが更新されるまで再利用）
+rollup_cache = {'key': None, 'rollups': {}}
+rollup_cache_lock = threading.Lock()
+HISTORY_MAX_DAYS = 366
+
+def load_rollups():
+    """日付 → 日次集計"""
+    key = store.rollup_signature()
+    with rollup_cache_lock:
+        if rollup_cache['key'] != key:
+            rollup_cache['rollups'] = {rollup['date']: rollup for rollup in store.load_rollups()}
+            rollup_cache['key'] = key
+        return rollup_cache['rollups']
+
+def today_rollup(today):
+    """本日分の集計（監視側の日次集計は日付の切り替わりで書かれるため、集計中の値から作成）"""
+    get_cached_status()
+    with status_cache_lock:
+        if aggregate is None or aggregate.date != today:
+            return None
+        try:
+            summary = store.load_summary(today) or {}
+        except json.JSONDecodeError:
+            summary = {}
+        if not summary and aggregate.count == 0:
+            return None
+        return {
+            'date': today,
+            'total_detections': max(summary.get('total_detections', 0), aggregate.count),
+            'lying_events': summary.get('lying_events', 0),
+            'alert_count': len(summary.get('alerts', [])),
+            'first_activity': summary.get('first_activity') or aggregate.first_timestamp,
+            'last_activity': aggregate.last_timestamp or summary.get('last_activity'),
+            'hourly': list(aggregate.hourly_counts),
+            'postures': dict(aggregate.posture_counts)
+        }
+
+@app.route('/api/history')
+def get_history():
+    """期間の活動履歴（?from=YYYY-MM-DD&to=YYYY-MM-DD、既定は直近30日）"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    try:
+        end = datetime.strptime(request.args.get('to') or today, "%Y-%m-%d")
+        start = (
+            datetime.strptime(request.args['from'], "%Y-%m-%d")
+            if request.args.get('from') else end - timedelta(days=29)
+        )
+    except ValueError:
+        return jsonify({"error": "日付は YYYY-MM-DD 形式で指定してください"}), 400
+    if start > end:
+        return jsonify({"error": "from は to 以前の日付を指定してください"}), 400
+    if (end - start).days >= HISTORY_MAX_DAYS:
+        return jsonify({"error": f"期間は最大{HISTORY_MAX_DAYS}日です"}), 400
+
+    rollups = load_rollups()
+    days = []
+    totals = {'total_detections': 0, 'lying_events': 0, 'alert_count': 0, 'active_days': 0}
+    hourly = [0] * 24
+
+    date = start
+    while date <= end:
+        key = date.strftime("%Y-%m-%d")
+        rollup = today_rollup(today) if key == today else rollups.get(key)
+        if rollup is None:
+            rollup = {
+                'date': key, 'total_detections': 0, 'lying_events': 0, 'alert_count': 0,
+                'first_activity': None, 'last_activity': None, 'hourly': [0] * 24, 'postures': {}
+            }
+        days.append(rollup)
+
+        for name in ('total_detections', 'lying_events', 'alert_count'):
+            totals[name] += rollup[name]
+        if rollup['total_detections']:
+            totals['active_days'] += 1
+        for hour, count in enumerate(rollup['hourly']):
+            hourly[hour] += count
+        date += timedelta(days=1)
+
+    return jsonify({
+        'from': start.strftime("%Y-%m-%d"),
+        'to': end.strftime("%Y-%m-%d"),
+        'days': days,
+        'hourly': [{'hour': hour, 'count': count} for hour, count in enumerate(hourly)],
+        'totals': totals
+    })
+
+# 即時更新（Server-Sent Events）
+STREAM_CHECK_INTERVAL = 1.0
+STREAM_HEARTBEAT_INTERVAL = 15.0
+stream_clients = 0
+stream_clients_lock = threading.Lock()
+
+def sse_message(event, data):
+    """SSE形式のメッセージ"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def status_delta(previous, current):
+    """前回送信時から変化した項目だけを抜き出す"""
+    return {key: value for key, value in current.items() if previous.get(key) != value}
+
+@app.route('/api/stream')
+def stream_status():
+    """状態の変化をプッシュ（初回は全体、以降は変化した項目のみ）"""
+    def generate():
+        global stream_clients
+        with stream_clients_lock:
+            stream_clients += 1
+        try:
+            previous = None
+            last_sent = time.monotonic()
+            yield "retry: 5000\n\n"
+            while True:
+                status = get_cached_status()
+                apply_activity_status(status)
+
+                if previous is None:
+                    yield sse_message('status', status)
+                    last_sent = time.monotonic()
+                else:
+                    delta = status_delta(previous, status)
+                    if delta:
+                        yield sse_message('delta', delta)
+                        last_sent = time.monotonic()
+                    elif time.monotonic() - last_sent > STREAM_HEARTBEAT_INTERVAL:
+                        # 接続維持
+                        yield ": ping\n\n"
+                        last_sent = time.monotonic()
+                previous = status
+                time.sleep(STREAM_CHECK_INTERVAL)
+        finally:
+            with stream_clients_lock:
+                stream_clients -= 1
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/alerts')
+def get_alerts():
+    """アラート履歴（?limit=件数&since=YYYY-MM-DD[ HH:MM:SS]、新しい順）"""
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "limit は整数で指定してください"}), 400
+    since = request.args.get('since') or None
+
+    try:
+        alerts = store.recent_alerts(limit=limit, since=since)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"alerts": alerts})
+
+@app.route('/api/metrics')
+def get_metrics():
+    """ダッシュボード内部の統計"""
+    with status_cache_lock:
+        return jsonify({
+            'status_cache': {
+                'hits': status_cache['hits'],
+                'misses': status_cache['misses']
+            },
+            'stream_clients': stream_clients
+        })
+
 if __name__ == '__main__':
     print("=" * 60)
     print("🤖 見守りハロ - ダッシュボード")
@@ -695,7 +968,7 @@ if __name__ == '__main__':
     except:
         print("  (IPアドレス取得失敗)")
     print()
-    print("ℹ️  ダッシュボードは30秒ごとに自動更新されます")
+    print("ℹ️  ダッシュボードは新しい検出があると即時に更新されます（接続断時は30秒ごと）")
     print("=" * 60)
     print()
 
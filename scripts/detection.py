@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - 人物検出
+検出バックエンド（ultralytics / ONNX Runtime / OpenVINO）と
+検出結果から人物と姿勢を配列演算でまとめて求める後処理
+"""
+
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+# COCOの person クラス
+PERSON_CLASS = 0
+
+# 姿勢判定の縦横比しきい値（高さ / 幅）
+STANDING_RATIO = 1.5
+SITTING_RATIO = 0.8
+
+
+def classify_postures(aspect_ratios):
+    """縦横比の配列から姿勢を一括判定（簡易版）"""
+    return np.select(
+        [aspect_ratios > STANDING_RATIO, aspect_ratios > SITTING_RATIO],
+        ["standing", "sitting"],
+        default="lying"
+    )
+
+
+def persons_from_arrays(xyxy, conf):
+    """人物ボックス配列（N×4）と信頼度（N）から検出結果リストを生成"""
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    conf = np.asarray(conf, dtype=np.float64).reshape(-1)
+
+    widths = xyxy[:, 2] - xyxy[:, 0]
+    heights = xyxy[:, 3] - xyxy[:, 1]
+    aspect_ratios = np.divide(heights, widths, out=np.zeros_like(heights), where=widths > 0)
+    postures = classify_postures(aspect_ratios)
+
+    return [
+        {
+            'bbox': bbox,
+            'confidence': confidence,
+            'posture': posture,
+            'aspect_ratio': aspect_ratio
+        }
+        for bbox, confidence, posture, aspect_ratio in zip(
+            xyxy.tolist(), conf.tolist(), postures.tolist(), aspect_ratios.tolist()
+        )
+    ]
+
+
+def persons_from_boxes(boxes, offset=(0, 0)):
+    """ultralytics の Boxes から人物を抽出（ホスト転送は配列ごとに1回）
+
+    offset には切り出し領域の左上座標を渡し、元画像の座標に戻す。
+    """
+    if len(boxes) == 0:
+        return []
+    data = boxes.data.cpu().numpy()  # x1, y1, x2, y2, conf, cls
+    data = data[data[:, 5] == PERSON_CLASS]
+    xyxy = data[:, :4] + np.tile(np.asarray(offset, dtype=data.dtype), 2)
+    return persons_from_arrays(xyxy, data[:, 4])
+
+
+def padded_roi(bbox, image_shape, padding):
+    """ボックスの周囲に余白を付けた切り出し領域（画像内に収める）"""
+    img_height, img_width = image_shape[:2]
+    x1, y1, x2, y2 = bbox
+    pad_x = (x2 - x1) * padding
+    pad_y = (y2 - y1) * padding
+    return (
+        max(0, int(x1 - pad_x)),
+        max(0, int(y1 - pad_y)),
+        min(img_width, int(np.ceil(x2 + pad_x))),
+        min(img_height, int(np.ceil(y2 + pad_y)))
+    )
+
+
+class UltralyticsDetector:
+    """ultralytics（PyTorch）による人物検出"""
+
+    name = 'ultralytics'
+
+    def __init__(self, model='yolov8n.pt', imgsz=640, conf=0.25, iou=0.7):
+        from ultralytics import YOLO
+
+        self.model = YOLO(model)
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+
+    def _predict(self, source, imgsz):
+        return self.model(
+            source, verbose=False, classes=[PERSON_CLASS],
+            imgsz=imgsz or self.imgsz, conf=self.conf, iou=self.iou
+        )
+
+    def detect(self, image, imgsz=None, offset=(0, 0)):
+        """1枚の画像から人物を検出"""
+        return persons_from_boxes(self._predict(image, imgsz)[0].boxes, offset=offset)
+
+    def detect_batch(self, images, imgsz=None):
+        """複数画像を1回の推論で検出"""
+        if not images:
+            return []
+        return [persons_from_boxes(result.boxes) for result in self._predict(images, imgsz)]
+
+
+class ExportedYoloDetector(ABC):
+    """エクスポート済みYOLOv8モデル（ONNX / OpenVINO IR）の共通処理
+
+    前処理（レターボックス）と後処理（person スコア抽出・NMS・座標復元）を
+    NumPy / OpenCV で行い、ultralytics と同じ形式の検出結果を返す。
+    推論そのもの（_infer）は各ランタイムのサブクラスで実装する。
+    """
+
+    name = 'exported'
+
+    def __init__(self, imgsz=640, conf=0.25, iou=0.7):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        # 入力サイズ固定のモデルは imgsz 指定を無視する
+        self.fixed_size = None
+        self.fixed_batch = None
+
+    @abstractmethod
+    def _infer(self, blob):
+        """(B, 3, H, W) float32 → (B, 4 + クラス数, N)"""
+
+    def _input_size(self, imgsz):
+        if self.fixed_size is not None:
+            return self.fixed_size
+        size = imgsz or self.imgsz
+        return max(32, int(np.ceil(size / 32)) * 32)
+
+    def _letterbox(self, image, size):
+        """アスペクト比を保って正方形にリサイズ（余白は灰色）"""
+        height, width = image.shape[:2]
+        scale = min(size / height, size / width)
+        new_w, new_h = round(width * scale), round(height * scale)
+        pad_x = (size - new_w) // 2
+        pad_y = (size - new_h) // 2
+
+        canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+        canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(
+            image, (new_w, new_h), interpolation=cv2.INTER_LINEAR
+        )
+        return canvas, scale, (pad_x, pad_y)
+
+    def _preprocess(self, images, size):
+        canvases, transforms = [], []
+        for image in images:
+            canvas, scale, pad = self._letterbox(image, size)
+            canvases.append(canvas)
+            transforms.append((scale, pad, image.shape[:2]))
+        # BGR → RGB, HWC → CHW, 0-1 正規化
+        blob = np.stack(canvases)[..., ::-1].transpose(0, 3, 1, 2)
+        blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+        return blob, transforms
+
+    def _postprocess(self, output, transform, offset):
+        """1画像分の出力（4 + クラス数, N）から人物を抽出"""
+        scale, (pad_x, pad_y), (height, width) = transform
+        predictions = output.T
+        scores = predictions[:, 4 + PERSON_CLASS]
+        keep = scores >= self.conf
+        if not np.any(keep):
+            return []
+        cxcywh = predictions[keep, :4]
+        scores = scores[keep]
+
+        xywh = cxcywh.copy()
+        xywh[:, :2] -= cxcywh[:, 2:] / 2
+        indices = cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), self.conf, self.iou)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        if indices.size == 0:
+            return []
+
+        xyxy = np.concatenate([xywh[indices, :2], xywh[indices, :2] + xywh[indices, 2:]], axis=1)
+        xyxy -= (pad_x, pad_y, pad_x, pad_y)
+        xyxy /= scale
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, width)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, height)
+        xyxy += np.tile(np.asarray(offset, dtype=xyxy.dtype), 2)
+        return persons_from_arrays(xyxy, scores[indices])
+
+    def _run(self, images, imgsz):
+        size = self._input_size(imgsz)
+        chunk = self.fixed_batch or len(images)
+        outputs, transforms = [], []
+        for start in range(0, len(images), chunk):
+            blob, chunk_transforms = self._preprocess(images[start:start + chunk], size)
+            count = len(blob)
+            if self.fixed_batch and count < self.fixed_batch:
+                # バッチ固定モデルには足りない分を空の画像で埋めて渡し、その出力は捨てる
+                padding = np.zeros((self.fixed_batch - count, *blob.shape[1:]), dtype=blob.dtype)
+                blob = np.concatenate([blob, padding])
+            outputs.extend(self._infer(blob)[:count])
+            transforms.extend(chunk_transforms)
+        return outputs, transforms
+
+    def detect(self, image, imgsz=None, offset=(0, 0)):
+        """1枚の画像から人物を検出"""
+        outputs, transforms = self._run([image], imgsz)
+        return self._postprocess(outputs[0], transforms[0], offset)
+
+    def detect_batch(self, images, imgsz=None):
+        """複数画像を1回の推論で検出（バッチ固定モデルは分割し、足りない分は埋めて推論）"""
+        if not images:
+            return []
+        outputs, transforms = self._run(images, imgsz)
+        return [
+            self._postprocess(output, transform, (0, 0))
+            for output, transform in zip(outputs, transforms)
+        ]
+
+
+class OnnxDetector(ExportedYoloDetector):
+    """ONNX Runtime（CPU）による人物検出"""
+
+    name = 'onnx'
+
+    def __init__(self, model='yolov8n.onnx', threads=None, imgsz=640, conf=0.25, iou=0.7):
+        super().__init__(imgsz=imgsz, conf=conf, iou=iou)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(str(model), options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+
+        batch, _, height, width = model_input.shape
+        if isinstance(height, int) and isinstance(width, int):
+            self.fixed_size = height
+        if isinstance(batch, int):
+            self.fixed_batch = batch
+
+    def _infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoDetector(ExportedYoloDetector):
+    """OpenVINO Runtime（CPU）による人物検出"""
+
+    name = 'openvino'
+
+    def __init__(self, model='yolov8n_openvino_model/yolov8n.xml', threads=None, imgsz=640, conf=0.25, iou=0.7):
+        super().__init__(imgsz=imgsz, conf=conf, iou=iou)
+        import openvino as ov
+
+        core = ov.Core()
+        ov_model = core.read_model(str(model))
+        input_shape = ov_model.input(0).get_partial_shape()
+        if input_shape.is_static:
+            self.fixed_batch, _, self.fixed_size, _ = [dim.get_length() for dim in input_shape]
+
+        properties = {'PERFORMANCE_HINT': 'LATENCY'}
+        if threads:
+            properties['INFERENCE_NUM_THREADS'] = threads
+        self.compiled = core.compile_model(ov_model, 'CPU', properties)
+        self.output = self.compiled.output(0)
+
+    def _infer(self, blob):
+        return self.compiled([blob])[self.output]
+
+
+def shift_persons(persons, offset):
+    """検出結果の座標を切り出し領域の左上分だけずらす"""
+    if offset == (0, 0):
+        return persons
+    shift = np.tile(np.asarray(offset, dtype=np.float64), 2)
+    return [
+        {**person, 'bbox': (np.asarray(person['bbox']) + shift).tolist()}
+        for person in persons
+    ]
+
+
+class BatchingDetector:
+    """複数カメラで共有する検出器
+
+    各カメラのスレッドからの detect() を1つのキューに集め、ワーカースレッドが
+    max_wait 秒だけ後続の要求を待ってから、入力サイズごとにまとめて
+    detect_batch() で推論する。モデルは1つだけ読み込み、呼び出し側からは
+    通常の検出器と同じように使える。
+    """
+
+    def __init__(self, detector, max_batch=8, max_wait=0.02, workers=1):
+        self.detector = detector
+        self.name = f"batching({detector.name})"
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        # 統計（ワーカースレッドが更新するため起動前に用意する）
+        self.stats_lock = threading.Lock()
+        self.batches = 0
+        self.images = 0
+
+        self._queue = queue.Queue()
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._run, name=f"inference-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, image, imgsz=None, offset=(0, 0)):
+        """推論を依頼（結果は Future）"""
+        if not self._running:
+            raise RuntimeError("検出器は停止しています")
+        future = Future()
+        self._queue.put((image, imgsz, tuple(offset), future))
+        return future
+
+    def detect(self, image, imgsz=None, offset=(0, 0)):
+        """1枚の画像から人物を検出（他カメラの要求とまとめて推論）"""
+        return self.submit(image, imgsz, offset).result()
+
+    def detect_batch(self, images, imgsz=None):
+        """複数画像を検出（他カメラの要求ともまとめて推論）"""
+        futures = [self.submit(image, imgsz) for image in images]
+        return [future.result() for future in futures]
+
+    def _collect(self):
+        """最初の要求から max_wait 秒以内に届いた要求をまとめて取り出す
+
+        停止要求（None）は1つ取り出した時点で止め、他のワーカーの分は残す。
+        """
+        requests = [self._queue.get()]
+        if requests[0] is None:
+            return requests
+        deadline = time.monotonic() + self.max_wait
+        while len(requests) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            requests.append(request)
+            if request is None:  # 停止要求
+                break
+        return requests
+
+    def _run(self):
+        stop = False
+        while not stop:
+            requests = self._collect()
+            stop = requests[-1] is None
+            requests = [request for request in requests if request is not None]
+
+            groups = {}
+            for request in requests:
+                groups.setdefault(request[1], []).append(request)
+
+            for imgsz, group in groups.items():
+                try:
+                    results = self.detector.detect_batch([image for image, _, _, _ in group], imgsz=imgsz)
+                except Exception as e:
+                    for _, _, _, future in group:
+                        future.set_exception(e)
+                    continue
+                for (_, _, offset, future), persons in zip(group, results):
+                    future.set_result(shift_persons(persons, offset))
+                with self.stats_lock:
+                    self.batches += 1
+                    self.images += len(group)
+
+    def close(self):
+        """ワーカースレッドを停止（停止前に依頼された推論は済ませる）"""
+        self._running = False
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        # 停止と同時に依頼されて取り残された要求
+        while not any(thread.is_alive() for thread in self._threads):
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request[3].set_exception(RuntimeError("検出器は停止しています"))
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'batches': self.batches,
+                'images': self.images,
+                'mean_batch': self.images / self.batches if self.batches else 0.0
+            }
+
+
+class WarmupDetector:
+    """検出器をバックグラウンドで読み込み・ウォームアップする
+
+    生成してすぐに戻り、モデルの読み込みとダミー画像での初回推論は
+    別スレッドで行う。準備が終わるまで detect() / detect_batch() は待つ。
+    """
+
+    def __init__(self, factory, warmup_shape=(640, 640, 3), on_ready=None):
+        self.name = 'warmup'
+        self.detector = None
+        self.load_time = None
+        self.warmup_time = None
+        self._factory = factory
+        self._warmup_shape = warmup_shape
+        self._on_ready = on_ready
+        self._error = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._load, name="detector-warmup", daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        try:
+            start = time.perf_counter()
+            self.detector = self._factory()
+            self.name = self.detector.name
+            self.load_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            self.detector.detect(np.zeros(self._warmup_shape, dtype=np.uint8))
+            self.warmup_time = time.perf_counter() - start
+        except Exception as e:
+            self._error = e
+        finally:
+            self._ready.set()
+        if self._on_ready is not None:
+            self._on_ready(self)
+
+    def wait(self, timeout=None):
+        """準備が終わった検出器を返す"""
+        if not self._ready.wait(timeout):
+            raise TimeoutError("検出モデルの読み込みが終わりません")
+        if self._error is not None:
+            raise self._error
+        return self.detector
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def detect(self, image, imgsz=None, offset=(0, 0)):
+        return self.wait().detect(image, imgsz=imgsz, offset=offset)
+
+    def detect_batch(self, images, imgsz=None):
+        return self.wait().detect_batch(images, imgsz=imgsz)
+
+
+DETECTOR_BACKENDS = {
+    'ultralytics': UltralyticsDetector,
+    'onnx': OnnxDetector,
+    'openvino': OpenVinoDetector
+}
+
+
+def create_detector(detector_config):
+    """設定に応じた検出バックエンドを生成"""
+    backend = detector_config.get('backend', 'ultralytics')
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"未対応の検出バックエンド: {backend}")
+
+    options = {
+        'imgsz': detector_config.get('imgsz', 640),
+        'conf': detector_config.get('conf', 0.25),
+        'iou': detector_config.get('iou', 0.7)
+    }
+    if detector_config.get('model'):
+        options['model'] = detector_config['model']
+    if backend != 'ultralytics':
+        options['threads'] = detector_config.get('threads')
+    return DETECTOR_BACKENDS[backend](**options)
@@ -0,0 +1,667 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - イベントストア
+検出イベント・サマリー・アラートの保存と読み込み
+（追記型JSONLファイル / SQLite）
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from pathlib import Path
+
+
+def parse_alert_line(line):
+    """アラートログの1行を解析（"時刻 - 種別: JSON"）"""
+    try:
+        timestamp, rest = line.rstrip("\n").split(" - ", 1)
+        alert_type, payload = rest.split(": ", 1)
+        return {'timestamp': timestamp, 'type': alert_type, 'data': json.loads(payload)}
+    except (ValueError, json.JSONDecodeError):
+        return None
+
+
+def file_signature(*paths):
+    """ファイルの更新時刻とサイズの組（変更検知用）"""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def retention_cutoff(retention_days):
+    """保持期間より古いデータの境界日（YYYY-MM-DD）"""
+    return (datetime.now() - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+
+
+def reverse_line_spans(path, end=None, block_size=8192):
+    """ファイル末尾（または end の位置）から (行の先頭位置, 行のバイト列) を逆順に返す
+
+    ブロック単位で後ろからシークして読むため、必要な行数分しか読み込まない。
+    空行は返さない。
+    """
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END) if end is None else end
+        remainder = b""
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            data = f.read(size) + remainder
+            lines = data.split(b"\n")
+            remainder = lines.pop(0)
+            line_end = position + len(data)
+            for line in reversed(lines):
+                line_start = line_end - len(line)
+                if line:
+                    yield line_start, line
+                line_end = line_start - 1  # 改行の分
+        if remainder:
+            yield 0, remainder
+
+
+def reverse_lines(path, end=None, block_size=8192):
+    """ファイル末尾（または end の位置）から1行ずつ逆順に返す"""
+    for _, line in reverse_line_spans(path, end=end, block_size=block_size):
+        yield line.decode('utf-8', errors='replace')
+
+
+def complete_lines_end(path, size):
+    """size までのうち最後の改行の直後の位置（書き込み途中の最終行を除いた末尾）"""
+    if size == 0:
+        return 0
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return size
+    for start, _ in reverse_line_spans(path, end=size):
+        return start
+    return 0
+
+
+class AlertLogReader:
+    """月別アラートログの末尾読み込み
+
+    ファイルごとに末尾の行と読み込み済みの位置をキャッシュし、
+    以降のリクエストでは追記された分だけを読む。
+    """
+
+    CACHE_LINES = 100
+
+    def __init__(self, log_dir):
+        self.log_dir = Path(log_dir)
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def _tail(self, path):
+        """末尾行のキャッシュを更新して返す
+
+        lines: 末尾の行の (先頭位置, 行)（古い順）, start: 最も古いキャッシュ行の
+        先頭位置, offset: 読み込み済みの末尾位置（書き込み途中の行は含まない）
+        """
+        stat = path.stat()
+        entry = self._cache.get(path)
+
+        if entry is None or entry['inode'] != stat.st_ino or stat.st_size < entry['offset']:
+            offset = complete_lines_end(path, stat.st_size)
+            spans = list(islice(reverse_line_spans(path, end=offset), self.CACHE_LINES))
+            entry = {
+                'inode': stat.st_ino,
+                'offset': offset,
+                'start': spans[-1][0] if spans else offset,
+                'lines': deque(
+                    (start, line.decode('utf-8', errors='replace')) for start, line in reversed(spans)
+                )
+            }
+            self._cache[path] = entry
+        elif stat.st_size > entry['offset']:
+            # 追記分だけ読む（書き込み途中の行は次回に回す）
+            with open(path, 'rb') as f:
+                f.seek(entry['offset'])
+                chunk = f.read(stat.st_size - entry['offset'])
+            end = chunk.rfind(b"\n") + 1
+            position = entry['offset']
+            for line in chunk[:end].split(b"\n")[:-1]:
+                if line:
+                    entry['lines'].append((position, line.decode('utf-8', errors='replace')))
+                position += len(line) + 1
+            while len(entry['lines']) > self.CACHE_LINES:
+                entry['lines'].popleft()
+            if entry['lines']:
+                entry['start'] = entry['lines'][0][0]
+            entry['offset'] += end
+
+        return entry
+
+    def alerts(self, limit=10, since=None):
+        """新しい順にアラートを返す（月をまたいで、since 以降・最大 limit 件）"""
+        results = []
+        with self._lock:
+            for path in sorted(self.log_dir.glob("alerts_????-??.log"), reverse=True):
+                if since and path.stem[len("alerts_"):] < since[:7]:
+                    break
+
+                entry = self._tail(path)
+                # キャッシュ行 → 足りなければその手前を末尾側から読む
+                lines = chain(
+                    (line for _, line in reversed(entry['lines'])),
+                    reverse_lines(path, end=entry['start'])
+                )
+                for line in lines:
+                    alert = parse_alert_line(line)
+                    if alert is None:
+                        continue
+                    if since and alert['timestamp'] < since:
+                        return results
+                    results.append(alert)
+                    if len(results) >= limit:
+                        return results
+        return results
+
+
+def empty_summary():
+    """空のサマリー"""
+    return {
+        "first_activity": None,
+        "last_activity": None,
+        "total_detections": 0,
+        "lying_events": 0,
+        "alerts": []
+    }
+
+
+def compute_rollup(data):
+    """1日分のデータから日次集計（ロールアップ）を作成"""
+    summary = data.get('summary') or {}
+    events = data.get('events', [])
+
+    hourly = [0] * 24
+    postures = {}
+    for event in events:
+        timestamp = event.get('timestamp') or ''
+        try:
+            hourly[int(timestamp[11:13])] += 1
+        except (ValueError, IndexError):
+            pass
+        posture = event.get('posture', 'unknown')
+        postures[posture] = postures.get(posture, 0) + 1
+
+    return {
+        'date': data['date'],
+        'total_detections': max(summary.get('total_detections', 0), len(events)),
+        'lying_events': summary.get('lying_events', 0),
+        'alert_count': len(summary.get('alerts', [])),
+        'first_activity': summary.get('first_activity'),
+        'last_activity': summary.get('last_activity'),
+        'hourly': hourly,
+        'postures': postures
+    }
+
+
+class JsonlEventStore:
+    """追記型（JSONL）のイベントストア
+
+    data/YYYY-MM-DD.events.jsonl  1行1イベント。追記のみで書き換えない
+    data/YYYY-MM-DD.summary.json  サマリーのチェックポイント（一時ファイル + 原子的置き換え）
+
+    追記ごとに fsync するため、クラッシュしても失われるのは書き込み途中の
+    最終行だけで、読み込み時に読み飛ばす。サマリーがイベントより古い場合は
+    イベントから件数・最初/最後の活動時刻を補正する。
+    旧形式の data/YYYY-MM-DD.json も読み込める。
+    アラートは月別のテキストログ logs/alerts_YYYY-MM.log に追記する。
+    日次集計は data/rollups.jsonl に1日1行で追記する（同じ日は後の行が優先）。
+    """
+
+    def __init__(self, data_dir, log_dir):
+        self.data_dir = Path(data_dir)
+        self.log_dir = Path(log_dir)
+        self.alert_reader = AlertLogReader(self.log_dir)
+        self._checked = set()
+        self._rollup_lock = threading.Lock()  # 追記と保持期間での書き換えを排他
+
+    def alert_log_path(self, month):
+        return self.log_dir / f"alerts_{month}.log"
+
+    def events_path(self, date):
+        return self.data_dir / f"{date}.events.jsonl"
+
+    def summary_path(self, date):
+        return self.data_dir / f"{date}.summary.json"
+
+    def legacy_path(self, date):
+        return self.data_dir / f"{date}.json"
+
+    def rollups_path(self):
+        return self.data_dir / "rollups.jsonl"
+
+    def append_event(self, date, event):
+        """イベントを1件追記"""
+        self._append_line(self.events_path(date), event)
+
+    def _append_line(self, path, record):
+        """JSONを1行追記して fsync"""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+
+        with open(path, 'ab') as f:
+            # 前回クラッシュで最終行が途中で切れていたら改行で区切る
+            if path not in self._checked:
+                self._checked.add(path)
+                if f.tell() > 0:
+                    with open(path, 'rb') as r:
+                        r.seek(-1, os.SEEK_END)
+                        if r.read(1) != b"\n":
+                            f.write(b"\n")
+            f.write(line.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def save_summary(self, date, summary):
+        """サマリーを保存（原子的な書き込み）"""
+        path = self.summary_path(date)
+        temp_file = path.with_name(path.name + ".tmp")
+
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump({"date": date, "summary": summary}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+        temp_file.replace(path)
+
+    def read_events(self, date):
+        """イベントを読み込み（途中で切れた行は読み飛ばす）"""
+        path = self.events_path(date)
+        if not path.exists():
+            return []
+
+        events = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return events
+
+    def read_events_since(self, date, cursor=None):
+        """cursor 以降に追記されたイベントを読み込み
+
+        cursor はイベントファイルの読み込み済みバイト位置（None で先頭から）。
+        書き込み途中の最終行は次回に回す。ファイルが切り詰められていた場合は
+        先頭から読み直し、3番目の戻り値 reset を True にする。
+        戻り値: (イベントのリスト, 新しい cursor, reset)
+        """
+        path = self.events_path(date)
+        size = path.stat().st_size if path.exists() else 0
+        if cursor is not None and size < cursor:
+            events, cursor, _ = self.read_events_since(date, None)
+            return events, cursor, True
+
+        events = []
+        if cursor is None:
+            cursor = 0
+            # 移行日の旧形式イベントを先頭に含める
+            try:
+                legacy = self.load_legacy(date)
+                if legacy:
+                    events = legacy.get('events', [])
+            except json.JSONDecodeError:
+                if not path.exists():
+                    raise
+
+        if size > cursor:
+            with open(path, 'rb') as f:
+                f.seek(cursor)
+                chunk = f.read(size - cursor)
+            end = chunk.rfind(b"\n") + 1
+            for line in chunk[:end].splitlines():
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+            cursor += end
+
+        return events, cursor, False
+
+    def load_summary(self, date):
+        """サマリーを読み込み（チェックポイントがなければ旧形式から）"""
+        summary = self.read_summary(date)
+        if summary is None:
+            legacy = self.load_legacy(date)
+            if legacy:
+                summary = legacy.get('summary')
+        return summary
+
+    def read_summary(self, date):
+        """サマリーのチェックポイントを読み込み"""
+        path = self.summary_path(date)
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('summary')
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ サマリー読み込みエラー: {e}")
+            return None
+
+    def load_legacy(self, date):
+        """旧形式（1日1つのJSON）のデータを読み込み"""
+        legacy = self.legacy_path(date)
+        if not legacy.exists():
+            return None
+        with open(legacy, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return json.loads(content) if content.strip() else None
+
+    def load_day(self, date):
+        """1日分のデータを読み込み（データがなければ None）
+
+        旧形式ファイルしかなく、それが破損している場合は
+        json.JSONDecodeError を送出する。
+        """
+        if not self.events_path(date).exists() and not self.summary_path(date).exists():
+            return self.load_legacy(date)
+
+        # 移行日の旧形式イベントを先頭に含める
+        events = []
+        try:
+            legacy = self.load_legacy(date)
+            if legacy:
+                events = legacy.get('events', [])
+        except json.JSONDecodeError:
+            pass
+        events += self.read_events(date)
+        summary = self.read_summary(date) or empty_summary()
+
+        # チェックポイント後に追記されたイベントを反映
+        if events and summary.get('total_detections', 0) < len(events):
+            summary['total_detections'] = len(events)
+            summary['first_activity'] = summary.get('first_activity') or events[0].get('timestamp')
+            summary['last_activity'] = events[-1].get('timestamp')
+
+        return {"date": date, "events": events, "summary": summary}
+
+    def signature(self, date):
+        """1日分のデータの変更検知用シグネチャ"""
+        return file_signature(self.events_path(date), self.summary_path(date), self.legacy_path(date))
+
+    def dates(self):
+        """データのある日付の一覧（昇順）"""
+        dates = set()
+        for path in self.data_dir.glob("????-??-??*.json*"):
+            dates.add(path.name[:10])
+        return sorted(dates)
+
+    def save_rollup(self, rollup):
+        """日次集計を追記"""
+        with self._rollup_lock:
+            self._append_line(self.rollups_path(), rollup)
+
+    def load_rollups(self, start=None, end=None):
+        """日次集計を日付順に読み込み（start〜end、両端を含む）"""
+        path = self.rollups_path()
+        if not path.exists():
+            return []
+
+        rollups = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    rollup = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                date = rollup.get('date', '')
+                if (start is None or date >= start) and (end is None or date <= end):
+                    rollups[date] = rollup
+        return [rollups[date] for date in sorted(rollups)]
+
+    def rollup_signature(self):
+        return file_signature(self.rollups_path())
+
+    def append_alert(self, timestamp, alert_type, data):
+        """アラートをログに追記"""
+        log_file = self.alert_log_path(timestamp[:7])
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.write(f"{timestamp} - {alert_type}: {json.dumps(data, ensure_ascii=False)}\n")
+
+    def recent_alerts(self, limit=10, since=None):
+        """最新アラート（新しい順、月をまたいで since 以降）"""
+        return self.alert_reader.alerts(limit=limit, since=since)
+
+    def purge(self, retention_days):
+        """保持期間を過ぎた日次データ・日次集計・アラートログを削除"""
+        cutoff = retention_cutoff(retention_days)
+        removed = 0
+        for path in self.data_dir.glob("????-??-??*.json*"):
+            if path.name[:10] < cutoff:
+                path.unlink()
+                removed += 1
+        for path in self.log_dir.glob("alerts_????-??.log"):
+            # 月の途中は残し、月全体が期限切れになってから削除
+            if path.stem[len("alerts_"):] < cutoff[:7]:
+                path.unlink()
+                removed += 1
+        return removed + self._purge_rollups(cutoff)
+
+    def _purge_rollups(self, cutoff):
+        """cutoff より前の日次集計を除いて rollups.jsonl を書き直す（原子的な置き換え）"""
+        path = self.rollups_path()
+        with self._rollup_lock:
+            if not path.exists():
+                return 0
+            rollups = self.load_rollups()
+            kept = [rollup for rollup in rollups if rollup.get('date', '') >= cutoff]
+            if len(kept) == len(rollups):
+                return 0
+
+            temp_file = path.with_name(path.name + ".tmp")
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                for rollup in kept:
+                    f.write(json.dumps(rollup, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            temp_file.replace(path)
+        return len(rollups) - len(kept)
+
+
+class SqliteEventStore:
+    """SQLiteのイベント・アラートストア
+
+    1つのデータベースファイルに全期間のイベント・サマリー・アラートを保存する。
+    時刻・姿勢・アラート種別にインデックスを張り、期間をまたぐ検索や
+    保持期間による削除をインデックス経由で行う。WALモードのため
+    ダッシュボードの読み込みは監視側の書き込みを妨げない。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY,
+            date TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            posture TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_events_date ON events(date);
+        CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_events_posture ON events(posture, timestamp);
+
+        CREATE TABLE IF NOT EXISTS summaries (
+            date TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS rollups (
+            date TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_alerts_type ON alerts(type, timestamp);
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def append_event(self, date, event):
+        """イベントを1件追加"""
+        self._execute(
+            "INSERT INTO events (date, timestamp, posture, data) VALUES (?, ?, ?, ?)",
+            (date, event.get('timestamp', ''), event.get('posture'), json.dumps(event, ensure_ascii=False))
+        )
+
+    def save_summary(self, date, summary):
+        """サマリーを保存"""
+        self._execute(
+            "INSERT OR REPLACE INTO summaries (date, data) VALUES (?, ?)",
+            (date, json.dumps(summary, ensure_ascii=False))
+        )
+
+    def read_events(self, date):
+        rows = self._execute("SELECT data FROM events WHERE date = ? ORDER BY id", (date,))
+        return [json.loads(data) for (data,) in rows]
+
+    def read_summary(self, date):
+        rows = self._execute("SELECT data FROM summaries WHERE date = ?", (date,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def read_events_since(self, date, cursor=None):
+        """cursor（最後に読んだイベントID）以降のイベントを読み込み
+
+        戻り値: (イベントのリスト, 新しい cursor, reset)
+        """
+        rows = self._execute(
+            "SELECT id, data FROM events WHERE date = ? AND id > ? ORDER BY id", (date, cursor or 0)
+        )
+        if not rows:
+            return [], cursor or 0, False
+        return [json.loads(data) for _, data in rows], rows[-1][0], False
+
+    def load_summary(self, date):
+        return self.read_summary(date)
+
+    def load_day(self, date):
+        """1日分のデータを読み込み（データがなければ None）"""
+        events = self.read_events(date)
+        summary = self.read_summary(date)
+        if summary is None and not events:
+            return None
+        return {"date": date, "events": events, "summary": summary or empty_summary()}
+
+    def signature(self, date):
+        """変更検知用シグネチャ（他の接続がコミットするたびに変わる）"""
+        return self._execute("PRAGMA data_version")[0][0]
+
+    def dates(self):
+        """データのある日付の一覧（昇順）"""
+        rows = self._execute("SELECT date FROM summaries UNION SELECT DISTINCT date FROM events ORDER BY 1")
+        return [date for (date,) in rows]
+
+    def import_day(self, data):
+        """1日分のデータを置き換えて取り込み（移行用）"""
+        date = data['date']
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM events WHERE date = ?", (date,))
+            self._conn.executemany(
+                "INSERT INTO events (date, timestamp, posture, data) VALUES (?, ?, ?, ?)",
+                [
+                    (date, event.get('timestamp', ''), event.get('posture'), json.dumps(event, ensure_ascii=False))
+                    for event in data.get('events', [])
+                ]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (date, data) VALUES (?, ?)",
+                (date, json.dumps(data.get('summary') or empty_summary(), ensure_ascii=False))
+            )
+
+    def save_rollup(self, rollup):
+        """日次集計を保存"""
+        self._execute(
+            "INSERT OR REPLACE INTO rollups (date, data) VALUES (?, ?)",
+            (rollup['date'], json.dumps(rollup, ensure_ascii=False))
+        )
+
+    def load_rollups(self, start=None, end=None):
+        """日次集計を日付順に読み込み（start〜end、両端を含む）"""
+        rows = self._execute(
+            "SELECT data FROM rollups WHERE date >= ? AND date <= ? ORDER BY date",
+            (start or "", end or "9999-12-31")
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def rollup_signature(self):
+        return self.signature(None)
+
+    def append_alert(self, timestamp, alert_type, data):
+        """アラートを追加"""
+        self._execute(
+            "INSERT INTO alerts (timestamp, type, data) VALUES (?, ?, ?)",
+            (timestamp, alert_type, json.dumps(data, ensure_ascii=False))
+        )
+
+    def count_alerts(self, timestamp, alert_type, data):
+        """時刻・種別・内容がすべて同じアラートの件数（移行時の重複確認用）"""
+        rows = self._execute(
+            "SELECT COUNT(*) FROM alerts WHERE type = ? AND timestamp = ? AND data = ?",
+            (alert_type, timestamp, json.dumps(data, ensure_ascii=False))
+        )
+        return rows[0][0]
+
+    def recent_alerts(self, limit=10, since=None):
+        """最新アラート（新しい順、since 以降）"""
+        rows = self._execute(
+            "SELECT timestamp, type, data FROM alerts WHERE timestamp >= ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (since or "", limit)
+        )
+        return [{'timestamp': ts, 'type': alert_type, 'data': json.loads(data)} for ts, alert_type, data in rows]
+
+    def purge(self, retention_days):
+        """保持期間を過ぎたイベント・サマリー・日次集計・アラートを削除"""
+        cutoff = retention_cutoff(retention_days)
+        with self._lock, self._conn:
+            removed = self._conn.execute("DELETE FROM events WHERE date < ?", (cutoff,)).rowcount
+            removed += self._conn.execute("DELETE FROM summaries WHERE date < ?", (cutoff,)).rowcount
+            removed += self._conn.execute("DELETE FROM rollups WHERE date < ?", (cutoff,)).rowcount
+            removed += self._conn.execute("DELETE FROM alerts WHERE timestamp < ?", (cutoff,)).rowcount
+        return removed
+
+
+def create_store(config, data_dir, log_dir):
+    """設定に応じたイベントストアを生成"""
+    storage_config = (config or {}).get('storage', {})
+    if storage_config.get('backend', 'jsonl') == 'sqlite':
+        db_path = storage_config.get('path') or Path(data_dir) / "mimamori.db"
+        return SqliteEventStore(db_path)
+    return JsonlEventStore(data_dir, log_dir)
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - 推論サーバー
+人物検出を別プロセスで実行し、フレームは共有メモリで受け渡す
+"""
+
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from detection import shift_persons
+
+
+class InferenceError(RuntimeError):
+    """推論プロセスでの検出失敗"""
+
+
+def attach_shared_memory(name):
+    """既存の共有メモリに接続（解放は生成元のプロセスが行う）
+
+    spawn で起動したプロセスは親と同じ resource_tracker を使うため、
+    Python 3.12 以前で接続時に登録されても二重登録にはならない。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrames:
+    """推論プロセス側の共有メモリスロット
+
+    SharedMemory.close() はその上の ndarray が残っていても mmap を閉じてしまい、
+    残った ndarray に触れるとプロセスが落ちる。そのためフレームの ndarray は
+    weakref で追跡し、参照が残っている共有メモリは閉じずに後回しにする
+    （切り出した ndarray も元の ndarray を base として参照し続ける）。
+    """
+
+    def __init__(self, names):
+        self.slots = [attach_shared_memory(name) for name in names]
+        self._views = {}  # 共有メモリ名 → その上に作った ndarray の weakref
+        self._stale = []  # 参照が残っていて閉じられなかった共有メモリ
+
+    def _in_use(self, shm):
+        views = [ref for ref in self._views.get(shm.name, []) if ref() is not None]
+        if views:
+            self._views[shm.name] = views
+        else:
+            self._views.pop(shm.name, None)
+        return bool(views)
+
+    def _close(self, shm):
+        if self._in_use(shm):
+            self._stale.append(shm)
+        else:
+            shm.close()
+
+    def frame(self, slot, name, shape):
+        """スロット上のフレーム（大きく作り直されていれば接続し直す）"""
+        if self.slots[slot].name != name:
+            self._close(self.slots[slot])
+            self.slots[slot] = attach_shared_memory(name)
+        image = np.ndarray(shape, dtype=np.uint8, buffer=self.slots[slot].buf)
+        self._views.setdefault(name, []).append(weakref.ref(image))
+        return image
+
+    def release_stale(self):
+        """参照がなくなった古い共有メモリを閉じる"""
+        stale, self._stale = self._stale, []
+        for shm in stale:
+            self._close(shm)
+
+    def close(self):
+        """参照の残っていない共有メモリを閉じる（残っていれば切断はプロセス終了時）"""
+        for shm in self.slots + self._stale:
+            if not self._in_use(shm):
+                shm.close()
+
+
+def worker_main(detector_config, slot_names, requests, results, max_batch):
+    """推論プロセス本体
+
+    requests から (要求ID, スロット番号, 共有メモリ名, 形状, imgsz) を受け取り、
+    共有メモリ上のフレームをまとめて推論して (要求ID, 検出結果, エラー) を
+    results に返す。スロットが大きく作り直されていれば新しい共有メモリに接続し直す。
+    検出器を用意できなければ ('failed', None, エラー) を返して終了する。
+    """
+    from detection import create_detector
+
+    frames = SharedFrames(slot_names)
+    try:
+        detector = create_detector(detector_config)
+        # 初回推論の遅延をなくすためダミー画像で1回推論しておく
+        detector.detect(np.zeros((640, 640, 3), dtype=np.uint8))
+    except Exception as e:
+        results.put(('failed', None, f"{type(e).__name__}: {e}"))
+        frames.close()
+        return
+    results.put(('ready', None, None))
+
+    while True:
+        batch = [requests.get()]
+        while len(batch) < max_batch and batch[-1] is not None:
+            try:
+                batch.append(requests.get_nowait())
+            except queue.Empty:
+                break
+        stop = batch[-1] is None
+        batch = [request for request in batch if request is not None]
+        frames.release_stale()
+
+        groups = {}
+        for request in batch:
+            groups.setdefault(request[4], []).append(request)
+        for imgsz, group in groups.items():
+            images = [frames.frame(slot, name, shape) for _, slot, name, shape, _ in group]
+            try:
+                outputs = detector.detect_batch(images, imgsz=imgsz)
+            except Exception as e:
+                for request_id, _, _, _, _ in group:
+                    results.put((request_id, None, f"{type(e).__name__}: {e}"))
+                continue
+            finally:
+                # 次の要求でスロットを接続し直せるよう共有メモリへの参照を外す
+                images = None
+            for (request_id, _, _, _, _), persons in zip(group, outputs):
+                results.put((request_id, persons, None))
+
+        if stop:
+            break
+
+    frames.close()
+
+
+class InferenceWorker:
+    """推論プロセス1つ分（要求・結果キューと処理中の要求）"""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.requests = None
+        self.results = None
+        self.reader = None
+        self.ready = threading.Event()
+        self.started_at = 0.0
+        self.in_flight = {}  # 要求ID → 要求
+        self.restarts = 0
+        self.start_failures = 0  # 準備完了前に続けて失敗した回数
+        self.error = None  # 直近の起動失敗の内容
+        self.failed = False  # 起動失敗が続いて再起動をやめた
+
+
+class InferenceServer:
+    """共有メモリ経由の推論プロセスプール
+
+    フレームは事前に確保した共有メモリのスロットへコピーし、キューには
+    スロット番号と形状だけを送る（フレームは pickle しない）。スロットは
+    max_frame の大きさで確保し、それより大きいフレームが来たらそのスロットだけを
+    作り直して広げる（推論プロセスは次の要求で接続し直す）。推論プロセスは
+    届いている要求をまとめて detect_batch() で処理する。監視スレッドが
+    プロセスの終了や timeout 秒を超える応答なしを検知すると、プロセスを
+    再起動して処理中だった要求を再送する（MimamoriHalo は再起動しない）。
+    準備完了前の失敗が max_start_failures 回続いたプロセスは再起動をやめ、
+    wait_ready() は InferenceError を送出する。
+    検出器と同じ detect() / detect_batch() を持つ。
+    """
+
+    name = 'process'
+
+    def __init__(self, detector_config, workers=1, slots=8, max_frame=(1080, 1920),
+                 max_batch=8, timeout=10.0, start_timeout=120.0, max_attempts=2,
+                 max_start_failures=3):
+        self.detector_config = dict(detector_config)
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.max_attempts = max_attempts
+        self.max_start_failures = max_start_failures
+
+        # 共有メモリのスロット（1スロット = BGRフレーム1枚、大きいフレームで拡張）
+        height, width = max_frame
+        self._slots = [
+            shared_memory.SharedMemory(create=True, size=height * width * 3)
+            for _ in range(slots)
+        ]
+        self._free_slots = queue.Queue()
+        for index in range(slots):
+            self._free_slots.put(index)
+
+        # torch 等のスレッドを持つ親を fork しないよう spawn で起動
+        self._context = mp.get_context('spawn')
+        self._lock = threading.Lock()
+
+        # 統計
+        self.requests = 0
+        self.restarts = 0
+        self.slot_grows = 0
+
+        self._ids = itertools.count()
+        self._next_worker = itertools.count()
+        self._running = True
+        self._workers = [InferenceWorker(index) for index in range(workers)]
+        for worker in self._workers:
+            self._start_worker(worker)
+
+        self._watchdog = threading.Thread(target=self._watch, name="inference-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def _start_worker(self, worker):
+        """推論プロセスを起動（再起動時はキューも作り直す）"""
+        worker.requests = self._context.Queue()
+        worker.results = self._context.Queue()
+        worker.ready.clear()
+        worker.started_at = time.monotonic()
+        worker.process = self._context.Process(
+            target=worker_main,
+            args=(
+                self.detector_config, [shm.name for shm in self._slots],
+                worker.requests, worker.results, self.max_batch
+            ),
+            name=f"inference-{worker.index}",
+            daemon=True
+        )
+        worker.process.start()
+        worker.reader = threading.Thread(
+            target=self._read_results, args=(worker, worker.results),
+            name=f"inference-results-{worker.index}", daemon=True
+        )
+        worker.reader.start()
+
+    def _read_results(self, worker, results):
+        """推論プロセスからの結果を対応する要求に返す"""
+        while self._running:
+            try:
+                request_id, persons, error = results.get(timeout=0.5)
+            except queue.Empty:
+                if worker.results is not results:
+                    return  # 再起動で古いキューになった
+                continue
+            except (EOFError, OSError):
+                return
+
+            if request_id == 'ready':
+                worker.start_failures = 0
+                worker.error = None
+                worker.ready.set()
+                continue
+            if request_id == 'failed':
+                worker.error = error
+                return  # 推論プロセスは終了する
+            with self._lock:
+                request = worker.in_flight.pop(request_id, None)
+            if request is None:
+                continue
+            if error is not None:
+                self._finish(request, error=InferenceError(error))
+            else:
+                self._finish(request, persons=persons)
+
+    def _finish(self, request, persons=None, error=None):
+        """要求を完了してスロットを返却"""
+        self._free_slots.put(request['slot'])
+        if error is not None:
+            request['future'].set_exception(error)
+            return
+        request['future'].set_result(shift_persons(persons, request['offset']))
+
+    def _send(self, worker, request):
+        request['sent_at'] = time.monotonic()
+        request['attempts'] += 1
+        with self._lock:
+            worker.in_flight[request['id']] = request
+        worker.requests.put((
+            request['id'], request['slot'], request['name'], request['shape'], request['imgsz']
+        ))
+
+    def _grow_slot(self, slot, size):
+        """スロットの共有メモリを size バイト以上で作り直す（空きスロットのみ）"""
+        old = self._slots[slot]
+        self._slots[slot] = shared_memory.SharedMemory(create=True, size=size)
+        old.close()
+        old.unlink()
+        with self._lock:
+            self.slot_grows += 1
+        print(f"📐 推論用の共有メモリを拡張: スロット{slot} {old.size}→{size}バイト")
+
+    def submit(self, image, imgsz=None, offset=(0, 0)):
+        """推論を依頼（結果は Future）"""
+        if not self._running:
+            raise InferenceError("推論サーバーは停止しています")
+        if image.dtype != np.uint8:
+            raise ValueError(f"共有メモリで受け渡せないフレームです: {image.shape} {image.dtype}")
+
+        slot = self._free_slots.get()
+        if image.nbytes > self._slots[slot].size:
+            self._grow_slot(slot, image.nbytes)
+        shm = self._slots[slot]
+        np.copyto(np.ndarray(image.shape, dtype=np.uint8, buffer=shm.buf), image)
+        request = {
+            'id': next(self._ids),
+            'slot': slot,
+            'name': shm.name,
+            'shape': image.shape,
+            'imgsz': imgsz,
+            'offset': tuple(offset),
+            'future': Future(),
+            'attempts': 0
+        }
+        workers = [worker for worker in self._workers if not worker.failed]
+        if not workers:
+            self._free_slots.put(slot)
+            raise InferenceError("起動できた推論プロセスがありません")
+        worker = workers[next(self._next_worker) % len(workers)]
+        self._send(worker, request)
+        with self._lock:
+            self.requests += 1
+        return request['future']
+
+    def detect(self, image, imgsz=None, offset=(0, 0)):
+        """1枚の画像から人物を検出"""
+        return self.submit(image, imgsz, offset).result()
+
+    def detect_batch(self, images, imgsz=None):
+        """複数画像を検出（推論プロセスでまとめて処理）"""
+        futures = [self.submit(image, imgsz) for image in images]
+        return [future.result() for future in futures]
+
+    def _restart(self, worker, reason):
+        """推論プロセスを再起動し、処理中の要求を再送
+
+        準備完了前の失敗が max_start_failures 回続いたら再起動せず、
+        処理中の要求を失敗させる。
+        """
+        process = worker.process
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout=3)
+            if process.is_alive():
+                process.kill()
+                process.join(timeout=3)
+
+        with self._lock:
+            pending = list(worker.in_flight.values())
+            worker.in_flight.clear()
+
+        if not worker.ready.is_set():
+            # 終了前に送られた起動失敗の内容を読み終えるまで少し待つ
+            worker.reader.join(timeout=1.0)
+            worker.start_failures += 1
+            if worker.error is not None:
+                reason = f"{reason}: {worker.error}"
+            if worker.start_failures >= self.max_start_failures:
+                print(f"❌ 推論プロセス{worker.index}を起動できないため再起動をやめます（{reason}）")
+                worker.error = reason
+                worker.failed = True
+                for request in pending:
+                    self._finish(request, error=InferenceError(f"推論プロセスを起動できません（{reason}）"))
+                return
+
+        print(f"♻️ 推論プロセス{worker.index}を再起動します（{reason}）")
+        worker.restarts += 1
+        self.restarts += 1
+        self._start_worker(worker)
+
+        for request in pending:
+            if request['attempts'] >= self.max_attempts:
+                self._finish(request, error=InferenceError(f"推論プロセスが応答しません（{reason}）"))
+            else:
+                self._send(worker, request)
+
+    def _watch(self):
+        """推論プロセスの終了・応答なしを監視"""
+        while self._running:
+            time.sleep(0.5)
+            now = time.monotonic()
+            for worker in self._workers:
+                if not self._running:
+                    return
+                if worker.failed:
+                    continue
+                if not worker.process.is_alive():
+                    self._restart(worker, f"終了コード {worker.process.exitcode}")
+                    continue
+                if not worker.ready.is_set():
+                    if now - worker.started_at > self.start_timeout:
+                        self._restart(worker, "起動タイムアウト")
+                    continue
+                with self._lock:
+                    oldest = min((r['sent_at'] for r in worker.in_flight.values()), default=None)
+                if oldest is not None and now - oldest > self.timeout:
+                    self._restart(worker, f"{self.timeout}秒以上応答なし")
+
+    def wait_ready(self, timeout=None):
+        """全推論プロセスのモデル読み込み完了を待つ（タイムアウトなら False）
+
+        起動失敗が続いて再起動をやめたプロセスがあれば InferenceError を送出する。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self._workers:
+            while not worker.ready.wait(0.1):
+                if worker.failed:
+                    raise InferenceError(f"推論プロセス{worker.index}を起動できません（{worker.error}）")
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+        return True
+
+    def close(self):
+        """推論プロセスを停止して共有メモリを解放"""
+        if not self._running:
+            return
+        self._running = False
+        self._watchdog.join(timeout=5)
+        for worker in self._workers:
+            worker.requests.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join(timeout=3)
+            with self._lock:
+                pending = list(worker.in_flight.values())
+                worker.in_flight.clear()
+            for request in pending:
+                request['future'].set_exception(InferenceError("推論サーバーを停止しました"))
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+
+    def stats(self):
+        return {
+            'workers': len(self._workers),
+            'requests': self.requests,
+            'restarts': self.restarts,
+            'slot_grows': self.slot_grows,
+            'in_flight': sum(len(worker.in_flight) for worker in self._workers)
+        }
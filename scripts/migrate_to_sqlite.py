@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - SQLite移行ツール
+既存の日次データ（data/*.json, *.events.jsonl, rollups.jsonl）とアラートログ（logs/alerts_*.log）を
+SQLiteストアに取り込む。何度実行しても同じ結果になる（日単位で置き換え）。
+"""
+
+import argparse
+import json
+from collections import Counter
+from pathlib import Path
+
+from event_store import JsonlEventStore, SqliteEventStore, parse_alert_line
+
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+LOG_DIR = BASE_DIR / "logs"
+
+
+def migrate(data_dir, log_dir, db_path):
+    source = JsonlEventStore(data_dir, log_dir)
+    target = SqliteEventStore(db_path)
+
+    days = 0
+    events = 0
+    for date in source.dates():
+        try:
+            data = source.load_day(date)
+        except json.JSONDecodeError as e:
+            print(f"⚠️ {date}: JSONが破損しているためスキップ ({e})")
+            continue
+        if not data:
+            continue
+        target.import_day(data)
+        days += 1
+        events += len(data.get('events', []))
+        print(f"📅 {date}: {len(data.get('events', []))}件")
+
+    rollups = source.load_rollups()
+    for rollup in rollups:
+        target.save_rollup(rollup)
+
+    # 同じ時刻・種別・内容の行がログに n 件あれば、ストアにも n 件になるよう不足分だけ追加
+    # （同じ秒の別内容のアラートは別物として取り込み、再実行しても増えない）
+    alerts = 0
+    seen = Counter()
+    for log_file in sorted(Path(log_dir).glob("alerts_????-??.log")):
+        with open(log_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                alert = parse_alert_line(line)
+                if alert is None:
+                    continue
+                key = (alert['timestamp'], alert['type'], json.dumps(alert['data'], ensure_ascii=False))
+                seen[key] += 1
+                if target.count_alerts(alert['timestamp'], alert['type'], alert['data']) >= seen[key]:
+                    continue
+                target.append_alert(alert['timestamp'], alert['type'], alert['data'])
+                alerts += 1
+
+    target.close()
+    print(f"✅ 移行完了: {days}日分 / イベント{events}件 / 日次集計{len(rollups)}件 / アラート{alerts}件 → {db_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日次データとアラートログをSQLiteに移行")
+    parser.add_argument('--data-dir', default=str(DATA_DIR))
+    parser.add_argument('--log-dir', default=str(LOG_DIR))
+    parser.add_argument('--db', default=str(DATA_DIR / "mimamori.db"))
+    args = parser.parse_args()
+
+    migrate(args.data_dir, args.log_dir, args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,12 +8,23 @@ import cv2
 import numpy as np
 import json
 import time
+import signal
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from onvif import ONVIFCamera
-from ultralytics import YOLO
-from skimage.metrics import structural_similarity as ssim
+from capture import create_grabber, rtsp_url
+from detection import BatchingDetector, WarmupDetector, create_detector, padded_roi
+from inference_server import InferenceServer
+from motion import MotionGate
+from onvif_client import OnvifCache, connect_ptz
+from ptz import PanTracker, PIDController, PTZController, SimulatedPTZService
+from event_store import compute_rollup, create_store, empty_summary
+from notifier import create_dispatcher
+from scheduler import Scheduler
+from similarity import create_similarity
+from tracker import PersonTracker
 
 # 設定読み込み
 CONFIG_PATH = Path(__file__).parent.parent / "config" / "settings.json"
@@ -23,82 +34,100 @@ with open(CONFIG_PATH, 'r') as f:
 DATA_DIR = Path(__file__).parent.parent / "data"
 LOG_DIR = Path(__file__).parent.parent / "logs"
 
-class MimamoriHalo:
-    """見守りハロ - メイン監視クラス"""
+# 監視状態の優先度（複数カメラでは最も活発な状態を全体の状態とする）
+STATE_PRIORITY = ["not_detected", "detected_once", "detected_active"]
+
+def load_camera_configs(config):
+    """監視するカメラの設定一覧
+
+    cameras が指定されていれば各要素を camera の設定に上書きして使い
+    （共通の認証情報などは camera に書ける）、なければ camera の1台を監視する。
+    """
+    base = config.get('camera', {})
+    cameras = config.get('cameras') or [{}]
+    return [
+        {'name': f"camera{index + 1}", **base, **camera}
+        for index, camera in enumerate(cameras)
+    ]
+
+class CameraMonitor:
+    """カメラ1台分の監視（PTZ・映像取得・スキャン・追尾）"""
     
-    def __init__(self):
-        print("🤖 見守りハロを起動中...")
+    def __init__(self, halo, camera_config):
+        self.halo = halo
+        self.camera_config = camera_config
+        self.name = camera_config['name']
+        self.detector = halo.detector
+        print(f"📷 カメラ {self.name}（{camera_config['host']}）に接続中...")
         
-        # YOLOモデル
-        self.yolo = YOLO('yolov8n.pt')
+        # 映像取得（常駐ストリーム / rawvideoパイプ / ffmpegスナップショット）
+        # 受信開始は別スレッドなので、ONVIF接続より先に始めておく
+        capture_config = CONFIG.get('capture', {})
+        source = camera_config.get('source') or capture_config.get('source') or rtsp_url(camera_config)
+        self.grabber = create_grabber(capture_config, source)
+        if self.grabber is not None:
+            self.grabber.start()
         
-        # ONVIFカメラ
-        self.camera = ONVIFCamera(
-            CONFIG['camera']['host'],
-            CONFIG['camera']['onvif_port'],
-            CONFIG['camera']['username'],
-            CONFIG['camera']['password']
+        # ONVIFカメラ（サービスURLとプロファイルトークンはキャッシュを利用）
+        if camera_config.get('simulated'):
+            # 実機なしでの動作確認用（映像は source で指定）
+            self.camera, self.ptz_service, self.ptz_token = None, SimulatedPTZService(), 'simulated'
+            self.startup_times = {}
+        else:
+            try:
+                self.camera, self.ptz_service, self.ptz_token, self.startup_times = connect_ptz(
+                    camera_config, halo.onvif_cache
+                )
+            except Exception:
+                # 先に始めた映像取得を残さない
+                if self.grabber is not None:
+                    self.grabber.stop()
+                raise
+        
+        # PTZ制御（絶対位置移動と GetStatus による位置確認、未対応なら時間制御）
+        self.ptz = PTZController(
+            self.ptz_service, self.ptz_token,
+            pan_limit=camera_config.get('pan_limit', 180),
+            degrees_per_second=camera_config.get('degrees_per_second', 200),
+            tolerance=camera_config.get('position_tolerance', 1.0),
+            mode=camera_config.get('ptz_mode', 'auto')
         )
-        self.ptz_service = self.camera.create_ptz_service()
-        self.media_service = self.camera.create_media_service()
-        self.ptz_token = self.media_service.GetProfiles()[0].token
+        self.presets = {}  # 角度 → プリセットトークン（setup_presets で登録）
+        
+        # 動き検知ゲート（変化のない角度は推論を省略）
+        gate_config = CONFIG.get('motion_gate', {})
+        self.motion_gate = None
+        if gate_config.get('enabled', True):
+            self.motion_gate = MotionGate(
+                threshold=gate_config.get('threshold', 0.01),
+                pixel_threshold=gate_config.get('pixel_threshold', 25),
+                width=gate_config.get('width', 160),
+                max_skips=gate_config.get('max_skips', 6),
+                pan_tolerance=gate_config.get('pan_tolerance', 1.0)
+            )
+        
+        # パイプライン推論用ワーカー（必要時に生成）
+        self.inference_executor = None
         
         # 状態管理
         self.state = "not_detected"
         self.interval = CONFIG['scan_intervals']['not_detected']
         
-        # 前回検出データ（メモリのみ、プライバシー配慮）
-        self.previous_person_crop = None
-        self.previous_bbox = None
+        # 人物の追跡（前回の人物領域は人物ごとにメモリのみで保持、プライバシー配慮）
+        tracker_config = CONFIG.get('tracker', {})
+        self.tracker = PersonTracker(
+            iou_threshold=tracker_config.get('iou_threshold', 0.2),
+            max_age=tracker_config.get('max_age', 600),
+            max_misses=tracker_config.get('max_misses', 5),
+            position_tolerance=CONFIG['fall_detection']['position_tolerance']
+        )
+        self.similarity = halo.similarity
         self.last_detection_time = None
         
-        # 日次データ
-        self.today_data = self.load_today_data()
-        
-        print("✅ 見守りハロ起動完了")
-    
-    def load_today_data(self):
-        """本日のデータを読み込み"""
-        today = datetime.now().strftime("%Y-%m-%d")
-        data_file = DATA_DIR / f"{today}.json"
-
-        if data_file.exists():
-            try:
-                with open(data_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if content.strip():
-                        return json.loads(content)
-            except json.JSONDecodeError as e:
-                print(f"⚠️ JSONファイルが破損しています: {e}")
-                print(f"新しいデータファイルを作成します...")
-            except Exception as e:
-                print(f"⚠️ データ読み込みエラー: {e}")
-
-        # ファイルが存在しないか、破損している場合は新規作成
-        return {
-            "date": today,
-            "events": [],
-            "summary": {
-                "first_activity": None,
-                "last_activity": None,
-                "total_detections": 0,
-                "lying_events": 0,
-                "alerts": []
-            }
-        }
-    
-    def save_today_data(self):
-        """本日のデータを保存（原子的な書き込み）"""
-        today = datetime.now().strftime("%Y-%m-%d")
-        data_file = DATA_DIR / f"{today}.json"
-        temp_file = DATA_DIR / f"{today}.json.tmp"
-
-        # 一時ファイルに書き込み
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(self.today_data, f, ensure_ascii=False, indent=2)
-
-        # 原子的に置き換え
-        temp_file.replace(data_file)
+        # スキャン・転倒再確認のスケジューラ（カメラごとのスレッドで実行）
+        self.scheduler = Scheduler(late_warning=CONFIG.get('scheduler', {}).get('late_warning', 5.0))
+        self.fall_recheck_jobs = {}  # track_id → 転倒再確認ジョブ
+        self.thread = None
     
     def is_night_mode(self):
         """夜間モードかチェック"""
@@ -115,49 +144,55 @@ class MimamoriHalo:
             return now >= start or now <= end
     
     def move_camera(self, angle):
-        """カメラを指定角度に移動"""
-        # 正規化された速度（-1 to 1）
-        speed = 0.3 if angle > 0 else -0.3 if angle < 0 else 0
+        """カメラを指定角度（絶対位置）に移動して到達した角度を返す
 
-        if speed != 0:
-            request = self.ptz_service.create_type('ContinuousMove')
-            request.ProfileToken = self.ptz_token
-            request.Velocity = {'PanTilt': {'x': speed, 'y': 0}}
-            self.ptz_service.ContinuousMove(request)
-
-            # 移動時間を計算（角度に応じて）
-            move_time = abs(angle) / 30.0 * 0.5  # 30度で0.5秒
-            time.sleep(move_time)
-
-            # 停止
-            stop_request = self.ptz_service.create_type('Stop')
-            stop_request.ProfileToken = self.ptz_token
-            self.ptz_service.Stop(stop_request)
-
-        time.sleep(0.5)  # 安定待機
+        プリセットがあれば GotoPreset、なければ AbsoluteMove、どちらも使えない
+        カメラでは現在位置（または推定位置）からの差分だけ動かすため、
+        直前の位置によらず同じ角度を呼べば同じ位置に戻る。
+        """
+        token = self.presets.get(angle)
+        if token is not None:
+            pan = self.ptz.goto_preset(token, angle)
+        else:
+            pan = self.ptz.goto(angle)
+        
+        # GetStatus で完了を確認できないカメラは固定時間だけ安定待機
+        if not self.ptz.has_feedback:
+            time.sleep(self.camera_config.get('settle_time', 0.5))
+        return pan
+    
+    def setup_presets(self):
+        """スキャン位置とホーム位置をONVIFプリセットとして用意"""
+        if not self.camera_config.get('use_presets', True):
+            return
+        angles = list(self.camera_config['scan_positions']) + [self.camera_config['home_position']]
+        try:
+            self.presets = self.ptz.register_presets(
+                angles, prefix=self.camera_config.get('preset_prefix', 'mimamori')
+            )
+        except Exception as e:
+            print(f"⚠️ [{self.name}] プリセットを登録できません: {e}")
+            self.presets = {}
+        if self.presets:
+            print(f"📌 [{self.name}] プリセット {len(self.presets)}件でスキャンします")
 
     def move_camera_smooth(self, pan_speed, tilt_speed=0, duration=0.5):
-        """カメラを滑らかに移動（追尾用）"""
+        """カメラを滑らかに移動（送信を待たずに戻り、duration 秒後に停止）"""
         if pan_speed != 0 or tilt_speed != 0:
-            request = self.ptz_service.create_type('ContinuousMove')
-            request.ProfileToken = self.ptz_token
-            request.Velocity = {'PanTilt': {'x': pan_speed, 'y': tilt_speed}}
-            self.ptz_service.ContinuousMove(request)
-
-            time.sleep(duration)
-
-            # 停止
-            stop_request = self.ptz_service.create_type('Stop')
-            stop_request.ProfileToken = self.ptz_token
-            self.ptz_service.Stop(stop_request)
+            self.ptz.velocity(pan_speed, tilt_speed, duration=duration)
     
     def capture_snapshot(self):
         """カメラからスナップショット取得"""
-        temp_file = "/tmp/mimamori_snapshot.jpg"
+        if self.grabber is not None:
+            # 呼び出し以降にデコードされた最新フレーム（ディスクを経由しない）
+            timeout = CONFIG.get('capture', {}).get('read_timeout', 5.0)
+            return self.grabber.read(newer_than=time.monotonic(), timeout=timeout)
+        
+        temp_file = f"/tmp/mimamori_snapshot_{self.name}.jpg"
         
         subprocess.run([
             'ffmpeg', '-rtsp_transport', 'tcp',
-            '-i', f"rtsp://{CONFIG['camera']['username']}:{CONFIG['camera']['password']}@{CONFIG['camera']['host']}:{CONFIG['camera']['rtsp_port']}/stream1",
+            '-i', rtsp_url(self.camera_config),
             '-frames:v', '1', '-q:v', '2',
             temp_file, '-y'
         ], capture_output=True, timeout=10)
@@ -167,99 +202,113 @@ class MimamoriHalo:
     
     def detect_person(self, image):
         """人物検出 + 姿勢推定"""
-        results = self.yolo(image, verbose=False)
-        detections = results[0].boxes
-        
-        persons = []
-        for box in detections:
-            cls_id = int(box.cls[0])
-            if cls_id == 0:  # person
-                conf = float(box.conf[0])
-                bbox = box.xyxy[0].tolist()
-                
-                # 姿勢推定（簡易版：縦横比で判定）
-                x1, y1, x2, y2 = bbox
-                width = x2 - x1
-                height = y2 - y1
-                aspect_ratio = height / width if width > 0 else 0
-                
-                if aspect_ratio > 1.5:
-                    posture = "standing"
-                elif aspect_ratio > 0.8:
-                    posture = "sitting"
-                else:
-                    posture = "lying"
-                
-                persons.append({
-                    'bbox': bbox,
-                    'confidence': conf,
-                    'posture': posture,
-                    'aspect_ratio': aspect_ratio
-                })
+        return self.detector.detect(image)
+    
+    def detect_at(self, angle, image, pan=None):
+        """スキャン位置での人物検出（同じ向きで変化がなければ前回結果を再利用）"""
+        if self.motion_gate is None:
+            return self.detect_person(image)
+        
+        persons = self.motion_gate.reuse(angle, image, pan)
+        if persons is not None:
+            return persons
         
+        persons = self.detect_person(image)
+        self.motion_gate.remember(angle, persons)
         return persons
     
+    def detect_person_roi(self, image, bbox, padding=0.5, imgsz=320):
+        """前回ボックス周辺だけを縮小サイズで推論（追尾用）"""
+        rx1, ry1, rx2, ry2 = padded_roi(bbox, image.shape, padding)
+        if rx2 <= rx1 or ry2 <= ry1:
+            return []
+        roi = image[ry1:ry2, rx1:rx2]
+        return self.detector.detect(roi, imgsz=imgsz, offset=(rx1, ry1))
+    
+    def update_tracks(self, image, persons, pan, roi=None):
+        """検出結果を追跡に反映して track_id を付ける
+
+        画像のx座標はパン角度と水平画角（fov）から全方位座標に換算する。
+        roi を指定した場合はその範囲だけを見えている範囲として扱う。
+        """
+        width = image.shape[1]
+        pixels_per_degree = width / self.camera_config.get('fov', 60)
+        offset_x = pan * pixels_per_degree - width / 2
+        x1, x2 = (0, width) if roi is None else (roi[0], roi[2])
+        return self.tracker.update(persons, offset_x=offset_x, view=(x1 + offset_x, x2 + offset_x))
+    
+    def detect_persons_batch(self, images):
+        """複数画像をまとめて1回の推論で人物検出"""
+        return self.detector.detect_batch(images)
+    
     def compare_with_previous(self, current_image, person):
-        """前回検出と比較"""
-        if self.previous_person_crop is None:
+        """同じ人物（track_id）の前回検出と比較"""
+        track = self.tracker.get(person.get('track_id'))
+        
+        # 現在の人物領域の特徴（縮小グレー画像・ハッシュ等、画像そのものは保持しない）
+        x1, y1, x2, y2 = map(int, person['bbox'])
+        features = self.similarity.features(current_image[max(y1, 0):y2, max(x1, 0):x2])
+        
+        if track is None or track.features is None:
             # 初回検出
-            self.save_current_detection(current_image, person['bbox'])
+            self.save_current_detection(track, features)
             return {
                 'same_position': False,
-                'similarity_ssim': 0,
+                'similarity': 0,
                 'position_diff': 0
             }
         
-        # 現在の人物領域を切り出し
-        x1, y1, x2, y2 = map(int, person['bbox'])
-        current_crop = current_image[y1:y2, x1:x2]
-        
-        # サイズを前回と合わせる
-        prev_h, prev_w = self.previous_person_crop.shape[:2]
-        current_resized = cv2.resize(current_crop, (prev_w, prev_h))
-        
-        # SSIM計算
-        gray1 = cv2.cvtColor(self.previous_person_crop, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(current_resized, cv2.COLOR_BGR2GRAY)
-        similarity, _ = ssim(gray1, gray2, full=True)
-        
-        # 位置変化
-        center1_x = (self.previous_bbox[0] + self.previous_bbox[2]) / 2
-        center1_y = (self.previous_bbox[1] + self.previous_bbox[3]) / 2
-        center2_x = (person['bbox'][0] + person['bbox'][2]) / 2
-        center2_y = (person['bbox'][1] + person['bbox'][3]) / 2
+        similarity = self.similarity.compare(track.features, features)
+        
+        # 位置変化（全方位座標）
+        center1_x, center1_y = track.features_center
+        center2_x, center2_y = track.center
         position_diff = np.sqrt((center2_x - center1_x)**2 + (center2_y - center1_y)**2)
         
-        # 判定
+        # 判定（しきい値は類似度の方式ごと）
         same_position = (
-            similarity > CONFIG['fall_detection']['similarity_threshold'] and
+            self.similarity.is_similar(similarity) and
             position_diff < CONFIG['fall_detection']['position_tolerance']
         )
         
         # 現在の検出を保存
-        self.save_current_detection(current_image, person['bbox'])
+        self.save_current_detection(track, features)
         
+        # NumPy のスカラーは JSON に書けないため Python の型に変換
         return {
-            'same_position': same_position,
-            'similarity_ssim': similarity,
-            'position_diff': position_diff
+            'same_position': bool(same_position),
+            'similarity': float(similarity),
+            'position_diff': float(position_diff)
         }
     
-    def save_current_detection(self, image, bbox):
-        """現在の検出をメモリに保存"""
-        x1, y1, x2, y2 = map(int, bbox)
-        self.previous_person_crop = image[y1:y2, x1:x2].copy()
-        self.previous_bbox = bbox
+    def save_current_detection(self, track, features):
+        """現在の検出の特徴を人物ごとにメモリに保存"""
+        if track is None:
+            return
+        track.features = features
+        track.features_center = track.center
     
     def scan_area(self):
         """エリアスキャン"""
-        positions = CONFIG['camera']['scan_positions']
+        mode = CONFIG.get('scan', {}).get('mode', 'sequential')
+        if mode == 'batch':
+            return self.scan_area_batch()
+        if mode == 'pipelined':
+            return self.scan_area_pipelined()
+        return self.scan_area_sequential()
+
+    def scan_area_sequential(self):
+        """エリアスキャン（位置ごとに撮影→推論）"""
+        positions = self.camera_config['scan_positions']
         results = {}
         
         for angle in positions:
-            self.move_camera(angle)
+            pan = self.move_camera(angle)
             image = self.capture_snapshot()
-            persons = self.detect_person(image)
+            if image is None:
+                print(f"⚠️ スナップショット取得失敗（{angle}°）")
+                continue
+            persons = self.update_tracks(image, self.detect_at(angle, image, pan), pan)
             
             results[angle] = {
                 'detected': len(persons) > 0,
@@ -268,21 +317,136 @@ class MimamoriHalo:
             
             # 人が見つかったら追尾モードへ
             if persons:
-                tracked_person = self.track_person(persons[0], image)
+                # 追尾中の取得でバッファが再利用されるため、返却する画像は複製
+                image = image.copy()
+                tracked_person = self.track_person(self.tracker.primary(persons), image)
                 return angle, image, tracked_person
 
             # 画像削除（プライバシー）
             del image
 
         # ホームポジションに戻る
-        self.move_camera(CONFIG['camera']['home_position'])
+        self.move_camera(self.camera_config['home_position'])
 
         return None, None, None
 
+    def scan_area_batch(self):
+        """エリアスキャン（全位置を撮影してから一括推論）"""
+        positions = self.camera_config['scan_positions']
+        early_exit = CONFIG.get('scan', {}).get('early_exit', True)
+        
+        angles = []
+        pans = []  # 実際に到達した角度（追跡の座標換算に使う）
+        images = []
+        for angle in positions:
+            pan = self.move_camera(angle)
+            image = self.capture_snapshot()
+            if image is None:
+                print(f"⚠️ スナップショット取得失敗（{angle}°）")
+                continue
+            # 次の取得でバッファが再利用されるため複製して保持
+            angles.append(angle)
+            pans.append(pan)
+            images.append(image.copy())
+        
+        # 変化のない位置は前回結果を再利用
+        results = {}
+        if self.motion_gate is not None:
+            for angle, pan, image in zip(angles, pans, images):
+                persons = self.motion_gate.reuse(angle, image, pan)
+                if persons is not None:
+                    results[angle] = persons
+        
+        # 残りの位置を1回のバッチ推論で処理
+        targets = [(angle, image) for angle, image in zip(angles, images) if angle not in results]
+        batch_results = self.detect_persons_batch([image for _, image in targets])
+        for (angle, _), persons in zip(targets, batch_results):
+            results[angle] = persons
+            if self.motion_gate is not None:
+                self.motion_gate.remember(angle, persons)
+        
+        # スキャン順に追跡へ反映
+        for angle, pan, image in zip(angles, pans, images):
+            results[angle] = self.update_tracks(image, results[angle], pan)
+        
+        found = None
+        for index, angle in enumerate(angles):
+            persons = results[angle]
+            if not persons:
+                continue
+            if early_exit:
+                # スキャン順で最初に見つかった位置を採用
+                found = index
+                break
+            if found is None or persons[0]['confidence'] > results[angles[found]][0]['confidence']:
+                found = index
+        
+        if found is None:
+            del images
+            # ホームポジションに戻る
+            self.move_camera(self.camera_config['home_position'])
+            return None, None, None
+        
+        angle = angles[found]
+        image = images[found]
+        del images
+        
+        # 検出位置に戻ってから追尾モードへ（カメラは最後のスキャン位置にいる。
+        # その位置の取得に失敗していると angles[-1] とは限らない）
+        if angle != positions[-1]:
+            self.move_camera(angle)
+        tracked_person = self.track_person(self.tracker.primary(results[angle]), image)
+        return angle, image, tracked_person
+
+    def scan_area_pipelined(self):
+        """エリアスキャン（次の位置への移動中に前の位置を推論）"""
+        positions = self.camera_config['scan_positions']
+        if self.inference_executor is None:
+            self.inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        
+        pending = None  # (angle, 到達した角度, image, future)
+        for next_angle in positions + [None]:
+            # 移動（最後はホームポジションへ）と前位置の推論を並行実行
+            if next_angle is not None:
+                next_pan = self.move_camera(next_angle)
+            else:
+                self.move_camera(self.camera_config['home_position'])
+            
+            if pending is not None:
+                angle, pan, image, future = pending
+                pending = None
+                persons = self.update_tracks(image, future.result(), pan)
+                if persons:
+                    # 追尾中の取得でバッファが再利用されるため、返却する画像は複製
+                    image = image.copy()
+                    # 検出位置に戻ってから追尾モードへ（次の位置・ホームからの絶対位置で戻る）
+                    self.move_camera(angle)
+                    tracked_person = self.track_person(self.tracker.primary(persons), image)
+                    return angle, image, tracked_person
+                del image
+            
+            if next_angle is None:
+                break
+            
+            image = self.capture_snapshot()
+            if image is None:
+                print(f"⚠️ スナップショット取得失敗（{next_angle}°）")
+                continue
+            pending = (
+                next_angle, next_pan, image,
+                self.inference_executor.submit(self.detect_at, next_angle, image, next_pan)
+            )
+        
+        return None, None, None
+
     def track_person(self, person, initial_image):
         """人物を1分間追尾"""
-        tracking_enabled = CONFIG.get('tracking', {}).get('enabled', True)
-        tracking_duration = CONFIG.get('tracking', {}).get('duration', 60)
+        tracking_config = CONFIG.get('tracking', {})
+        tracking_enabled = tracking_config.get('enabled', True)
+        tracking_duration = tracking_config.get('duration', 60)
+        roi_enabled = tracking_config.get('roi_enabled', True)
+        roi_padding = tracking_config.get('roi_padding', 0.5)
+        roi_imgsz = tracking_config.get('roi_imgsz', 320)
 
         if not tracking_enabled:
             print("📷 追尾機能は無効です")
@@ -294,60 +458,87 @@ class MimamoriHalo:
         # 画像サイズ取得
         img_height, img_width = initial_image.shape[:2]
         center_x = img_width / 2
-        center_y = img_height / 2
 
-        # 許容範囲（画面中心から）
-        tolerance_x = img_width * 0.1  # 画面幅の10%
+        # 画面中心からのずれ（画面半幅で正規化）をPID制御でパン速度に変換
+        pid_config = tracking_config.get('pid', {})
+        pan_tracker = PanTracker(
+            self.ptz,
+            PIDController(
+                kp=pid_config.get('kp', 0.4),
+                ki=pid_config.get('ki', 0.05),
+                kd=pid_config.get('kd', 0.05),
+                output_limit=tracking_config.get('max_speed', 0.3)
+            ),
+            deadband=tracking_config.get('center_tolerance', 0.1),
+            hold=tracking_config.get('command_hold', 1.0)
+        )
 
         tracked_person = person
 
-        while (time.time() - start_time) < tracking_duration:
-            # 現在の画像を取得
-            image = self.capture_snapshot()
-            if image is None:
-                print("⚠️ スナップショット取得失敗")
-                break
+        # 1フレームあたりの所要時間の内訳（取得・検出・PTZ指令）
+        timings = {'capture': 0.0, 'detect': 0.0, 'ptz': 0.0}
+        frames = 0
 
-            # 人物検出
-            persons = self.detect_person(image)
-
-            if not persons:
-                print("❌ 人物を見失いました")
-                del image
-                break
-
-            # 最も信頼度の高い人物を選択
-            tracked_person = max(persons, key=lambda p: p['confidence'])
-            bbox = tracked_person['bbox']
-
-            # 人物の中心座標を計算
-            person_center_x = (bbox[0] + bbox[2]) / 2
-            person_center_y = (bbox[1] + bbox[3]) / 2
+        try:
+            # 固定の待ち時間は置かず、最新フレームごとに速度を更新する
+            while (time.time() - start_time) < tracking_duration and not self.scheduler.stopped:
+                # 現在の画像を取得
+                step_start = time.perf_counter()
+                image = self.capture_snapshot()
+                timings['capture'] += time.perf_counter() - step_start
+                if image is None:
+                    print("⚠️ スナップショット取得失敗")
+                    break
 
-            # 画面中心からのずれを計算
-            offset_x = person_center_x - center_x
-            offset_y = person_center_y - center_y
+                # 人物検出（前回位置の周辺のみ → 見失ったら全体）
+                step_start = time.perf_counter()
+                persons = []
+                roi = None
+                if roi_enabled:
+                    persons = self.detect_person_roi(image, tracked_person['bbox'], roi_padding, roi_imgsz)
+                    if persons:
+                        roi = padded_roi(tracked_person['bbox'], image.shape, roi_padding)
+                if not persons:
+                    persons = self.detect_person(image)
+                timings['detect'] += time.perf_counter() - step_start
+                frames += 1
 
-            # 画面中心に近ければ追尾不要
-            if abs(offset_x) < tolerance_x:
-                print(f"✅ 中心に捕捉（オフセット: {offset_x:.0f}px）")
-            else:
-                # カメラを移動
-                # 正規化された速度（画面端に近いほど速く）
-                pan_speed = max(-0.3, min(0.3, offset_x / center_x * 0.2))
+                if not persons:
+                    print("❌ 人物を見失いました")
+                    del image
+                    break
 
-                print(f"🎯 追尾中... オフセット: {offset_x:.0f}px, 速度: {pan_speed:.3f}")
+                # 追尾中の人物（同じ track_id）を選択し、いなければ最も長く追跡している人物
+                persons = self.update_tracks(image, persons, self.ptz.estimate(), roi)
+                tracked_person = self.tracker.primary(persons, tracked_person.get('track_id'))
+                bbox = tracked_person['bbox']
 
-                self.move_camera_smooth(pan_speed, 0, 0.3)
+                # 画面中心からのずれを計算
+                offset_x = (bbox[0] + bbox[2]) / 2 - center_x
+                was_moving = pan_tracker.current_speed != 0.0
+                step_start = time.perf_counter()
+                pan_speed = pan_tracker.update(offset_x / center_x)
+                timings['ptz'] += time.perf_counter() - step_start
 
-            # 画像削除
-            del image
+                if pan_speed == 0.0:
+                    if was_moving:
+                        print(f"✅ 中心に捕捉（オフセット: {offset_x:.0f}px）")
+                else:
+                    print(f"🎯 追尾中... オフセット: {offset_x:.0f}px, 速度: {pan_speed:.3f}")
 
-            # 短い待機
-            time.sleep(0.5)
+                # 画像削除
+                del image
+        finally:
+            pan_tracker.stop()
 
         elapsed = time.time() - start_time
         print(f"✅ 追尾完了（{elapsed:.1f}秒間）")
+        if frames:
+            print(
+                f"⏱️ 追尾 {frames}フレーム: 取得 平均{timings['capture'] / frames * 1000:.0f}ms"
+                f" / 検出 平均{timings['detect'] / frames * 1000:.0f}ms"
+                f" / PTZ指令 平均{timings['ptz'] / frames * 1000:.1f}ms"
+            )
 
         return tracked_person
     
@@ -355,32 +546,29 @@ class MimamoriHalo:
         """人物検出時の処理"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        # 前回と比較
+        # 同じ人物の前回検出と比較
         comparison = self.compare_with_previous(image, person)
         
         # イベント記録
         event = {
             'timestamp': timestamp,
+            'camera': self.name,
+            'track_id': person.get('track_id'),
             'state': self.state,
             'camera_angle': angle,
             'posture': person['posture'],
             'confidence': person['confidence'],
             'same_position': comparison['same_position'],
-            'similarity': comparison['similarity_ssim'],
+            'similarity': comparison['similarity'],
             'position_diff': comparison['position_diff'],
             'next_interval': self.interval
         }
         
-        self.today_data['events'].append(event)
-        self.today_data['summary']['total_detections'] += 1
-        self.today_data['summary']['last_activity'] = timestamp
-        
-        if self.today_data['summary']['first_activity'] is None:
-            self.today_data['summary']['first_activity'] = timestamp
+        self.halo.record_event(event)
         
         # 状態遷移
         if comparison['same_position']:
-            print(f"📍 同じ位置（類似度: {comparison['similarity_ssim']:.2f}）")
+            print(f"📍 同じ位置（人物{person.get('track_id')}、類似度: {comparison['similarity']:.2f}）")
             
             if person['posture'] == 'lying':
                 print("⚠️ 横たわっている姿勢を検出")
@@ -391,7 +579,7 @@ class MimamoriHalo:
                 self.interval = CONFIG['scan_intervals']['detected_active']
                 print(f"✅ 正常（{person['posture']}）- 次回: {self.interval}秒後")
         else:
-            print(f"🚶 移動検出（{person['posture']}）")
+            print(f"🚶 移動検出（人物{person.get('track_id')}、{person['posture']}）")
             self.state = "detected_once"
             self.interval = CONFIG['scan_intervals']['detected_once']
         
@@ -401,79 +589,523 @@ class MimamoriHalo:
         del image
     
     def handle_lying_detection(self, angle, person):
-        """転倒検知処理"""
-        print(f"⏳ {CONFIG['fall_detection']['recheck_delay']}秒後に再確認...")
-        time.sleep(CONFIG['fall_detection']['recheck_delay'])
+        """転倒検知処理（人物ごとに再確認を予約して待たずに戻る）"""
+        track_id = person.get('track_id')
+        if track_id in self.fall_recheck_jobs:
+            print(f"⏳ 人物{track_id}の再確認を予約済みです")
+            return
+        
+        recheck_delay = CONFIG['fall_detection']['recheck_delay']
+        print(f"⏳ {recheck_delay}秒後に再確認...")
+        self.fall_recheck_jobs[track_id] = self.scheduler.call_later(
+            recheck_delay, f"{self.name}/fall_recheck", self.recheck_fall, angle, track_id
+        )
+    
+    def recheck_fall(self, angle, track_id=None):
+        """転倒の再確認"""
+        self.fall_recheck_jobs.pop(track_id, None)
         
         # 再スキャン
-        self.move_camera(angle)
+        pan = self.move_camera(angle)
         image = self.capture_snapshot()
-        persons = self.detect_person(image)
+        persons = self.detect_person(image) if image is not None else []
+        if persons:
+            persons = self.update_tracks(image, persons, pan)
         
-        if persons and persons[0]['posture'] == 'lying':
-            print("🚨 緊急アラート: 転倒の可能性！")
-            self.send_emergency_alert("転倒検知", {
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        # 同じ人物を優先し、見つからなければ横たわっている別の人物も対象にする
+        lying = [p for p in persons if p['posture'] == 'lying']
+        person = self.tracker.primary(lying, track_id)
+        
+        if person is not None:
+            track = self.tracker.get(person['track_id'])
+            lying_seconds = track.lying_seconds() if track is not None else 0.0
+            still_seconds = track.still_seconds() if track is not None else 0.0
+            print(f"🚨 緊急アラート: 転倒の可能性！（人物{person['track_id']}、{lying_seconds:.0f}秒間横たわっています）")
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.halo.send_emergency_alert("転倒検知", {
+                'timestamp': timestamp,
+                'camera': self.name,
+                'track_id': person['track_id'],
                 'posture': 'lying',
+                'lying_seconds': round(lying_seconds),
+                'still_seconds': round(still_seconds),
                 'recheck': True
             })
-            self.today_data['summary']['lying_events'] += 1
-            self.today_data['summary']['alerts'].append({
-                'type': 'fall_detection',
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
+            self.halo.record_fall(self.name, timestamp)
         else:
             print("✅ 再確認: 正常")
         
         del image
     
+    def scan_once(self):
+        """1回分のスキャンと結果の処理"""
+        # 日付の切り替わりチェック
+        self.halo.check_day_rollover()
+        
+        # 夜間モードチェック
+        if self.is_night_mode():
+            self.interval = CONFIG['scan_intervals']['night_mode']
+            print(f"🌙 夜間モード（{self.interval}秒間隔）")
+        
+        # スキャン実行
+        print(f"\n🔍 [{self.name}] スキャン開始 - {datetime.now().strftime('%H:%M:%S')}")
+        angle, image, person = self.scan_area()
+        
+        if person:
+            self.handle_detection(angle, image, person)
+        else:
+            print("❌ 未検出")
+            self.state = "not_detected"
+            self.interval = CONFIG['scan_intervals']['not_detected']
+            print(f"次回: {self.interval}秒後")
+        
+        if self.motion_gate is not None:
+            gate_stats = self.motion_gate.stats()
+            print(f"⏭️ 推論スキップ: {gate_stats['skipped']}/{gate_stats['inferences'] + gate_stats['skipped']}回")
+        
+        # データ保存
+        self.halo.save_today_data()
+        self.halo.purge_old_data()
+    
+    def scan_job(self):
+        """スキャンジョブ（終了後に次回を予約）"""
+        try:
+            self.scan_once()
+        finally:
+            if not self.scheduler.stopped:
+                self.scheduler.call_later(self.interval, f"{self.name}/scan", self.scan_job)
+    
+    def start(self):
+        """スキャンを開始（カメラごとのスレッド）"""
+        self.scheduler.call_later(0, f"{self.name}/presets", self.setup_presets)
+        self.scheduler.call_later(0, f"{self.name}/scan", self.scan_job)
+        self.thread = threading.Thread(target=self.scheduler.run, name=f"camera-{self.name}", daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """スキャンを停止して映像取得を終了"""
+        self.scheduler.stop()
+        if self.thread is not None:
+            self.thread.join(timeout=30)
+            self.thread = None
+        if self.inference_executor is not None:
+            self.inference_executor.shutdown(wait=False)
+        if self.grabber is not None:
+            self.grabber.stop()
+        self.ptz.close()
+
+class MimamoriHalo:
+    """見守りハロ - メイン監視クラス（全カメラ共通のデータ・通知・日次ジョブ）"""
+    
+    def __init__(self):
+        print("🤖 見守りハロを起動中...")
+        started = time.perf_counter()
+        startup_config = CONFIG.get('startup', {})
+        camera_configs = load_camera_configs(CONFIG)
+        self.startup_times = {}
+        
+        # 人物検出モデル（ultralytics / ONNX Runtime / OpenVINO）
+        # 複数カメラではモデルを1つだけ読み込み、各カメラの推論をまとめて実行
+        inference_config = CONFIG.get('inference', {})
+        self.warmup = None
+        if inference_config.get('server'):
+            # 別プロセスで推論（フレームは共有メモリ、異常時はプロセスだけ再起動）
+            self.detector = InferenceServer(
+                CONFIG.get('detector', {}),
+                workers=inference_config.get('workers', 1),
+                slots=inference_config.get('slots', 8),
+                max_frame=tuple(inference_config.get('max_frame', [1080, 1920])),
+                max_batch=inference_config.get('max_batch', 8),
+                timeout=inference_config.get('timeout', 10.0),
+                start_timeout=inference_config.get('start_timeout', 120.0),
+                max_start_failures=inference_config.get('max_start_failures', 3)
+            )
+        else:
+            if startup_config.get('warmup', True):
+                # 読み込みとウォームアップはバックグラウンド（初回の推論だけ完了を待つ）
+                self.detector = self.warmup = WarmupDetector(
+                    lambda: create_detector(CONFIG.get('detector', {})),
+                    on_ready=self.report_detector_ready
+                )
+            else:
+                self.detector = create_detector(CONFIG.get('detector', {}))
+            if len(camera_configs) > 1:
+                self.detector = BatchingDetector(
+                    self.detector,
+                    max_batch=inference_config.get('max_batch', 8),
+                    max_wait=inference_config.get('max_wait', 0.02)
+                )
+        self.startup_times['検出モデル'] = time.perf_counter() - started
+        
+        # 同じ位置かの判定に使う類似度（状態を持たないため全カメラで共有）
+        self.similarity = create_similarity(CONFIG['fall_detection'])
+        
+        # ONVIF接続情報のキャッシュ（再起動時の問い合わせを省略）
+        self.onvif_cache = None
+        if startup_config.get('onvif_cache', True):
+            self.onvif_cache = OnvifCache(DATA_DIR / "onvif_cache.json")
+        
+        # カメラ（PTZ・映像取得・スキャンはカメラごと）は並列に接続
+        self.cameras = []
+        executor = ThreadPoolExecutor(
+            max_workers=len(camera_configs) if startup_config.get('parallel', True) else 1,
+            thread_name_prefix="startup"
+        )
+        camera_futures = [executor.submit(CameraMonitor, self, camera_config) for camera_config in camera_configs]
+        
+        # 日次データ（JSONL追記型 or SQLite、全カメラで共有）
+        phase = time.perf_counter()
+        self.store = create_store(CONFIG, DATA_DIR, LOG_DIR)
+        self.data_lock = threading.RLock()
+        self.today_data = self.load_today_data()
+        self.last_purge_date = None
+        self.write_missing_rollups()
+        self.startup_times['データ読み込み'] = time.perf_counter() - phase
+        
+        # アラート配信（メール・ログ等へ別スレッドで送信、未送信分は再起動後に再送）
+        phase = time.perf_counter()
+        self.alert_dispatcher = create_dispatcher(CONFIG, self.store, DATA_DIR).start()
+        self.startup_times['アラート配信'] = time.perf_counter() - phase
+        
+        # 日次ジョブ（レポート・朝の確認・夜間の活動）のスケジューラ
+        scheduler_config = CONFIG.get('scheduler', {})
+        self.scheduler = Scheduler(late_warning=scheduler_config.get('late_warning', 5.0))
+        
+        # 接続できなかったカメラは除いて監視する（1台も接続できなければ終了）
+        phase = time.perf_counter()
+        failed = {}
+        for camera_config, future in zip(camera_configs, camera_futures):
+            try:
+                self.cameras.append(future.result())
+            except Exception as e:
+                failed[camera_config['name']] = f"{type(e).__name__}: {e}"
+                print(f"❌ カメラ {camera_config['name']}（{camera_config.get('host')}）に接続できません: {e}")
+        executor.shutdown()
+        self.startup_times['カメラ接続待ち'] = time.perf_counter() - phase
+        if failed:
+            self.send_emergency_alert("カメラ接続失敗", {
+                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'cameras': failed
+            })
+        if not self.cameras:
+            if isinstance(self.detector, (BatchingDetector, InferenceServer)):
+                self.detector.close()
+            self.alert_dispatcher.flush()
+            self.alert_dispatcher.stop()
+            raise SystemExit("❌ 接続できたカメラがないため終了します")
+        
+        # 検出モデルはカメラ接続と並行して読み込み、使えなければ監視を始めない
+        phase = time.perf_counter()
+        self.wait_for_detector()
+        self.startup_times['検出モデル待ち'] = time.perf_counter() - phase
+        
+        self.startup_times['合計'] = time.perf_counter() - started
+        self.print_startup_times()
+        print(f"✅ 見守りハロ起動完了（カメラ{len(self.cameras)}台）")
+    
+    def print_startup_times(self):
+        """起動時間の内訳を表示"""
+        print(f"⏱️ 起動時間 {self.startup_times['合計']:.2f}秒")
+        for name, seconds in self.startup_times.items():
+            if name != '合計':
+                print(f"   {name}: {seconds:.2f}秒")
+        labels = {'connect': "接続", 'ptz_service': "PTZサービス", 'profiles': "プロファイル取得"}
+        for camera in self.cameras:
+            times = camera.startup_times
+            detail = " / ".join(
+                f"{labels[name]} {seconds:.2f}秒" for name, seconds in times.items() if name in labels
+            )
+            print(f"   カメラ {camera.name}: {detail}{'（キャッシュ）' if times.get('cached') else ''}")
+    
+    def report_detector_ready(self, detector):
+        """検出モデルの準備完了を表示（バックグラウンドスレッドから呼ばれる）"""
+        if detector.load_time is None:
+            print("❌ 検出モデルの読み込みに失敗しました")
+        elif detector.warmup_time is None:
+            print(f"❌ 検出モデルのウォームアップに失敗しました（読み込み {detector.load_time:.2f}秒）")
+        else:
+            print(f"🔥 検出モデル準備完了（読み込み {detector.load_time:.2f}秒 / ウォームアップ {detector.warmup_time:.2f}秒）")
+    
+    def wait_for_detector(self):
+        """バックグラウンドで読み込んだ検出モデル・推論プロセスを確認（失敗したら通知して終了）"""
+        try:
+            if self.warmup is not None:
+                self.warmup.wait()
+            elif isinstance(self.detector, InferenceServer):
+                timeout = CONFIG.get('inference', {}).get('start_timeout', 120.0)
+                if not self.detector.wait_ready(timeout):
+                    raise TimeoutError(f"推論プロセスの準備が{timeout}秒以内に終わりません")
+                print("🔥 推論プロセス準備完了")
+        except Exception as e:
+            self.send_emergency_alert("検出モデル異常", {
+                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'error': str(e)
+            })
+            self.alert_dispatcher.flush()
+            for camera in self.cameras:
+                camera.stop()
+            if isinstance(self.detector, (BatchingDetector, InferenceServer)):
+                self.detector.close()
+            self.alert_dispatcher.stop()
+            raise SystemExit(f"❌ 検出モデルを読み込めないため終了します: {e}")
+    
+    def load_today_data(self):
+        """本日のデータを読み込み"""
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        try:
+            data = self.store.load_day(today)
+            if data:
+                return data
+        except json.JSONDecodeError as e:
+            print(f"⚠️ JSONファイルが破損しています: {e}")
+            print(f"新しいデータファイルを作成します...")
+        except Exception as e:
+            print(f"⚠️ データ読み込みエラー: {e}")
+
+        # ファイルが存在しないか、破損している場合は新規作成
+        return {
+            "date": today,
+            "events": [],
+            "summary": empty_summary()
+        }
+    
+    def save_today_data(self):
+        """本日のサマリーを保存（イベントは検出ごとに追記済み）"""
+        with self.data_lock:
+            # 現在の監視状態もダッシュボードに伝える（全体は最も活発なカメラの状態）
+            states = {camera.name: camera.state for camera in self.cameras}
+            summary = self.today_data['summary']
+            summary['monitor_state'] = max(
+                states.values(), key=STATE_PRIORITY.index, default="not_detected"
+            )
+            summary['cameras'] = states
+            self.store.save_summary(self.today_data['date'], summary)
+    
+    def record_event(self, event):
+        """検出イベントを記録"""
+        with self.data_lock:
+            summary = self.today_data['summary']
+            self.today_data['events'].append(event)
+            self.store.append_event(self.today_data['date'], event)
+            summary['total_detections'] += 1
+            summary['last_activity'] = event['timestamp']
+            
+            if summary['first_activity'] is None:
+                summary['first_activity'] = event['timestamp']
+    
+    def record_fall(self, camera_name, timestamp):
+        """転倒検知を記録"""
+        with self.data_lock:
+            self.today_data['summary']['lying_events'] += 1
+            self.today_data['summary']['alerts'].append({
+                'type': 'fall_detection',
+                'camera': camera_name,
+                'timestamp': timestamp
+            })
+            self.save_today_data()
+    
     def send_emergency_alert(self, alert_type, data):
-        """緊急アラート送信"""
-        # TODO: メール送信実装
+        """緊急アラート送信（配信は別スレッド、監視ループは待たない）"""
         print(f"\n{'='*60}")
         print(f"🚨 緊急アラート: {alert_type}")
         print(f"時刻: {data['timestamp']}")
         print(f"詳細: {json.dumps(data, ensure_ascii=False, indent=2)}")
         print(f"{'='*60}\n")
         
-        # ログ記録
-        log_file = LOG_DIR / f"alerts_{datetime.now().strftime('%Y-%m')}.log"
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f"{data['timestamp']} - {alert_type}: {json.dumps(data, ensure_ascii=False)}\n")
+        # ログ記録・メール送信
+        self.alert_dispatcher.dispatch(alert_type, data)
+    
+    def write_missing_rollups(self):
+        """日次集計のない過去の日を集計（起動時）"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        existing = {rollup['date'] for rollup in self.store.load_rollups()}
+        
+        for date in self.store.dates():
+            if date >= today or date in existing:
+                continue
+            try:
+                data = self.store.load_day(date)
+            except json.JSONDecodeError:
+                continue
+            if data:
+                self.store.save_rollup(compute_rollup(data))
+                print(f"📅 {date} の日次集計を作成")
+    
+    def check_day_rollover(self):
+        """日付が変わったら前日分を締めて日次集計を保存"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self.data_lock:
+            if self.today_data['date'] == today:
+                return
+            
+            self.save_today_data()
+            self.store.save_rollup(compute_rollup(self.today_data))
+            print(f"📅 {self.today_data['date']} の日次集計を保存")
+            self.today_data = self.load_today_data()
+    
+    def purge_old_data(self):
+        """保持期間を過ぎたデータを削除（1日1回）"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self.data_lock:
+            if self.last_purge_date == today:
+                return
+            self.last_purge_date = today
+        
+        retention_days = CONFIG.get('privacy', {}).get('data_retention_days')
+        if retention_days:
+            removed = self.store.purge(retention_days)
+            if removed:
+                print(f"🗑️ 保持期間（{retention_days}日）を過ぎたデータを削除: {removed}件")
+    
+    def send_daily_report(self):
+        """日次レポート送信"""
+        self.check_day_rollover()
+        with self.data_lock:
+            date = self.today_data['date']
+            summary = json.loads(json.dumps(self.today_data['summary']))
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        lines = [
+            f"見守りハロ 日次レポート（{date}）",
+            "",
+            f"検出回数: {summary['total_detections']}回",
+            f"初回活動: {summary['first_activity'] or 'なし'}",
+            f"最終活動: {summary['last_activity'] or 'なし'}",
+            f"横たわり検知: {summary['lying_events']}回"
+        ]
+        if summary['alerts']:
+            lines += ["", "アラート:"]
+            lines += [f"- {alert['timestamp']} {alert['type']}" for alert in summary['alerts']]
+        text = "\n".join(lines)
+        
+        print(f"\n📨 日次レポート\n{text}\n")
+        self.alert_dispatcher.dispatch("日次レポート", {
+            'timestamp': now,
+            'date': date,
+            'summary': summary,
+            'text': text
+        }, kind='report')
+    
+    def check_morning_activity(self):
+        """朝の確認時刻までに活動がなければアラート"""
+        self.check_day_rollover()
+        with self.data_lock:
+            first_activity = self.today_data['summary']['first_activity']
+        if first_activity is not None:
+            print(f"☀️ 朝の確認: 活動あり（{first_activity}）")
+            return
+        
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.send_emergency_alert("朝の未活動", {
+            'timestamp': now,
+            'morning_check_time': CONFIG['alerts']['morning_check_time']
+        })
+        with self.data_lock:
+            self.today_data['summary']['alerts'].append({'type': 'morning_inactivity', 'timestamp': now})
+            self.save_today_data()
+    
+    def check_night_activity(self):
+        """夜間の時間帯（night_activity_start〜end）の活動を集計して通知"""
+        self.check_day_rollover()
+        start = CONFIG['alerts']['night_activity_start']
+        end = CONFIG['alerts']['night_activity_end']
+        
+        # 直近の開始時刻から次の終了時刻まで（日をまたぐ場合は前日分も含めてストアから読む）
+        now = datetime.now()
+        start_hour, start_minute = (int(part) for part in start.split(':'))
+        end_hour, end_minute = (int(part) for part in end.split(':'))
+        window_start = now.replace(hour=start_hour, minute=start_minute, second=0, microsecond=0)
+        if window_start > now:
+            window_start -= timedelta(days=1)
+        window_end = window_start.replace(hour=end_hour, minute=end_minute)
+        if window_end <= window_start:
+            window_end += timedelta(days=1)
+        since = window_start.strftime("%Y-%m-%d %H:%M:%S")
+        until = window_end.strftime("%Y-%m-%d %H:%M:%S")
+        
+        events = []
+        date = window_start.date()
+        while date <= window_end.date():
+            events += [
+                e for e in self.store.read_events(date.strftime("%Y-%m-%d"))
+                if since <= e.get('timestamp', '') < until
+            ]
+            date += timedelta(days=1)
+        events.sort(key=lambda e: e['timestamp'])
+        
+        with self.data_lock:
+            self.today_data['summary']['night_activity'] = len(events)
+            self.save_today_data()
+        if not events:
+            return
+        
+        text = (
+            f"{start}〜{end} に {len(events)}回の活動を検出しました"
+            f"（{events[0]['timestamp'][11:16]}〜{events[-1]['timestamp'][11:16]}）"
+        )
+        print(f"🌙 夜間の活動: {text}")
+        self.alert_dispatcher.dispatch("夜間の活動", {
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'count': len(events),
+            'text': text
+        }, kind='report')
+    
+    def print_schedule_stats(self):
+        """ジョブごとの遅れとPTZ操作ごとの遅延を表示"""
+        job_stats = dict(self.scheduler.stats())
+        for camera in self.cameras:
+            job_stats.update(camera.scheduler.stats())
+        for name, stats in sorted(job_stats.items()):
+            print(
+                f"⏱️ {name}: {stats['runs']}回 遅れ 平均{stats['mean_lateness']:.2f}秒"
+                f" / 最大{stats['max_lateness']:.2f}秒（所要 平均{stats['mean_duration']:.1f}秒）"
+            )
+        for camera in self.cameras:
+            for operation, stats in sorted(camera.ptz.client.stats().items()):
+                print(
+                    f"📡 {camera.name}/{operation}: {stats['calls']}回 平均{stats['mean'] * 1000:.0f}ms"
+                    f" / 最大{stats['max'] * 1000:.0f}ms（失敗 {stats['errors']}回）"
+                )
+    
+    def stop(self):
+        """全カメラと日次ジョブを停止（シグナルハンドラから呼ばれる）"""
+        self.scheduler.stop()
+        for camera in self.cameras:
+            camera.scheduler.stop()
     
     def run(self):
-        """メインループ"""
+        """メインループ（カメラごとのスキャンと日次ジョブを実行）"""
         print("\n🏠 見守りハロ - 監視開始")
-        print(f"間隔: {self.interval}秒")
+        print(f"間隔: {CONFIG['scan_intervals']['not_detected']}秒")
+        
+        # Ctrl+C / systemctl stop で待機中でもすぐに停止
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self.stop())
+        
+        for camera in self.cameras:
+            camera.start()
+        self.scheduler.call_daily(CONFIG['notifications']['daily_report_time'], 'daily_report', self.send_daily_report)
+        self.scheduler.call_daily(CONFIG['alerts']['morning_check_time'], 'morning_check', self.check_morning_activity)
+        self.scheduler.call_daily(CONFIG['alerts']['night_activity_end'], 'night_activity', self.check_night_activity)
         
         try:
-            while True:
-                # 夜間モードチェック
-                if self.is_night_mode():
-                    self.interval = CONFIG['scan_intervals']['night_mode']
-                    print(f"🌙 夜間モード（{self.interval}秒間隔）")
-                
-                # スキャン実行
-                print(f"\n🔍 スキャン開始 - {datetime.now().strftime('%H:%M:%S')}")
-                angle, image, person = self.scan_area()
-                
-                if person:
-                    self.handle_detection(angle, image, person)
-                else:
-                    print("❌ 未検出")
-                    self.state = "not_detected"
-                    self.interval = CONFIG['scan_intervals']['not_detected']
-                    print(f"次回: {self.interval}秒後")
-                
-                # データ保存
-                self.save_today_data()
-                
-                # 待機
-                time.sleep(self.interval)
-                
-        except KeyboardInterrupt:
+            self.scheduler.run()
+        finally:
             print("\n\n⏹️ 見守りハロを停止します...")
+            for camera in self.cameras:
+                camera.stop()
             self.save_today_data()
+            self.print_schedule_stats()
+            if isinstance(self.detector, BatchingDetector):
+                batch_stats = self.detector.stats()
+                print(f"🧮 共有推論: {batch_stats['batches']}回（平均{batch_stats['mean_batch']:.1f}枚/回）")
+                self.detector.close()
+            if isinstance(self.detector, InferenceServer):
+                server_stats = self.detector.stats()
+                print(f"🧮 推論プロセス: {server_stats['requests']}件（再起動{server_stats['restarts']}回）")
+                self.detector.close()
+            self.alert_dispatcher.stop()
 
 if __name__ == "__main__":
     # ディレクトリ作成
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - 動き検知ゲート
+前回推論時の画像と比べて変化がなければYOLO推論を省略する
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """角度ごとの参照画像との差分で推論の要否を判定
+
+    画像を縮小・グレースケール化・ぼかしてから前回推論時の参照画像と
+    比較し、pixel_threshold を超えて変化した画素の割合が threshold 未満なら
+    前回の検出結果を再利用する。max_skips 回連続で省略したら変化がなくても
+    推論し直す。カメラが到達したパン角度を渡した場合、前回推論時と
+    pan_tolerance 度より離れていれば（検出結果の座標がずれるため）推論し直す。
+    """
+
+    def __init__(self, threshold=0.01, pixel_threshold=25, width=160, max_skips=6, pan_tolerance=1.0):
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.width = width
+        self.max_skips = max_skips
+        self.pan_tolerance = pan_tolerance
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._pending = {}
+
+        # 統計
+        self.inferences = 0
+        self.skipped = 0
+
+    def _prepare(self, image):
+        """比較用の縮小グレースケール画像"""
+        height, width = image.shape[:2]
+        size = (self.width, max(1, round(height * self.width / width)))
+        small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed_ratio(self, reference, current):
+        """変化した画素の割合"""
+        diff = cv2.absdiff(reference, current)
+        return np.count_nonzero(diff > self.pixel_threshold) / diff.size
+
+    def reuse(self, key, image, pan=None):
+        """変化がなければ前回の検出結果を返す（推論が必要なら None）"""
+        current = self._prepare(image)
+        with self._lock:
+            self._pending[key] = (current, pan)
+            entry = self._entries.get(key)
+            if (
+                entry is None
+                or entry['skips'] >= self.max_skips
+                or (pan is not None and entry['pan'] is not None
+                    and abs(pan - entry['pan']) > self.pan_tolerance)
+                or entry['reference'].shape != current.shape
+                or self.changed_ratio(entry['reference'], current) >= self.threshold
+            ):
+                self.inferences += 1
+                return None
+
+            entry['skips'] += 1
+            self.skipped += 1
+            return entry['result']
+
+    def remember(self, key, result):
+        """推論結果と参照画像を保存"""
+        with self._lock:
+            pending = self._pending.pop(key, None)
+            if pending is not None:
+                reference, pan = pending
+                self._entries[key] = {'reference': reference, 'pan': pan, 'result': result, 'skips': 0}
+
+    def reset(self):
+        """参照画像をすべて破棄"""
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+
+    def stats(self):
+        total = self.inferences + self.skipped
+        return {
+            'inferences': self.inferences,
+            'skipped': self.skipped,
+            'skip_rate': self.skipped / total if total else 0.0
+        }
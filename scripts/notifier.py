@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - アラート送信
+監視ループを止めずにアラートをメール・ログ・Webhookへ配信する
+"""
+
+import heapq
+import json
+import os
+import queue
+import random
+import smtplib
+import ssl
+import threading
+import time
+import urllib.request
+import uuid
+from email.message import EmailMessage
+from pathlib import Path
+
+
+class LogSink:
+    """イベントストア（アラートログ / SQLite）への記録"""
+
+    name = 'log'
+    kinds = ('alert',)
+
+    def __init__(self, store):
+        self.store = store
+
+    def send(self, alert):
+        self.store.append_alert(alert['timestamp'], alert['type'], alert['data'])
+
+
+class EmailSink:
+    """SMTPによるメール通知（notifications.email）
+
+    465番ポートはSMTP over SSL、それ以外は STARTTLS で暗号化してから認証する。
+    どちらも証明書とホスト名を検証する。パスワードを設定している場合、
+    サーバーが STARTTLS に対応していなければ送信せず（パスワードを平文で
+    送らない）、認証（AUTH）に対応していなければ認証なしでは送らない。
+    ローカルの代替SMTPサーバーで確認するときだけ allow_plaintext_auth を
+    true にする。
+    """
+
+    name = 'email'
+    kinds = ('alert', 'report')
+
+    def __init__(self, email_config, timeout=10):
+        self.server = email_config.get('smtp_server', 'smtp.gmail.com')
+        self.port = int(email_config.get('smtp_port', 587))
+        self.sender = email_config.get('sender', '')
+        self.password = email_config.get('password', '')
+        self.recipient = email_config.get('recipient', '')
+        self.allow_plaintext_auth = email_config.get('allow_plaintext_auth', False)
+        self.timeout = timeout
+
+    def build_message(self, alert):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = self.recipient
+        if alert.get('kind') == 'report':
+            message['Subject'] = f"【見守りハロ】{alert['type']}"
+            message.set_content(alert['data'].get('text', ''))
+            return message
+
+        message['Subject'] = f"【見守りハロ】緊急アラート: {alert['type']}"
+        message.set_content(
+            f"緊急アラート: {alert['type']}\n"
+            f"時刻: {alert['timestamp']}\n\n"
+            f"詳細:\n{json.dumps(alert['data'], ensure_ascii=False, indent=2)}\n"
+        )
+        return message
+
+    def send(self, alert):
+        message = self.build_message(alert)
+        context = ssl.create_default_context()
+        if self.port == 465:
+            smtp = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout, context=context)
+        else:
+            smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        with smtp:
+            smtp.ehlo()
+            if self.port != 465:
+                if smtp.has_extn('starttls'):
+                    smtp.starttls(context=context)
+                    smtp.ehlo()
+                elif self.password and not self.allow_plaintext_auth:
+                    raise smtplib.SMTPNotSupportedError(
+                        f"{self.server}:{self.port} がSTARTTLSに対応していないため送信しません"
+                        "（平文での認証は allow_plaintext_auth で許可）"
+                    )
+            if self.password:
+                if smtp.has_extn('auth'):
+                    smtp.login(self.sender, self.password)
+                elif not self.allow_plaintext_auth:
+                    raise smtplib.SMTPNotSupportedError(
+                        f"{self.server}:{self.port} が認証（AUTH）に対応していないため送信しません"
+                    )
+            smtp.send_message(message)
+
+
+class WebhookSink:
+    """HTTP POST（JSON）による通知"""
+
+    name = 'webhook'
+    kinds = ('alert', 'report')
+
+    def __init__(self, url, timeout=10, headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers or {}
+
+    def send(self, alert):
+        body = json.dumps(
+            {
+                'kind': alert.get('kind', 'alert'), 'type': alert['type'],
+                'timestamp': alert['timestamp'], 'data': alert['data']
+            },
+            ensure_ascii=False
+        ).encode('utf-8')
+        request = urllib.request.Request(
+            self.url, data=body, method='POST',
+            headers={'Content-Type': 'application/json', **self.headers}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+# notifications.sinks で追加できる通知先
+SINK_TYPES = {
+    'webhook': WebhookSink
+}
+
+
+class AlertDispatcher:
+    """非同期のアラート配信
+
+    dispatch() はアラートを送信待ちディレクトリ（spool）に書き出して
+    上限付きキューに積むだけで、すぐに戻る。配信はワーカースレッドが行い、
+    失敗した通知先だけを指数バックオフ（ジッター付き）で再送する。
+    送信待ちのアラートは1件1ファイルで保存し、全通知先への配信が済むまで
+    削除しないため、再起動しても未送信分は起動時に再送される。
+    再送上限に達したアラートは *.failed.json として残す。
+    """
+
+    def __init__(self, sinks, spool_dir, queue_size=100, max_retries=8,
+                 backoff_base=5.0, backoff_max=600.0):
+        self.sinks = {}
+        for sink in sinks:
+            self.add_sink(sink)
+        self.spool_dir = Path(spool_dir)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = []  # (next_try, id, alert) のヒープ
+        self._known = set()
+        self._rescan = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # 統計
+        self.stats_lock = threading.Lock()
+        self.delivered = 0
+        self.retries = 0
+        self.failed = 0
+        self.overflows = 0
+
+    def add_sink(self, sink):
+        """通知先を追加（name と send(alert) を持つオブジェクト）
+
+        kinds 属性で受け取る種類（'alert' / 'report'）を限定できる。
+        """
+        name = sink.name
+        suffix = 2
+        while name in self.sinks:
+            name = f"{sink.name}{suffix}"
+            suffix += 1
+        self.sinks[name] = sink
+        return name
+
+    def _spool_path(self, alert_id):
+        return self.spool_dir / f"{alert_id}.json"
+
+    def _write_spool(self, alert):
+        """送信待ちファイルを原子的に保存"""
+        path = self._spool_path(alert['id'])
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(alert, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _load_spool(self):
+        """送信待ちファイルのうち未読み込みのものを返す"""
+        alerts = []
+        for path in sorted(self.spool_dir.glob("*.json")):
+            if path.name.endswith(".failed.json") or path.stem in self._known:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    alerts.append(json.load(f))
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"⚠️ 送信待ちアラートを読み込めません: {path.name} ({e})")
+        return alerts
+
+    def start(self):
+        """配信スレッドを開始（前回の未送信分も再送）"""
+        if self._thread is not None:
+            return self
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        for alert in self._load_spool():
+            self._schedule(alert)
+        if self._pending:
+            print(f"📮 未送信のアラート {len(self._pending)}件を再送します")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """配信スレッドを停止（未送信分は送信待ちファイルに残る）"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def dispatch(self, alert_type, data, kind='alert'):
+        """アラート（kind='report' なら日次レポート等の通知）を送信待ちに追加（ブロックしない）"""
+        pending = [
+            name for name, sink in self.sinks.items()
+            if kind in getattr(sink, 'kinds', ('alert', 'report'))
+        ]
+        if not pending:
+            return None
+
+        alert = {
+            'id': f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}",
+            'kind': kind,
+            'type': alert_type,
+            'timestamp': data['timestamp'],
+            'data': data,
+            'pending': pending,
+            'attempts': 0,
+            'next_try': time.time()
+        }
+        self._write_spool(alert)
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            # 送信待ちファイルには保存済みなので、配信スレッドに読み直させる
+            with self.stats_lock:
+                self.overflows += 1
+            self._rescan.set()
+        return alert['id']
+
+    def _schedule(self, alert):
+        self._known.add(alert['id'])
+        heapq.heappush(self._pending, (alert['next_try'], alert['id'], alert))
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _deliver(self, alert):
+        """未配信の通知先へ送信し、結果を送信待ちファイルに反映"""
+        remaining = []
+        for name in alert['pending']:
+            sink = self.sinks.get(name)
+            if sink is None:
+                continue
+            try:
+                sink.send(alert)
+                with self.stats_lock:
+                    self.delivered += 1
+            except Exception as e:
+                print(f"⚠️ アラート送信失敗（{name}）: {e}")
+                remaining.append(name)
+
+        alert['pending'] = remaining
+        if not remaining:
+            self._spool_path(alert['id']).unlink(missing_ok=True)
+            self._known.discard(alert['id'])
+            return
+
+        alert['attempts'] += 1
+        if alert['attempts'] > self.max_retries:
+            print(f"❌ アラートを送信できませんでした（{', '.join(remaining)}）: {alert['type']}")
+            self._write_spool(alert)
+            os.replace(self._spool_path(alert['id']), self.spool_dir / f"{alert['id']}.failed.json")
+            self._known.discard(alert['id'])
+            with self.stats_lock:
+                self.failed += 1
+            return
+
+        alert['next_try'] = time.time() + self._backoff(alert['attempts'])
+        self._write_spool(alert)
+        self._schedule(alert)
+        with self.stats_lock:
+            self.retries += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            # 次の再送時刻まで新しいアラートを待つ
+            timeout = 1.0
+            if self._pending:
+                timeout = min(timeout, max(0.0, self._pending[0][0] - time.time()))
+            try:
+                alert = self._queue.get(timeout=timeout)
+                # 読み直しで配信済みのものは送信待ちファイルが消えている
+                if alert['id'] not in self._known and self._spool_path(alert['id']).exists():
+                    self._schedule(alert)
+            except queue.Empty:
+                pass
+
+            if self._rescan.is_set():
+                self._rescan.clear()
+                for alert in self._load_spool():
+                    self._schedule(alert)
+
+            now = time.time()
+            while self._pending and self._pending[0][0] <= now and not self._stop.is_set():
+                _, _, alert = heapq.heappop(self._pending)
+                self._deliver(alert)
+
+    def flush(self, timeout=10.0):
+        """送信待ちがなくなるまで待つ（テスト・終了時用）"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._queue.empty() and not self._known:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'pending': len(self._known) + self._queue.qsize(),
+                'delivered': self.delivered,
+                'retries': self.retries,
+                'failed': self.failed,
+                'overflows': self.overflows
+            }
+
+
+def create_dispatcher(config, store, data_dir):
+    """設定に応じた通知先でアラート配信を生成"""
+    notifications = config.get('notifications', {})
+    dispatch_config = notifications.get('dispatch', {})
+    timeout = dispatch_config.get('timeout', 10)
+
+    sinks = [LogSink(store)]
+    email_config = notifications.get('email', {})
+    if email_config.get('enabled') and email_config.get('recipient'):
+        sinks.append(EmailSink(email_config, timeout=timeout))
+    for sink_config in notifications.get('sinks', []):
+        options = dict(sink_config)
+        sink_type = options.pop('type', None)
+        if sink_type not in SINK_TYPES:
+            raise ValueError(f"未対応の通知先: {sink_type}")
+        options.setdefault('timeout', timeout)
+        sinks.append(SINK_TYPES[sink_type](**options))
+
+    return AlertDispatcher(
+        sinks,
+        dispatch_config.get('spool_dir') or Path(data_dir) / "alert_spool",
+        queue_size=dispatch_config.get('queue_size', 100),
+        max_retries=dispatch_config.get('max_retries', 8),
+        backoff_base=dispatch_config.get('backoff_base', 5.0),
+        backoff_max=dispatch_config.get('backoff_max', 600.0)
+    )
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - ONVIF接続
+PTZサービスへの接続と、解決済みのサービスURL・プロファイルトークンのキャッシュ
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from onvif import ONVIFCamera
+from requests import Session
+from requests.adapters import HTTPAdapter
+from zeep.transports import Transport
+
+
+class CachedONVIFCamera(ONVIFCamera):
+    """サービスURL（xaddrs）をキャッシュから復元するONVIFカメラ
+
+    通常の ONVIFCamera は生成時に GetCapabilities とイベント購読で
+    サービスURLを問い合わせるため、キャッシュがあればそれを省略する。
+    """
+
+    def __init__(self, *args, xaddrs=None, **kwargs):
+        self._cached_xaddrs = xaddrs
+        super().__init__(*args, **kwargs)
+
+    def update_xaddrs(self):
+        if not self._cached_xaddrs:
+            return super().update_xaddrs()
+        self.dt_diff = None
+        self.xaddrs = dict(self._cached_xaddrs)
+
+
+def create_transport(timeout=5.0):
+    """キープアライブで接続を使い回すSOAPトランスポート
+
+    zeep は既定でサービスごとに別のセッションを作るため、カメラ1台の
+    全サービスで1つのセッション（接続プール）を共有する。
+    """
+    session = Session()
+    session.headers['Connection'] = 'keep-alive'
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return Transport(session=session, timeout=timeout, operation_timeout=timeout)
+
+
+class OnvifCache:
+    """カメラごとのサービスURLとプロファイルトークン（data/onvif_cache.json）"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._entries = {}
+
+    @staticmethod
+    def key(camera_config):
+        return f"{camera_config['host']}:{camera_config['onvif_port']}"
+
+    def get(self, camera_config):
+        with self._lock:
+            return self._entries.get(self.key(camera_config))
+
+    def set(self, camera_config, entry):
+        with self._lock:
+            self._entries[self.key(camera_config)] = entry
+            self._save()
+
+    def delete(self, camera_config):
+        with self._lock:
+            if self._entries.pop(self.key(camera_config), None) is not None:
+                self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def connect_ptz(camera_config, cache=None):
+    """PTZサービスに接続
+
+    キャッシュがあればサービスURLの問い合わせと GetProfiles を省略する。
+    SOAPの送信はキープアライブのセッションを共有する。
+    戻り値は (ONVIFカメラ, PTZサービス, プロファイルトークン, 所要時間の内訳)。
+    """
+    args = (
+        camera_config['host'],
+        camera_config['onvif_port'],
+        camera_config['username'],
+        camera_config['password']
+    )
+    transport = create_transport(camera_config.get('onvif_timeout', 5.0))
+    timings = {}
+
+    entry = cache.get(camera_config) if cache is not None else None
+    if entry:
+        start = time.perf_counter()
+        try:
+            camera = CachedONVIFCamera(*args, xaddrs=entry['xaddrs'], transport=transport)
+            ptz_service = camera.create_ptz_service()
+            timings['ptz_service'] = time.perf_counter() - start
+            timings['cached'] = True
+            return camera, ptz_service, entry['profile_token'], timings
+        except Exception as e:
+            print(f"⚠️ ONVIFキャッシュが使えません（{camera_config['host']}）: {e}")
+            cache.delete(camera_config)
+
+    start = time.perf_counter()
+    camera = ONVIFCamera(*args, transport=transport)
+    timings['connect'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ptz_service = camera.create_ptz_service()
+    timings['ptz_service'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    media_service = camera.create_media_service()
+    ptz_token = media_service.GetProfiles()[0].token
+    timings['profiles'] = time.perf_counter() - start
+    timings['cached'] = False
+
+    if cache is not None:
+        cache.set(camera_config, {'xaddrs': camera.xaddrs, 'profile_token': ptz_token})
+    return camera, ptz_service, ptz_token, timings
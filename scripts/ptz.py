@@ -0,0 +1,650 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - PTZ制御
+ONVIFの絶対位置移動と位置フィードバックによるカメラ制御、
+PID制御による人物追尾、動作確認用の模擬PTZカメラ
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class PTZClient:
+    """ONVIF PTZ の呼び出し（要求オブジェクトの再利用・非同期送信・遅延の計測）
+
+    要求オブジェクトは操作ごとに最初の1回だけ create_type で作り、以降は
+    座標の値だけを書き換えて使い回す。send_async() の移動指令は送信スレッドが
+    送り、未送信の指令は新しい指令で置き換える（最新の指令だけを送る）。
+    duration 付きの指令は、期限までに次の指令がなければ送信スレッドが Stop を送る。
+    同期呼び出しは世代を進め、それより前に取り出した非同期指令は送らない
+    （同期の Stop の後に古い移動指令が届かないようにする）。
+    """
+
+    VECTOR_FIELDS = {'ContinuousMove': 'Velocity', 'AbsoluteMove': 'Position', 'RelativeMove': 'Translation'}
+    QUERY_OPERATIONS = ('GetStatus', 'GetPresets')
+
+    def __init__(self, ptz_service, profile_token):
+        self.service = ptz_service
+        self.token = profile_token
+        self._requests = {}
+        self._send_lock = threading.Lock()  # 同期呼び出しと送信スレッドの送信順を保つ
+        self._cond = threading.Condition()
+        self._pending = None  # (操作名, x, y, 停止期限)
+        self._stop_at = None
+        self._generation = 0  # 同期呼び出しのたびに進める
+        self._thread = None
+        self._running = True
+
+        # 統計（操作名 → 回数・失敗・合計・最大・直近の秒数）
+        self.latency = {}
+        self.superseded = 0  # 送信前に新しい指令で置き換えた数
+
+    def _request(self, operation):
+        request = self._requests.get(operation)
+        if request is None:
+            request = self.service.create_type(operation)
+            request.ProfileToken = self.token
+            field = self.VECTOR_FIELDS.get(operation)
+            if field is not None:
+                setattr(request, field, {'PanTilt': {'x': 0.0, 'y': 0.0}})
+            self._requests[operation] = request
+        return request
+
+    def _record(self, operation, elapsed, failed):
+        stats = self.latency.setdefault(
+            operation, {'calls': 0, 'errors': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0}
+        )
+        stats['calls'] += 1
+        stats['errors'] += failed
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+        stats['last'] = elapsed
+
+    def _send(self, operation, x, y, fields=None, generation=None):
+        with self._send_lock:
+            if generation is not None and generation != self._generation:
+                # 取り出した後に同期呼び出しがあった非同期指令は送らない
+                self.superseded += 1
+                return None
+            request = self._request(operation)
+            field = self.VECTOR_FIELDS.get(operation)
+            if field is not None:
+                pan_tilt = getattr(request, field)['PanTilt']
+                pan_tilt['x'] = x
+                pan_tilt['y'] = y
+            for name, value in (fields or {}).items():
+                setattr(request, name, value)
+            start = time.perf_counter()
+            try:
+                result = getattr(self.service, operation)(request)
+            except Exception:
+                self._record(operation, time.perf_counter() - start, True)
+                raise
+            self._record(operation, time.perf_counter() - start, False)
+            return result
+
+    def call(self, operation, x=0.0, y=0.0, **fields):
+        """同期呼び出し（問い合わせ以外は未送信の非同期指令と停止期限を取り消す）"""
+        if operation not in self.QUERY_OPERATIONS:
+            with self._cond:
+                self._pending = None
+                self._stop_at = None
+                self._generation += 1
+        return self._send(operation, x, y, fields)
+
+    def send_async(self, operation, x=0.0, y=0.0, duration=None):
+        """移動指令を送信スレッドに渡して待たずに戻る"""
+        deadline = time.monotonic() + duration if duration is not None else None
+        with self._cond:
+            if self._pending is not None:
+                self.superseded += 1
+            self._pending = (operation, x, y, deadline)
+            self._stop_at = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ptz-sender", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._pending is None and (
+                    self._stop_at is None or time.monotonic() < self._stop_at
+                ):
+                    timeout = None if self._stop_at is None else self._stop_at - time.monotonic()
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+                generation = self._generation
+                if self._pending is not None:
+                    operation, x, y, self._stop_at = self._pending
+                    self._pending = None
+                else:
+                    operation, x, y = 'Stop', 0.0, 0.0
+                    self._stop_at = None
+            try:
+                self._send(operation, x, y, generation=generation)
+            except Exception as e:
+                print(f"⚠️ PTZ {operation} の送信に失敗: {e}")
+
+    def close(self):
+        """送信スレッドを停止"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self):
+        """操作ごとの遅延（秒）"""
+        return {
+            operation: {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'mean': stats['total'] / stats['calls'],
+                'max': stats['max'],
+                'last': stats['last']
+            }
+            for operation, stats in self.latency.items()
+        }
+
+
+class PTZController:
+    """ONVIF PTZ のカメラ制御
+
+    角度（度）は汎用空間の正規化座標（-1〜1）に pan_limit 度を掛けたものとして扱う。
+    AbsoluteMove → RelativeMove（GetStatus で現在位置が取れる場合）→
+    ContinuousMove の時間制御、の順に使えるものを使い、未対応の操作は
+    最初の失敗で記録して以降は試さない。時間制御では推定位置からの差分だけ動かす。
+    ONVIFの呼び出しは PTZClient を通す。
+    """
+
+    def __init__(self, ptz_service, profile_token, pan_limit=180.0, speed=0.3,
+                 degrees_per_second=200.0, tolerance=1.0, move_timeout=5.0, idle_grace=0.3,
+                 mode='auto'):
+        self.client = PTZClient(ptz_service, profile_token)
+        self.pan_limit = pan_limit
+        self.speed = speed
+        self.degrees_per_second = degrees_per_second  # 速度1.0での角速度（時間制御用）
+        self.tolerance = tolerance
+        self.move_timeout = move_timeout
+        self.idle_grace = idle_grace  # 移動開始前の停止状態を完了と誤認しない時間
+
+        # 対応状況（None = 未確認）
+        modes = ('absolute', 'relative', 'status', 'presets')
+        if mode == 'auto':
+            self.supports = dict.fromkeys(modes)
+        else:
+            self.supports = {name: name == mode for name in modes}
+            self.supports['status'] = mode != 'continuous'
+            self.supports['presets'] = None
+
+        self.estimated_pan = 0.0  # 時間制御で動かしたときの推定位置
+        self.moving = False
+        self._motion = None  # 連続移動中の (開始時刻, 速度, 継続時間)
+
+    def _to_normalized(self, degrees):
+        return max(-1.0, min(1.0, degrees / self.pan_limit))
+
+    def _try(self, operation, func):
+        """未対応の操作なら False（例外は対応済みと判明している操作でのみ送出）"""
+        if self.supports.get(operation) is False:
+            return False
+        try:
+            func()
+        except Exception as e:
+            if self.supports.get(operation):
+                raise
+            print(f"ℹ️ PTZ {operation} は使えません（{e}）")
+            self.supports[operation] = False
+            return False
+        self.supports[operation] = True
+        return True
+
+    def status(self):
+        """現在位置（パン角度, 移動中か）。取得できなければ None"""
+        if self.supports.get('status') is False:
+            return None
+        result = {}
+
+        def get_status():
+            status = self.client.call('GetStatus')
+            result['pan'] = status.Position.PanTilt.x * self.pan_limit
+            move_status = getattr(status, 'MoveStatus', None)
+            pan_tilt = getattr(move_status, 'PanTilt', None) if move_status is not None else None
+            result['moving'] = str(pan_tilt).upper() == 'MOVING'
+
+        if not self._try('status', get_status):
+            return None
+        return result['pan'], result['moving']
+
+    @property
+    def has_feedback(self):
+        """GetStatus で移動の完了を確認できるか"""
+        return self.supports.get('status') is True
+
+    def _motion_degrees(self):
+        """連続移動の開始からの推定移動量（度）"""
+        if self._motion is None:
+            return 0.0
+        started, pan_speed, duration = self._motion
+        elapsed = time.monotonic() - started
+        if duration is not None:
+            elapsed = min(elapsed, duration)
+        return pan_speed * self.degrees_per_second * elapsed
+
+    def _end_motion(self):
+        self.estimated_pan = max(-self.pan_limit, min(self.pan_limit, self.estimated_pan + self._motion_degrees()))
+        self._motion = None
+
+    def estimate(self):
+        """GetStatus を呼ばずに推定した現在のパン角度（連続移動中は速度から推定）"""
+        return max(-self.pan_limit, min(self.pan_limit, self.estimated_pan + self._motion_degrees()))
+
+    def position(self):
+        """現在のパン角度（取得できなければ推定値）"""
+        status = self.status()
+        return status[0] if status is not None else self.estimated_pan
+
+    def wait_until(self, target, timeout=None):
+        """GetStatus で目標角度への到達（または移動の完了）を待つ
+
+        指令直後はまだ停止状態が返ることがあるため、移動中を一度見るか
+        idle_grace 秒が経つまでは停止を完了とみなさない。
+        """
+        start = time.monotonic()
+        deadline = start + (timeout or self.move_timeout)
+        pan = None
+        seen_moving = False
+        while time.monotonic() < deadline:
+            status = self.status()
+            if status is None:
+                return None
+            pan, moving = status
+            if abs(pan - target) <= self.tolerance:
+                return pan
+            if moving:
+                seen_moving = True
+            elif seen_moving or time.monotonic() - start > self.idle_grace:
+                return pan
+            time.sleep(0.05)
+        return pan
+
+    def goto(self, angle):
+        """指定角度へ移動して到達した角度を返す"""
+        self._end_motion()
+
+        def absolute_move():
+            self.client.call('AbsoluteMove', self._to_normalized(angle))
+
+        if self._try('absolute', absolute_move):
+            pan = self.wait_until(angle)
+            if pan is None:
+                # 位置が取れないカメラは移動量から所要時間を見積もる
+                time.sleep(abs(angle - self.estimated_pan) / (self.degrees_per_second * self.speed))
+                pan = angle
+            self.estimated_pan = pan
+            return pan
+
+        current = self.status()
+        if current is not None:
+            delta = angle - current[0]
+
+            def relative_move():
+                self.client.call('RelativeMove', delta / self.pan_limit)
+
+            if abs(delta) <= self.tolerance:
+                self.estimated_pan = current[0]
+                return current[0]
+            if self._try('relative', relative_move):
+                pan = self.wait_until(angle)
+                self.estimated_pan = pan if pan is not None else angle
+                return self.estimated_pan
+
+        # 時間制御（推定位置からの差分だけ動かす）
+        delta = angle - self.estimated_pan
+        if abs(delta) > self.tolerance:
+            self.client.call('ContinuousMove', self.speed if delta > 0 else -self.speed)
+            self.moving = True
+            time.sleep(abs(delta) / (self.degrees_per_second * self.speed))
+            self.stop()
+        self.estimated_pan = angle
+        return angle
+
+    def presets(self):
+        """カメラに登録済みのプリセット（名前 → トークン）。未対応なら None"""
+        result = {}
+
+        def get_presets():
+            for preset in self.client.call('GetPresets') or []:
+                if getattr(preset, 'Name', None):
+                    result[preset.Name] = preset.token
+
+        if not self._try('presets', get_presets):
+            return None
+        return result
+
+    def register_presets(self, angles, prefix='mimamori'):
+        """角度ごとのプリセットを用意（角度 → トークン）
+
+        "{prefix}_{角度}" の名前で登録済みならそのまま使い、なければ
+        その角度へ移動して SetPreset で登録する（登録はカメラに残るため初回のみ）。
+        """
+        existing = self.presets()
+        if existing is None:
+            return {}
+        tokens = {}
+        for angle in dict.fromkeys(angles):
+            name = f"{prefix}_{angle:+g}"
+            token = existing.get(name)
+            if token is None:
+                self.goto(angle)
+                token = self.client.call('SetPreset', PresetName=name, PresetToken=None)
+                print(f"📌 プリセット登録: {name}")
+            tokens[angle] = token
+        return tokens
+
+    def goto_preset(self, token, angle):
+        """プリセット位置へ移動（angle はプリセットの角度）"""
+        self._end_motion()
+        self.client.call('GotoPreset', PresetToken=token)
+        pan = self.wait_until(angle)
+        if pan is None:
+            time.sleep(abs(angle - self.estimated_pan) / (self.degrees_per_second * self.speed))
+            pan = angle
+        self.estimated_pan = pan
+        return pan
+
+    def velocity(self, pan_speed, tilt_speed=0.0, duration=None):
+        """連続移動を開始（送信を待たずに戻り、duration 秒後に停止）"""
+        self._end_motion()
+        self.client.send_async('ContinuousMove', pan_speed, tilt_speed, duration)
+        self.moving = pan_speed != 0 or tilt_speed != 0
+        if pan_speed != 0:
+            self._motion = (time.monotonic(), pan_speed, duration)
+
+    def stop(self):
+        """移動を停止"""
+        self._end_motion()
+        self.client.call('Stop')
+        self.moving = False
+
+    def close(self):
+        self.client.close()
+
+
+class PIDController:
+    """PID制御（出力と積分値は上下限で制限）"""
+
+    def __init__(self, kp, ki=0.0, kd=0.0, output_limit=1.0, integral_limit=None):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_limit = output_limit
+        self.integral_limit = integral_limit if integral_limit is not None else output_limit
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.previous_error = None
+
+    def update(self, error, dt):
+        """誤差と経過時間（秒）から操作量を計算"""
+        if dt > 0 and self.ki:
+            self.integral += error * dt
+            limit = self.integral_limit / self.ki
+            self.integral = max(-limit, min(limit, self.integral))
+        derivative = 0.0
+        if dt > 0 and self.previous_error is not None:
+            derivative = (error - self.previous_error) / dt
+        self.previous_error = error
+
+        output = self.kp * error + self.ki * self.integral + self.kd * derivative
+        return max(-self.output_limit, min(self.output_limit, output))
+
+
+class PanTracker:
+    """画面中心からの横ずれをPID制御でパン速度に変換
+
+    update() は最新フレームでのずれ（画面半幅で正規化、-1〜1）を受け取り、
+    速度が min_change 以上変わったとき（または指令から hold/2 秒経ったとき）だけ
+    ContinuousMove を送る。各指令は hold 秒で停止するため、推論が止まっても
+    カメラが回り続けない。deadband 以内に入ったら停止して積分値を戻す。
+    固定の待ち時間はない。
+    """
+
+    def __init__(self, controller, pid, deadband=0.1, min_change=0.02, hold=1.0):
+        self.controller = controller
+        self.pid = pid
+        self.deadband = deadband
+        self.min_change = min_change
+        self.hold = hold
+        self.last_time = None
+        self.last_sent = None
+        self.current_speed = 0.0
+
+    def update(self, error, now=None):
+        now = time.monotonic() if now is None else now
+        dt = now - self.last_time if self.last_time is not None else 0.0
+        self.last_time = now
+
+        if abs(error) < self.deadband:
+            self.pid.reset()
+            if self.current_speed != 0.0:
+                self.controller.stop()
+                self.current_speed = 0.0
+                self.last_sent = None
+            return 0.0
+
+        speed = self.pid.update(error, dt)
+        expiring = self.last_sent is not None and now - self.last_sent > self.hold / 2
+        if abs(speed - self.current_speed) >= self.min_change or expiring:
+            self.controller.velocity(speed, duration=self.hold)
+            self.current_speed = speed
+            self.last_sent = now
+        return self.current_speed
+
+    def stop(self):
+        if self.current_speed != 0.0 or self.controller.moving:
+            self.controller.stop()
+        self.current_speed = 0.0
+        self.pid.reset()
+        self.last_time = None
+        self.last_sent = None
+
+
+class SimulatedPTZService:
+    """ONVIF PTZサービスの模擬（動作確認用）
+
+    zeep のPTZサービスと同じ呼び出し方で ContinuousMove / Stop /
+    AbsoluteMove / RelativeMove / GetStatus / プリセット操作に応答し、パン位置を
+    時間で積分する。supports で未対応の操作を指定でき、latency で
+    呼び出しごとの通信遅延を再現する。
+    """
+
+    def __init__(self, pan_limit=180.0, max_speed=200.0, latency=0.0,
+                 supports=('absolute', 'relative', 'status', 'presets')):
+        self.pan_limit = pan_limit
+        self.max_speed = max_speed  # 速度1.0での角速度（度/秒）
+        self.latency = latency
+        self.supports = set(supports)
+        self._lock = threading.Lock()
+        self._pan = 0.0
+        self._velocity = 0.0
+        self._target = None
+        self._time = time.monotonic()
+        self._presets = {}  # トークン → (名前, パン角度)
+        self.calls = {}
+
+    def _advance(self):
+        now = time.monotonic()
+        dt = now - self._time
+        self._time = now
+        if self._target is not None:
+            step = self.max_speed * dt
+            diff = self._target - self._pan
+            if abs(diff) <= step:
+                self._pan = self._target
+                self._target = None
+            else:
+                self._pan += step if diff > 0 else -step
+        else:
+            self._pan += self._velocity * self.max_speed * dt
+        self._pan = max(-self.pan_limit, min(self.pan_limit, self._pan))
+
+    def _call(self, name):
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls[name] = self.calls.get(name, 0) + 1
+        key = {
+            'AbsoluteMove': 'absolute', 'RelativeMove': 'relative', 'GetStatus': 'status',
+            'GetPresets': 'presets', 'SetPreset': 'presets', 'GotoPreset': 'presets'
+        }.get(name)
+        if key is not None and key not in self.supports:
+            raise RuntimeError(f"{name} is not supported")
+        self._advance()
+
+    @property
+    def pan(self):
+        with self._lock:
+            self._advance()
+            return self._pan
+
+    def create_type(self, name):
+        return SimpleNamespace()
+
+    def ContinuousMove(self, request):
+        with self._lock:
+            self._call('ContinuousMove')
+            self._target = None
+            self._velocity = request.Velocity['PanTilt']['x']
+
+    def Stop(self, request):
+        with self._lock:
+            self._call('Stop')
+            self._target = None
+            self._velocity = 0.0
+
+    def AbsoluteMove(self, request):
+        with self._lock:
+            self._call('AbsoluteMove')
+            self._velocity = 0.0
+            self._target = request.Position['PanTilt']['x'] * self.pan_limit
+
+    def RelativeMove(self, request):
+        with self._lock:
+            self._call('RelativeMove')
+            self._velocity = 0.0
+            self._target = self._pan + request.Translation['PanTilt']['x'] * self.pan_limit
+
+    def GetPresets(self, request):
+        with self._lock:
+            self._call('GetPresets')
+            return [SimpleNamespace(Name=name, token=token) for token, (name, _) in self._presets.items()]
+
+    def SetPreset(self, request):
+        with self._lock:
+            self._call('SetPreset')
+            token = request.PresetToken or str(len(self._presets) + 1)
+            self._presets[token] = (request.PresetName, self._pan)
+            return token
+
+    def GotoPreset(self, request):
+        with self._lock:
+            self._call('GotoPreset')
+            self._velocity = 0.0
+            self._target = self._presets[request.PresetToken][1]
+
+    def GetStatus(self, request):
+        with self._lock:
+            self._call('GetStatus')
+            moving = self._target is not None or self._velocity != 0
+            return SimpleNamespace(
+                Position=SimpleNamespace(PanTilt=SimpleNamespace(x=self._pan / self.pan_limit, y=0.0)),
+                MoveStatus=SimpleNamespace(PanTilt='MOVING' if moving else 'IDLE')
+            )
+
+
+class SimulatedCamera:
+    """模擬PTZカメラの映像（人物に見立てた白い矩形を描画）
+
+    person_angle の方向にいる人物を、水平画角 fov の映像として描く。
+    """
+
+    def __init__(self, service, person_angle=0.0, fov=60.0, size=(640, 360)):
+        self.service = service
+        self.person_angle = person_angle
+        self.fov = fov
+        self.width, self.height = size
+
+    def frame(self):
+        image = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        offset = (self.person_angle - self.service.pan) / (self.fov / 2)
+        center_x = int(self.width / 2 * (1 + offset))
+        half_w = self.width // 20
+        if -half_w < center_x < self.width + half_w:
+            image[self.height // 4:self.height * 3 // 4,
+                  max(0, center_x - half_w):min(self.width, center_x + half_w)] = 255
+        return image
+
+    @staticmethod
+    def detect(image):
+        """白い矩形を人物として検出（detection と同じ形式）"""
+        columns = np.flatnonzero(image[:, :, 0].max(axis=0) > 0)
+        rows = np.flatnonzero(image[:, :, 0].max(axis=1) > 0)
+        if columns.size == 0:
+            return []
+        bbox = [float(columns[0]), float(rows[0]), float(columns[-1] + 1), float(rows[-1] + 1)]
+        return [{'bbox': bbox, 'confidence': 1.0, 'posture': 'standing', 'aspect_ratio': 2.0}]
+
+
+def simulate_tracking(person_angle=20.0, latency=0.02, inference_time=0.05, duration=3.0):
+    """模擬カメラで追尾を実行し、中心に捕捉するまでの時間を返す"""
+    service = SimulatedPTZService(latency=latency)
+    camera = SimulatedCamera(service, person_angle=person_angle)
+    controller = PTZController(service, 'sim')
+    tracker = PanTracker(controller, PIDController(kp=0.6, ki=0.1, kd=0.05, output_limit=0.5), deadband=0.05)
+
+    start = time.monotonic()
+    centered_at = None
+    while time.monotonic() - start < duration:
+        image = camera.frame()
+        time.sleep(inference_time)
+        persons = SimulatedCamera.detect(image)
+        if not persons:
+            break
+        x1, _, x2, _ = persons[0]['bbox']
+        error = ((x1 + x2) / 2 - camera.width / 2) / (camera.width / 2)
+        tracker.update(error)
+        if abs(error) < tracker.deadband and centered_at is None:
+            centered_at = time.monotonic() - start
+    tracker.stop()
+    controller.close()
+    return centered_at, service.pan, controller.client.stats()
+
+
+if __name__ == "__main__":
+    service = SimulatedPTZService(latency=0.02)
+    controller = PTZController(service, 'sim')
+    for angle in (-30, 0, 30, 0):
+        start = time.monotonic()
+        reached = controller.goto(angle)
+        print(f"📐 goto {angle:>4}° → {reached:6.1f}°（{time.monotonic() - start:.2f}秒）")
+    tokens = controller.register_presets((-30, 0, 30))
+    for angle in (-30, 0, 30, 0):
+        start = time.monotonic()
+        reached = controller.goto_preset(tokens[angle], angle)
+        print(f"📌 preset {angle:>4}° → {reached:6.1f}°（{time.monotonic() - start:.2f}秒）")
+    controller.close()
+
+    centered_at, pan, latency = simulate_tracking()
+    if centered_at is None:
+        print("❌ 中心に捕捉できませんでした")
+    else:
+        print(f"🎯 追尾: {centered_at:.2f}秒で中心に捕捉（パン {pan:.1f}°）")
+    for operation, stats in sorted(latency.items()):
+        print(f"📡 {operation}: {stats['calls']}回 平均{stats['mean'] * 1000:.1f}ms / 最大{stats['max'] * 1000:.1f}ms")
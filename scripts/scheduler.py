@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - タイマースケジューラ
+スキャン・転倒再確認・日次レポートなどの時刻指定ジョブを1本のループで実行する
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+
+class Job:
+    """予約済みジョブ（cancel() で取り消し）"""
+
+    __slots__ = ('name', 'due', 'func', 'args', 'cancelled')
+
+    def __init__(self, name, due, func, args):
+        self.name = name
+        self.due = due
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def next_daily(hhmm, after):
+    """after より後の最初の HH:MM（datetime）"""
+    hour, minute = (int(part) for part in hhmm.split(':'))
+    target = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= after:
+        target += timedelta(days=1)
+    return target
+
+
+def seconds_until(hhmm, now=None):
+    """次の HH:MM までの秒数（過ぎていれば翌日）"""
+    now = now or datetime.now()
+    return (next_daily(hhmm, now) - now).total_seconds()
+
+
+class Scheduler:
+    """ヒープによるタイマースケジューラ
+
+    ジョブは予定時刻（time.monotonic()）の順にヒープで管理し、run() を
+    呼んだスレッドで1件ずつ実行する。待機中も stop() や他スレッドからの
+    予約で即座に起きるため、長い待機中でも停止要求に反応できる。
+    ジョブごとに予定時刻からの遅れ（lateness）を記録する。
+    """
+
+    def __init__(self, late_warning=5.0):
+        self.late_warning = late_warning
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._stats = {}
+
+    def call_later(self, delay, name, func, *args):
+        """delay 秒後に func(*args) を実行"""
+        job = Job(name, time.monotonic() + max(0.0, delay), func, args)
+        with self._cond:
+            heapq.heappush(self._heap, (job.due, next(self._counter), job))
+            self._cond.notify()
+        return job
+
+    def call_daily(self, hhmm, name, func, *args):
+        """毎日 HH:MM に func(*args) を実行
+
+        次回は前回の予定時刻（壁時計）より後の HH:MM とするため、時計のずれで
+        予定より少し早く起きても同じ日に2回実行しない。待ち時間は時計の変更に
+        追従するよう予約のたびに壁時計から求める。
+        """
+        def schedule(after):
+            target = next_daily(hhmm, after)
+
+            def run_daily():
+                try:
+                    func(*args)
+                finally:
+                    # 大きく遅れた場合は過ぎた日の分を実行し直さない
+                    schedule(max(target, datetime.now()))
+
+            return self.call_later((target - datetime.now()).total_seconds(), name, run_daily)
+
+        return schedule(datetime.now())
+
+    def stop(self):
+        """run() を終了させる（シグナルハンドラからも呼べる）"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def _next_job(self):
+        """次に実行するジョブを待って取り出す（停止時は None）"""
+        with self._cond:
+            while not self._stopped:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                if self._heap:
+                    remaining = self._heap[0][0] - time.monotonic()
+                    if remaining <= 0:
+                        return heapq.heappop(self._heap)[2]
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+            return None
+
+    def _record(self, name, lateness, duration):
+        stats = self._stats.setdefault(name, {
+            'runs': 0, 'lateness_sum': 0.0, 'max_lateness': 0.0,
+            'last_lateness': 0.0, 'duration_sum': 0.0
+        })
+        stats['runs'] += 1
+        stats['lateness_sum'] += lateness
+        stats['max_lateness'] = max(stats['max_lateness'], lateness)
+        stats['last_lateness'] = lateness
+        stats['duration_sum'] += duration
+
+    def run(self):
+        """stop() が呼ばれるまでジョブを実行"""
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+
+            start = time.monotonic()
+            lateness = start - job.due
+            if lateness > self.late_warning:
+                print(f"⏱️ {job.name} が {lateness:.1f}秒遅れて実行されました")
+            try:
+                job.func(*job.args)
+            except Exception:
+                print(f"⚠️ ジョブ {job.name} でエラーが発生しました")
+                traceback.print_exc()
+            self._record(job.name, lateness, time.monotonic() - start)
+
+    def pending(self):
+        """予約中のジョブ（名前, 残り秒数）"""
+        now = time.monotonic()
+        with self._cond:
+            return sorted(
+                (job.name, max(0.0, due - now))
+                for due, _, job in self._heap if not job.cancelled
+            )
+
+    def stats(self):
+        """ジョブごとの実行回数・遅れ（秒）・所要時間（秒）"""
+        return {
+            name: {
+                'runs': stats['runs'],
+                'mean_lateness': stats['lateness_sum'] / stats['runs'],
+                'max_lateness': stats['max_lateness'],
+                'last_lateness': stats['last_lateness'],
+                'mean_duration': stats['duration_sum'] / stats['runs']
+            }
+            for name, stats in self._stats.items()
+        }
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - 画像類似度
+同じ位置かの判定に使う人物領域の比較（SSIM・知覚ハッシュ・ヒストグラム）
+"""
+
+import cv2
+import numpy as np
+
+# 方式ごとの既定のしきい値（この値より大きければ同じとみなす）
+# 48x96 に縮小して比較した場合に、全解像度SSIMでの 0.85（従来の similarity_threshold）と
+# 判定が最もよく一致する値を benchmark.py similarity で較正したもの
+DEFAULT_THRESHOLDS = {
+    'ssim': 0.92,
+    'phash': 0.90,
+    'histogram': 0.93
+}
+
+# SSIM の窓の大きさと定数（skimage と同じ）
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+def to_gray(image):
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def ssim_box(gray1, gray2, window=SSIM_WINDOW):
+    """ボックスフィルタによるSSIMの平均値（SSIMマップは作らない）
+
+    skimage の structural_similarity（win_size=7, 一様窓）と同じ計算を
+    OpenCV のボックスフィルタで行い、窓が画像からはみ出す縁は平均から除く。
+    skimage と同じく、窓より小さい画像は ValueError とする。
+    """
+    if gray1.shape != gray2.shape:
+        raise ValueError(f"画像のサイズが異なります: {gray1.shape} {gray2.shape}")
+    if min(gray1.shape[:2]) < window:
+        raise ValueError(f"画像が小さすぎます（{window}x{window} 以上が必要）: {gray1.shape}")
+    x = gray1.astype(np.float32)
+    y = gray2.astype(np.float32)
+    size = (window, window)
+    # 標本分散に揃える（skimage の use_sample_covariance=True と同じ）
+    cov_norm = window * window / (window * window - 1)
+
+    mu_x = cv2.boxFilter(x, -1, size, borderType=cv2.BORDER_REFLECT)
+    mu_y = cv2.boxFilter(y, -1, size, borderType=cv2.BORDER_REFLECT)
+    var_x = cov_norm * (cv2.boxFilter(x * x, -1, size, borderType=cv2.BORDER_REFLECT) - mu_x * mu_x)
+    var_y = cov_norm * (cv2.boxFilter(y * y, -1, size, borderType=cv2.BORDER_REFLECT) - mu_y * mu_y)
+    cov_xy = cov_norm * (cv2.boxFilter(x * y, -1, size, borderType=cv2.BORDER_REFLECT) - mu_x * mu_y)
+
+    numerator = (2 * mu_x * mu_y + SSIM_C1) * (2 * cov_xy + SSIM_C2)
+    denominator = (mu_x * mu_x + mu_y * mu_y + SSIM_C1) * (var_x + var_y + SSIM_C2)
+    ssim_map = numerator / denominator
+
+    pad = (window - 1) // 2
+    return float(ssim_map[pad:-pad, pad:-pad].mean())
+
+
+def phash(gray, hash_size=8):
+    """知覚ハッシュ（32x32 のDCT低周波成分を中央値で2値化した64ビット）"""
+    small = cv2.resize(gray, (hash_size * 4, hash_size * 4), interpolation=cv2.INTER_AREA)
+    dct = cv2.dct(small.astype(np.float32))[:hash_size, :hash_size]
+    coefficients = dct.flatten()[1:]  # 直流成分（明るさ）は除く
+    return coefficients > np.median(coefficients)
+
+
+def hs_histogram(image, bins=(16, 16)):
+    """色相・彩度の2次元ヒストグラム（正規化済み）"""
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, list(bins), [0, 180, 0, 256])
+    return cv2.normalize(hist, hist, alpha=1.0, norm_type=cv2.NORM_L1)
+
+
+class SimilarityEngine:
+    """人物領域の類似度（0〜1、1 が同一）
+
+    features() で比較用の特徴（縮小グレー画像・ハッシュ・ヒストグラム）を作り、
+    compare() で特徴同士を比較する。前回分は特徴だけを保持すればよい。
+    - ssim: size に縮小したグレー画像のSSIM（size=None で全解像度、従来の skimage と同じ値。
+      SSIMの窓より小さい人物領域は窓の大きさまで拡大する）
+    - phash: 知覚ハッシュの一致ビット率（明るさの変化に強く最も速い）
+    - histogram: 色相・彩度ヒストグラムの 1 - バタチャリヤ距離（姿勢の変化に鈍い）
+    """
+
+    METHODS = ('ssim', 'phash', 'histogram')
+
+    def __init__(self, method='ssim', threshold=None, size=(48, 96)):
+        if method not in self.METHODS:
+            raise ValueError(f"未対応の類似度方式: {method}")
+        self.method = method
+        self.threshold = DEFAULT_THRESHOLDS[method] if threshold is None else threshold
+        self.size = tuple(size) if size is not None else None  # (幅, 高さ)
+
+    def features(self, crop):
+        """人物領域から比較用の特徴を作成"""
+        if crop is None or crop.size == 0:
+            return None
+        if self.method == 'histogram':
+            return hs_histogram(crop)
+        gray = to_gray(crop)
+        if self.method == 'phash':
+            return phash(gray)
+        if self.size is not None:
+            gray = cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+        elif min(gray.shape[:2]) < SSIM_WINDOW:
+            gray = cv2.resize(gray, (max(gray.shape[1], SSIM_WINDOW), max(gray.shape[0], SSIM_WINDOW)))
+        return gray
+
+    def compare(self, features1, features2):
+        """特徴同士の類似度"""
+        if features1 is None or features2 is None:
+            return 0.0
+        if self.method == 'phash':
+            return float(np.count_nonzero(features1 == features2)) / features1.size
+        if self.method == 'histogram':
+            return 1.0 - cv2.compareHist(features1, features2, cv2.HISTCMP_BHATTACHARYYA)
+        if features2.shape != features1.shape:
+            features2 = cv2.resize(features2, (features1.shape[1], features1.shape[0]))
+        return ssim_box(features1, features2, window=SSIM_WINDOW)
+
+    def similarity(self, crop1, crop2):
+        return self.compare(self.features(crop1), self.features(crop2))
+
+    def is_similar(self, score):
+        return score > self.threshold
+
+
+def create_similarity(fall_config):
+    """設定（fall_detection）から類似度の計算方式を作成
+
+    ssim は similarity_size を指定しない限り従来と同じ全解像度のSSIMで、
+    similarity_threshold をそのまま使う。縮小した ssim と他の方式は
+    similarity_thresholds の方式ごとの値、なければ較正済みの既定値を使う。
+    """
+    method = fall_config.get('similarity_method', 'ssim')
+    size = fall_config.get('similarity_size')
+    if method == 'ssim' and size is None:
+        return SimilarityEngine(method, fall_config.get('similarity_threshold'), None)
+
+    threshold = fall_config.get('similarity_thresholds', {}).get(method)
+    engine = SimilarityEngine(method, threshold, size)
+    if 'similarity_threshold' in fall_config:
+        print(
+            f"ℹ️ 類似度は {method}"
+            f"{f'（{engine.size[0]}x{engine.size[1]}に縮小）' if method == 'ssim' else ''} で比較し、"
+            f"similarity_threshold ({fall_config['similarity_threshold']}) ではなく"
+            f" similarity_thresholds の {engine.threshold} を使います"
+        )
+    return engine
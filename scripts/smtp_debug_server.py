@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - 動作確認用SMTPサーバー
+メール通知を外部に送らずに受け取り、内容を表示・保存する
+"""
+
+import argparse
+import base64
+import socketserver
+import threading
+import time
+from email import message_from_bytes, policy
+from pathlib import Path
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """最小限のSMTP（EHLO/HELO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, NOOP, QUIT）"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        self.reply("220 mimamori-halo debug SMTP")
+        sender, recipients = None, []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb == 'EHLO':
+                lines = ["mimamori-halo", *server.extensions()]
+                for extension in lines[:-1]:
+                    self.reply(f"250-{extension}")
+                self.reply(f"250 {lines[-1]}")
+            elif verb == 'HELO':
+                self.reply("250 mimamori-halo")
+            elif verb == 'AUTH' and server.auth:
+                self.auth(command)
+            elif verb == 'MAIL':
+                sender, recipients = command[10:].strip(), []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip())
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = self.read_data()
+                if server.delay:
+                    time.sleep(server.delay)
+                if server.should_fail():
+                    self.reply("451 Temporary failure (simulated)")
+                else:
+                    server.store(sender, recipients, data)
+                    self.reply("250 OK")
+                sender, recipients = None, []
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == 'NOOP':
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def auth(self, command):
+        """AUTH PLAIN（どの認証情報でも成功し、ユーザー名だけ記録する）"""
+        args = command.split()[1:]
+        if not args or args[0].upper() != 'PLAIN':
+            self.reply("504 Unrecognized authentication type")
+            return
+        if len(args) > 1:
+            response = args[1]
+        else:
+            self.reply("334 ")
+            response = self.rfile.readline().decode('ascii', 'replace').strip()
+        try:
+            _, user, _ = base64.b64decode(response).decode('utf-8').split('\0')
+        except ValueError:
+            self.reply("501 Invalid AUTH response")
+            return
+        self.server.logins.append(user)
+        self.reply("235 Authentication successful")
+
+    def read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b".\r\n", b".\n"):
+                break
+            # ドットスタッフィングを戻す
+            if line.startswith(b".."):
+                line = line[1:]
+            lines.append(line)
+        return b"".join(lines)
+
+
+class DebugSMTPServer(socketserver.ThreadingTCPServer):
+    """受信したメールを保持する代替SMTPサーバー
+
+    fail_first 通目までは一時エラー（451）を返し、delay 秒だけ応答を遅らせて
+    再送やタイムアウトの動作を確認できる。auth を有効にすると AUTH PLAIN を
+    受け付ける（暗号化しないため allow_plaintext_auth との組み合わせで使う）。
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=8025, outdir=None, fail_first=0, delay=0.0, quiet=False,
+                 auth=False):
+        super().__init__((host, port), SMTPHandler)
+        self.outdir = Path(outdir) if outdir else None
+        self.fail_first = fail_first
+        self.delay = delay
+        self.quiet = quiet
+        self.auth = auth
+        self.messages = []
+        self.logins = []
+        self.attempts = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def extensions(self):
+        """EHLO で通知する拡張"""
+        return ["AUTH PLAIN"] if self.auth else []
+
+    def should_fail(self):
+        with self._lock:
+            self.attempts += 1
+            return self.attempts <= self.fail_first
+
+    def store(self, sender, recipients, data):
+        message = message_from_bytes(data, policy=policy.default)
+        with self._lock:
+            self.messages.append(message)
+            count = len(self.messages)
+        if self.outdir:
+            self.outdir.mkdir(parents=True, exist_ok=True)
+            (self.outdir / f"{time.strftime('%Y%m%d-%H%M%S')}-{count:04d}.eml").write_bytes(data)
+        if not self.quiet:
+            print(f"📧 受信 {sender} → {', '.join(recipients)}: {message['Subject']}")
+
+    def start(self):
+        """バックグラウンドで待ち受け開始"""
+        self._thread = threading.Thread(target=self.serve_forever, name="debug-smtp", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="見守りハロ 動作確認用SMTPサーバー")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--outdir', help="受信メール（.eml）の保存先")
+    parser.add_argument('--fail-first', type=int, default=0, help="最初のN通を一時エラーにする")
+    parser.add_argument('--delay', type=float, default=0.0, help="応答を遅らせる秒数")
+    parser.add_argument('--auth', action='store_true', help="AUTH PLAIN を受け付ける")
+    args = parser.parse_args()
+
+    server = DebugSMTPServer(args.host, args.port, args.outdir, args.fail_first, args.delay,
+                             auth=args.auth)
+    print(f"📮 SMTPサーバー待ち受け中: {args.host}:{args.port}（Ctrl+Cで終了）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+見守りハロ - 人物追跡
+SORT方式（カルマンフィルタ + IoUによる対応付け）でフレームやスキャン位置を
+またいで人物に同じIDを振り、IDごとに姿勢と静止時間を管理する
+"""
+
+import itertools
+import time
+
+import numpy as np
+
+# 状態 [cx, cy, s（面積）, r（縦横比 w/h）, vx, vy, vs]、観測 [cx, cy, s, r]
+STATE_DIM = 7
+MEASURE_DIM = 4
+H = np.eye(MEASURE_DIM, STATE_DIM)
+R = np.diag([1.0, 1.0, 10.0, 10.0])
+Q = np.diag([1.0, 1.0, 1.0, 1e-3, 1e-2, 1e-2, 1e-4])
+P0 = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+
+
+def boxes_to_measurements(boxes):
+    """[x1, y1, x2, y2] の配列を [cx, cy, s, r] に変換"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    w = np.maximum(boxes[:, 2] - boxes[:, 0], 1e-6)
+    h = np.maximum(boxes[:, 3] - boxes[:, 1], 1e-6)
+    return np.stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w * h, w / h], axis=1)
+
+
+def states_to_boxes(states):
+    """状態 [cx, cy, s, r, ...] の配列を [x1, y1, x2, y2] に変換"""
+    s = np.maximum(states[:, 2], 1e-6)
+    r = np.maximum(states[:, 3], 1e-6)
+    w = np.sqrt(s * r)
+    h = s / w
+    return np.stack([
+        states[:, 0] - w / 2, states[:, 1] - h / 2,
+        states[:, 0] + w / 2, states[:, 1] + h / 2
+    ], axis=1)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """ボックス同士のIoU（len(a) × len(b)）"""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)[:, None, :]
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+def greedy_match(iou, threshold):
+    """IoUの大きい組から貪欲に対応付け（[(行, 列), ...]）
+
+    家庭内の人数ではハンガリアン法と結果がほぼ変わらず、依存も増えない。
+    """
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols], kind='stable')
+    used_rows, used_cols = set(), set()
+    matches = []
+    for row, col in zip(rows[order], cols[order]):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matches.append((int(row), int(col)))
+    return matches
+
+
+class Track:
+    """追跡中の人物1人分（座標はパン角度を換算した全方位座標）"""
+
+    def __init__(self, track_id, now):
+        self.id = track_id
+        self.first_seen = now
+        self.last_seen = now
+        self.last_time = now  # 状態を最後に予測した時刻
+        self.hits = 0
+        self.misses = 0
+        self.bbox = None
+        self.posture = None
+        self.lying_since = None
+        self.still_since = now
+        self.anchor = None  # 静止判定の基準位置
+
+        # 前回の人物領域の特徴（メモリのみ、プライバシー配慮）
+        self.features = None
+        self.features_center = None
+
+    @property
+    def center(self):
+        return ((self.bbox[0] + self.bbox[2]) / 2, (self.bbox[1] + self.bbox[3]) / 2)
+
+    def lying_seconds(self, now=None):
+        if self.lying_since is None:
+            return 0.0
+        return (time.monotonic() if now is None else now) - self.lying_since
+
+    def still_seconds(self, now=None):
+        return (time.monotonic() if now is None else now) - self.still_since
+
+
+class PersonTracker:
+    """SORT方式の人物追跡
+
+    全トラックの状態と共分散を配列でまとめて持ち、予測と更新を一括で計算する。
+    検出ボックスは offset_x を足して全方位座標にしてから対応付けるため、
+    スキャン位置が変わっても同じ人物には同じIDが付く。見えていない範囲の
+    トラックは見失った扱いにも期限切れにもせず、視野内で max_misses 回続けて
+    見失うか、max_age 秒以上見えていないまま視野内で見つからなければ削除する。
+    """
+
+    def __init__(self, iou_threshold=0.2, max_age=600.0, max_misses=5,
+                 position_tolerance=50.0, max_dt=1.0):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.max_misses = max_misses  # 視野内で連続して見失ったら削除
+        self.position_tolerance = position_tolerance
+        self.max_dt = max_dt  # 速度で外挿する最大時間（スキャン間隔は長いため）
+        self.tracks = []
+        self.means = np.zeros((0, STATE_DIM))
+        self.covariances = np.zeros((0, STATE_DIM, STATE_DIM))
+        self._ids = itertools.count(1)
+
+    def get(self, track_id):
+        for track in self.tracks:
+            if track.id == track_id:
+                return track
+        return None
+
+    def predict(self, now):
+        """全トラックを now まで予測してボックスを返す"""
+        if not self.tracks:
+            return np.zeros((0, 4))
+        dt = np.array([now - track.last_time for track in self.tracks])
+        dt = np.clip(dt, 0.0, self.max_dt)
+
+        # 面積が負にならないよう縮小速度を止める
+        shrinking = self.means[:, 2] + self.means[:, 6] * dt <= 0
+        self.means[shrinking, 6] = 0.0
+
+        F = np.tile(np.eye(STATE_DIM), (len(self.tracks), 1, 1))
+        F[:, 0, 4] = F[:, 1, 5] = F[:, 2, 6] = dt
+        self.means = np.einsum('nij,nj->ni', F, self.means)
+        self.covariances = F @ self.covariances @ F.transpose(0, 2, 1) + Q * np.maximum(dt, 1e-3)[:, None, None]
+        for track in self.tracks:
+            track.last_time = now
+        return states_to_boxes(self.means)
+
+    def _correct(self, indices, measurements):
+        """対応したトラックを観測で一括更新"""
+        means = self.means[indices]
+        covariances = self.covariances[indices]
+        S = H @ covariances @ H.T + R
+        PHt = covariances @ H.T
+        K = np.linalg.solve(S, PHt.transpose(0, 2, 1)).transpose(0, 2, 1)
+        innovation = measurements - means @ H.T
+        self.means[indices] = means + np.einsum('nij,nj->ni', K, innovation)
+        self.covariances[indices] = (np.eye(STATE_DIM) - K @ H) @ covariances
+
+    def _observe(self, track, bbox, person, now):
+        track.bbox = bbox
+        track.last_seen = now
+        track.hits += 1
+        track.misses = 0
+
+        track.posture = person.get('posture')
+        if track.posture == 'lying':
+            if track.lying_since is None:
+                track.lying_since = now
+        else:
+            track.lying_since = None
+
+        center = track.center
+        if track.anchor is None or np.hypot(center[0] - track.anchor[0],
+                                            center[1] - track.anchor[1]) > self.position_tolerance:
+            track.anchor = center
+            track.still_since = now
+
+    def update(self, persons, now=None, offset_x=0.0, view=None):
+        """検出結果で追跡を更新し、track_id を付けた検出結果を返す
+
+        offset_x は画像のx座標を全方位座標に換算するためのずれ、view は
+        今回見えている全方位座標でのx範囲（見えていないトラックは見失わない）。
+        """
+        now = time.monotonic() if now is None else now
+        predicted = self.predict(now)
+
+        boxes = np.array([person['bbox'] for person in persons], dtype=np.float64).reshape(-1, 4)
+        boxes[:, [0, 2]] += offset_x
+        matches = greedy_match(iou_matrix(boxes, predicted), self.iou_threshold)
+
+        if matches:
+            rows = [row for row, _ in matches]
+            cols = [col for _, col in matches]
+            self._correct(cols, boxes_to_measurements(boxes[rows]))
+
+        assigned = {}
+        for row, col in matches:
+            track = self.tracks[col]
+            self._observe(track, boxes[row].tolist(), persons[row], now)
+            assigned[row] = track
+
+        # 視野内で見つからなかったトラック（視野外のものは他のスキャン位置に
+        # いるだけなので、どれだけ間が空いても削除しない）
+        matched_cols = {col for _, col in matches}
+        lost = set()
+        for col, track in enumerate(self.tracks):
+            if col in matched_cols:
+                continue
+            center_x = (predicted[col, 0] + predicted[col, 2]) / 2
+            if view is None or view[0] <= center_x <= view[1]:
+                track.misses += 1
+                if track.misses > self.max_misses or now - track.last_seen > self.max_age:
+                    lost.add(col)
+
+        # 新しい人物
+        new_means = []
+        for row in range(len(persons)):
+            if row in assigned:
+                continue
+            track = Track(next(self._ids), now)
+            self._observe(track, boxes[row].tolist(), persons[row], now)
+            self.tracks.append(track)
+            new_means.append(np.concatenate([boxes_to_measurements(boxes[row])[0], np.zeros(3)]))
+            assigned[row] = track
+        if new_means:
+            self.means = np.vstack([self.means, new_means])
+            self.covariances = np.concatenate([
+                self.covariances, np.tile(P0, (len(new_means), 1, 1))
+            ])
+
+        # 見失ったトラックを削除
+        keep = np.array([col not in lost for col in range(len(self.tracks))], dtype=bool)
+        if not keep.all():
+            self.tracks = [track for track, kept in zip(self.tracks, keep) if kept]
+            self.means = self.means[keep]
+            self.covariances = self.covariances[keep]
+
+        return [{**person, 'track_id': assigned[row].id} for row, person in enumerate(persons)]
+
+    def primary(self, persons, track_id=None):
+        """注目する人物（指定IDがいればその人、なければ最も長く追跡している人）"""
+        if not persons:
+            return None
+        if track_id is not None:
+            for person in persons:
+                if person.get('track_id') == track_id:
+                    return person
+
+        def key(person):
+            track = self.get(person.get('track_id'))
+            return (track.hits if track is not None else 0, person['confidence'])
+
+        return max(persons, key=key)
@@ -0,0 +1,6 @@
+"""テスト共通設定（scripts/ のモジュールを直接 import できるようにする）"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
@@ -0,0 +1,148 @@
+"""FrameGrabber / PipeFrameGrabber のテスト（生成した短い動画・ffmpeg の代わりのプロセスを使う）"""
+
+import subprocess
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from capture import FrameGrabber, PipeFrameGrabber
+
+WIDTH, HEIGHT = 64, 48
+
+
+@pytest.fixture
+def video(tmp_path):
+    """明るさでフレーム番号がわかる 5 フレーム・50fps の動画"""
+    path = tmp_path / 'loop.avi'
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 50, (WIDTH, HEIGHT))
+    assert writer.isOpened()
+    for index in range(5):
+        writer.write(np.full((HEIGHT, WIDTH, 3), 40 * index + 20, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_file_source_loops(video):
+    grabber = FrameGrabber(video).start()
+    try:
+        assert grabber.is_file
+        frame = grabber.read(timeout=5)
+        assert frame is not None and frame.shape == (HEIGHT, WIDTH, 3)
+        # 5 フレームを超えて読めればループしている
+        deadline = time.monotonic() + 5
+        while grabber.frame_count <= 10:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert grabber.read(newer_than=time.monotonic(), timeout=5) is not None
+        assert grabber.reconnects == 0
+    finally:
+        grabber.stop()
+
+
+class BrokenCapture:
+    """先頭に戻せない動画（broken なら開き直しても読めない）"""
+
+    def __init__(self, source, broken):
+        self._cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+        self.broken = broken
+        self.reads = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cap, name)
+
+    def read(self):
+        self.reads += 1
+        return (False, None) if self.broken else self._cap.read()
+
+    def set(self, prop, value):
+        return prop != cv2.CAP_PROP_POS_FRAMES and self._cap.set(prop, value)
+
+
+class BrokenGrabber(FrameGrabber):
+    """1回目に開いたときだけ読める（戻せない・開き直しても読めなくなった）動画"""
+
+    def __init__(self, source, broken_after_first, **kwargs):
+        super().__init__(source, **kwargs)
+        self.broken_after_first = broken_after_first
+        self.captures = []
+
+    def _open(self):
+        broken = self.broken_after_first and bool(self.captures)
+        self.captures.append(BrokenCapture(self.source, broken))
+        return self.captures[-1]
+
+
+def wait_reconnects(grabber, count):
+    deadline = time.monotonic() + 5
+    while grabber.reconnects < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_unseekable_file_reopens_after_pause(video, capsys):
+    """戻せないファイルは開き直してループする（すぐに読み直し続けない）"""
+    grabber = BrokenGrabber(video, False, reconnect_min=0.05, reconnect_max=0.2).start()
+    try:
+        assert grabber.read(timeout=5) is not None
+        wait_reconnects(grabber, 2)
+    finally:
+        grabber.stop()
+    # 開くたびに 5 フレーム + 終端・戻した後の失敗 2 回だけ読む
+    assert all(capture.reads <= 7 for capture in grabber.captures)
+    assert 'ストリーム切断 - 0.05秒後に再接続' in capsys.readouterr().out
+
+
+def test_unreadable_file_backs_off(video, capsys):
+    """開き直しても読めないファイルは指数バックオフで間隔を広げる"""
+    grabber = BrokenGrabber(video, True, reconnect_min=0.05, reconnect_max=0.2).start()
+    try:
+        assert grabber.read(timeout=5) is not None
+        wait_reconnects(grabber, 3)
+    finally:
+        grabber.stop()
+    assert all(capture.reads <= 2 for capture in grabber.captures[1:])
+    output = capsys.readouterr().out
+    assert 'ストリーム切断 - 0.1秒後に再接続' in output
+    assert 'ストリーム切断 - 0.2秒後に再接続' in output
+
+
+class FakeFFmpegGrabber(PipeFrameGrabber):
+    """ffmpeg の代わりに bgr24 の生データを書き続ける Python プロセスを使う"""
+
+    def _command(self):
+        script = (
+            "import sys, time\n"
+            f"frame = bytes({WIDTH * HEIGHT * 3})\n"
+            "while True:\n"
+            "    sys.stdout.buffer.write(frame); sys.stdout.buffer.flush(); time.sleep(0.01)\n"
+        )
+        return [sys.executable, '-c', script]
+
+
+class SlowKillPopen(subprocess.Popen):
+    """stop() からの kill は、受信スレッドがパイプの終端を読んでプロセスを回収するまで戻らない"""
+
+    def kill(self):
+        super().kill()
+        if threading.current_thread().name == 'frame-grabber':
+            return
+        deadline = time.monotonic() + 2
+        while self.returncode is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+
+
+def test_pipe_grabber_stop_is_not_a_disconnect(monkeypatch, capsys):
+    monkeypatch.setattr(subprocess, 'Popen', SlowKillPopen)
+    grabber = FakeFFmpegGrabber('fake://camera', width=WIDTH, height=HEIGHT).start()
+    try:
+        frame = grabber.read(timeout=10)
+        assert frame is not None and frame.shape == (HEIGHT, WIDTH, 3)
+    finally:
+        grabber.stop()
+    assert grabber.reconnects == 0
+    assert 'ストリーム切断' not in capsys.readouterr().out
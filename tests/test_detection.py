@@ -0,0 +1,76 @@
+"""検出バックエンド共通処理のテスト"""
+
+import time
+
+import numpy as np
+import pytest
+
+from detection import PERSON_CLASS, BatchingDetector, ExportedYoloDetector
+
+
+class FakeExportedDetector(ExportedYoloDetector):
+    """明るい画像の中央に人物が1人いると答える（入力サイズ・バッチ固定）"""
+
+    def __init__(self, fixed_batch):
+        super().__init__(imgsz=64)
+        self.fixed_size = 64
+        self.fixed_batch = fixed_batch
+        self.batch_sizes = []
+
+    def _infer(self, blob):
+        assert blob.shape[1:] == (3, 64, 64)
+        self.batch_sizes.append(len(blob))
+        output = np.zeros((len(blob), 4 + 80, 1), dtype=np.float32)
+        output[:, :4, 0] = (32, 32, 16, 32)
+        output[:, 4 + PERSON_CLASS, 0] = blob.mean(axis=(1, 2, 3)) > 0.5
+        return output
+
+
+def test_fixed_batch_pads_last_chunk():
+    detector = FakeExportedDetector(fixed_batch=4)
+    images = [np.full((64, 64, 3), 255, dtype=np.uint8) for _ in range(5)]
+    results = detector.detect_batch(images)
+    assert detector.batch_sizes == [4, 4]
+    assert [len(persons) for persons in results] == [1] * 5
+
+
+def test_fixed_batch_single_image():
+    detector = FakeExportedDetector(fixed_batch=2)
+    persons = detector.detect(np.full((64, 64, 3), 255, dtype=np.uint8), offset=(100, 0))
+    assert detector.batch_sizes == [2]
+    assert len(persons) == 1
+    assert persons[0]['bbox'][0] == 124.0
+
+
+class SlowDetector:
+    name = 'slow'
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.batch_sizes = []
+
+    def detect_batch(self, images, imgsz=None):
+        time.sleep(self.delay)
+        self.batch_sizes.append(len(images))
+        return [[{'bbox': [0, 0, 10, 10], 'confidence': 0.9}] for _ in images]
+
+
+def test_batching_detector_close_stops_every_worker():
+    """各ワーカーは停止要求を1つずつ取り、先に依頼された推論は済ませてから止まる"""
+    detector = BatchingDetector(SlowDetector(), max_batch=4, max_wait=0.05, workers=3)
+    futures = [detector.submit(np.zeros((4, 4, 3), dtype=np.uint8), offset=(i, 0)) for i in range(10)]
+    detector.close()
+    assert not any(thread.is_alive() for thread in detector._threads)
+    assert [future.result(timeout=1)[0]['bbox'][0] for future in futures] == list(range(10))
+    assert detector.stats()['images'] == 10
+    with pytest.raises(RuntimeError):
+        detector.submit(np.zeros((4, 4, 3), dtype=np.uint8))
+
+
+def test_batching_detector_stats_ready_before_first_batch():
+    detector = BatchingDetector(SlowDetector(delay=0.0), max_wait=0.0)
+    try:
+        assert detector.detect(np.zeros((4, 4, 3), dtype=np.uint8))
+        assert detector.stats()['batches'] == 1
+    finally:
+        detector.close()
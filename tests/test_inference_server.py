@@ -0,0 +1,56 @@
+"""InferenceServer のテスト"""
+
+import numpy as np
+import pytest
+
+from inference_server import InferenceError, InferenceServer
+
+
+def test_gives_up_after_repeated_start_failures():
+    """起動できない推論プロセスは再起動を繰り返さず、wait_ready() で失敗がわかる"""
+    server = InferenceServer({'backend': 'missing'}, slots=1, max_frame=(8, 8), max_start_failures=2)
+    try:
+        with pytest.raises(InferenceError, match='missing'):
+            server.wait_ready(timeout=60)
+        assert server.restarts == 1
+        with pytest.raises(InferenceError):
+            server.submit(np.zeros((8, 8, 3), dtype=np.uint8))
+        # スロットは返却されている
+        assert server._free_slots.qsize() == 1
+    finally:
+        server.close()
+
+
+def test_wait_ready_times_out():
+    server = InferenceServer({'backend': 'missing'}, slots=1, max_frame=(8, 8), max_start_failures=100)
+    try:
+        assert server.wait_ready(timeout=0.05) is False
+    finally:
+        server.close()
+
+
+def test_shared_frames_keep_memory_open_while_frames_exist():
+    """スロットを作り直しても、前のフレームが残っている間は古い共有メモリを閉じない"""
+    from multiprocessing import shared_memory
+
+    from inference_server import SharedFrames
+
+    old = shared_memory.SharedMemory(create=True, size=16)
+    new = shared_memory.SharedMemory(create=True, size=64)
+    try:
+        frames = SharedFrames([old.name])
+        image = frames.frame(0, old.name, (4, 4))
+        crop = image[1:3]
+        del image
+        frames.frame(0, new.name, (8, 8))
+        frames.release_stale()
+        crop[:] = 7  # 古い共有メモリはまだ閉じていない
+        assert old.buf[4] == 7
+        del crop
+        frames.release_stale()
+        assert frames._stale == []
+        frames.close()
+    finally:
+        for shm in (old, new):
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,29 @@
+"""MotionGate のテスト"""
+
+import numpy as np
+
+from motion import MotionGate
+
+
+def frame(value=0):
+    image = np.zeros((90, 160, 3), dtype=np.uint8)
+    image[20:70, 40:120] = value
+    return image
+
+
+def test_reuses_result_for_unchanged_frame():
+    gate = MotionGate()
+    assert gate.reuse(0, frame(), pan=0.0) is None
+    gate.remember(0, ['person'])
+    assert gate.reuse(0, frame(), pan=0.4) == ['person']
+    assert gate.reuse(0, frame(200), pan=0.0) is None
+
+
+def test_reinfers_when_camera_stopped_elsewhere():
+    """同じスキャン位置でも到達した角度がずれていれば前回結果を使わない"""
+    gate = MotionGate(pan_tolerance=1.0)
+    assert gate.reuse(30, frame(), pan=30.0) is None
+    gate.remember(30, ['person'])
+    assert gate.reuse(30, frame(), pan=27.5) is None
+    gate.remember(30, ['moved'])
+    assert gate.reuse(30, frame(), pan=27.5) == ['moved']
@@ -0,0 +1,108 @@
+"""EmailSink のテスト（scripts/smtp_debug_server.py を相手に送信する）"""
+
+import smtplib
+import ssl
+
+import pytest
+
+from notifier import EmailSink
+from smtp_debug_server import DebugSMTPServer
+
+ALERT = {'kind': 'alert', 'type': 'fall', 'timestamp': '2026-01-01T00:00:00', 'data': {'angle': 0}}
+
+
+class StartTLSServer(DebugSMTPServer):
+    """STARTTLS を通知するだけの代替サーバー（暗号化はテスト側で省略する）"""
+
+    def extensions(self):
+        return ["STARTTLS", *super().extensions()]
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(server_class=DebugSMTPServer, **kwargs):
+        server = server_class(port=0, quiet=True, **kwargs).start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def fake_starttls(monkeypatch):
+    """STARTTLS を送らず、渡された SSLContext だけ記録する"""
+    contexts = []
+
+    def starttls(smtp, context=None):
+        contexts.append(context)
+        return (220, b'ready')
+
+    monkeypatch.setattr(smtplib.SMTP, 'starttls', starttls)
+    return contexts
+
+
+def sink_for(server, **config):
+    return EmailSink({
+        'smtp_server': '127.0.0.1', 'smtp_port': server.server_address[1],
+        'sender': 'halo@example.com', 'recipient': 'family@example.com', **config
+    }, timeout=5)
+
+
+def test_sends_without_password(make_server):
+    server = make_server()
+    sink_for(server).send(ALERT)
+    assert len(server.messages) == 1
+    assert server.messages[0]['Subject'] == '【見守りハロ】緊急アラート: fall'
+    assert server.logins == []
+
+
+def test_password_requires_starttls(make_server):
+    server = make_server(auth=True)
+    with pytest.raises(smtplib.SMTPNotSupportedError, match='STARTTLS'):
+        sink_for(server, password='secret').send(ALERT)
+    assert server.messages == []
+    assert server.logins == []
+
+
+def test_plaintext_auth_when_allowed(make_server):
+    server = make_server(auth=True)
+    sink_for(server, password='secret', allow_plaintext_auth=True).send(ALERT)
+    assert server.logins == ['halo@example.com']
+    assert len(server.messages) == 1
+
+
+def test_starttls_verifies_certificate(make_server, fake_starttls):
+    server = make_server(StartTLSServer, auth=True)
+    sink_for(server, password='secret').send(ALERT)
+    assert len(fake_starttls) == 1
+    context = fake_starttls[0]
+    assert isinstance(context, ssl.SSLContext)
+    assert context.check_hostname and context.verify_mode == ssl.CERT_REQUIRED
+    assert server.logins == ['halo@example.com']
+    assert len(server.messages) == 1
+
+
+def test_password_without_auth_extension_is_refused(make_server, fake_starttls):
+    server = make_server(StartTLSServer)
+    with pytest.raises(smtplib.SMTPNotSupportedError, match='AUTH'):
+        sink_for(server, password='secret').send(ALERT)
+    assert fake_starttls
+    assert server.messages == []
+
+
+def test_smtp_ssl_verifies_certificate(monkeypatch):
+    calls = []
+
+    def smtp_ssl(host, port, **kwargs):
+        calls.append(kwargs)
+        raise ConnectionRefusedError
+
+    monkeypatch.setattr(smtplib, 'SMTP_SSL', smtp_ssl)
+    with pytest.raises(ConnectionRefusedError):
+        EmailSink({'smtp_server': 'smtp.example.com', 'smtp_port': 465}).send(ALERT)
+    context = calls[0]['context']
+    assert context.check_hostname and context.verify_mode == ssl.CERT_REQUIRED
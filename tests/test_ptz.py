@@ -0,0 +1,156 @@
+"""PTZClient / PTZController のテスト（SimulatedPTZService を相手に動かす）"""
+
+import threading
+import time
+
+from ptz import PTZClient, PTZController, SimulatedPTZService
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+class GatedLock:
+    """送信スレッドだけ gate が開くまで取得を待たせるロック"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.gate = threading.Event()
+        self.waiting = threading.Event()
+
+    def __enter__(self):
+        if threading.current_thread().name == 'ptz-sender':
+            self.waiting.set()
+            self.gate.wait(2.0)
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def test_deadline_stop_after_async_move():
+    service = SimulatedPTZService()
+    client = PTZClient(service, 'profile')
+    try:
+        client.send_async('ContinuousMove', 0.5, duration=0.05)
+        wait_for(lambda: service.calls.get('Stop'))
+        assert service.calls['ContinuousMove'] == 1
+    finally:
+        client.close()
+
+
+def test_latest_async_move_wins():
+    service = SimulatedPTZService()
+    client = PTZClient(service, 'profile')
+    lock = client._send_lock = GatedLock()
+    try:
+        client.send_async('ContinuousMove', 0.1)
+        lock.waiting.wait(2.0)
+        client.send_async('ContinuousMove', 0.2)
+        client.send_async('ContinuousMove', 0.3)
+        lock.gate.set()
+        wait_for(lambda: service.calls.get('ContinuousMove') == 2)
+        assert client.superseded == 1
+        assert client._request('ContinuousMove').Velocity['PanTilt']['x'] == 0.3
+    finally:
+        client.close()
+
+
+def test_stop_racing_a_dequeued_move():
+    """送信スレッドが取り出した移動指令より、後の同期 Stop が優先される"""
+    service = SimulatedPTZService()
+    client = PTZClient(service, 'profile')
+    lock = client._send_lock = GatedLock()
+    try:
+        client.send_async('ContinuousMove', 0.5, duration=0.05)
+        # 送信スレッドは指令を取り出して送信直前で止まっている
+        assert lock.waiting.wait(2.0)
+        assert client._pending is None
+        client.call('Stop')
+        lock.gate.set()
+        wait_for(lambda: client.superseded == 1)
+        time.sleep(0.1)  # 停止期限も過ぎる
+        assert service.calls == {'Stop': 1}
+        assert service._velocity == 0.0
+    finally:
+        client.close()
+
+
+def make_controller(supports):
+    service = SimulatedPTZService(max_speed=1000.0, supports=supports)
+    controller = PTZController(service, 'sim', degrees_per_second=1000.0)
+    return service, controller
+
+
+def test_goto_uses_absolute_move():
+    service, controller = make_controller(('absolute', 'relative', 'status'))
+    try:
+        pan = controller.goto(30)
+        assert abs(pan - 30) <= controller.tolerance
+        assert abs(service.pan - 30) <= controller.tolerance
+        assert controller.has_feedback
+        assert 'RelativeMove' not in service.calls and 'ContinuousMove' not in service.calls
+    finally:
+        controller.close()
+
+
+def test_goto_falls_back_to_relative_move():
+    service, controller = make_controller(('relative', 'status'))
+    try:
+        for angle in (30, -20):
+            pan = controller.goto(angle)
+            assert abs(pan - angle) <= controller.tolerance
+            assert abs(service.pan - angle) <= controller.tolerance
+        # 未対応と分かった操作は2回目以降は試さない
+        assert service.calls['AbsoluteMove'] == 1
+        assert service.calls['RelativeMove'] == 2
+        assert controller.supports['absolute'] is False
+    finally:
+        controller.close()
+
+
+def test_goto_falls_back_to_timed_continuous_move():
+    service, controller = make_controller(())
+    try:
+        for angle in (30, -20):
+            assert controller.goto(angle) == angle
+            assert abs(service.pan - angle) < 5
+        assert not controller.has_feedback
+        assert service.calls['ContinuousMove'] == 2
+        assert service.calls['Stop'] == 2
+        assert service._velocity == 0.0
+    finally:
+        controller.close()
+
+
+def test_preset_scan():
+    """スキャン位置をプリセットとして登録し、2回目以降は登録済みのものを使う"""
+    service, controller = make_controller(('absolute', 'status', 'presets'))
+    angles = [-30, 0, 30]
+    try:
+        tokens = controller.register_presets(angles + [0], prefix='scan')
+        assert sorted(tokens) == angles
+        assert service.calls['SetPreset'] == 3
+
+        for angle in angles:
+            pan = controller.goto_preset(tokens[angle], angle)
+            assert abs(pan - angle) <= controller.tolerance
+            assert abs(service.pan - angle) <= controller.tolerance
+
+        assert controller.register_presets(angles, prefix='scan') == tokens
+        assert service.calls['SetPreset'] == 3
+    finally:
+        controller.close()
+
+
+def test_presets_unsupported():
+    service, controller = make_controller(('absolute', 'status'))
+    try:
+        assert controller.register_presets([-30, 30]) == {}
+        assert 'SetPreset' not in service.calls
+    finally:
+        controller.close()
@@ -0,0 +1,60 @@
+"""PersonTracker のテスト"""
+
+from tracker import PersonTracker
+
+WIDTH = 640
+
+
+def person(x1, y1, x2, y2, posture='standing'):
+    return {'bbox': [x1, y1, x2, y2], 'confidence': 0.9, 'posture': posture}
+
+
+def scan(tracker, now, offset_x, persons=()):
+    return tracker.update(list(persons), now=now, offset_x=offset_x,
+                          view=(offset_x, offset_x + WIDTH))
+
+
+def test_track_survives_full_scan_cycle():
+    """max_age より長いスキャン周期でも、他の角度にいる間は同じIDのまま"""
+    tracker = PersonTracker(max_age=600, max_misses=5)
+    sitting = person(100, 100, 200, 300)
+    first = scan(tracker, 0.0, 0.0, [sitting])[0]['track_id']
+
+    # 他のスキャン位置を回っている間は視野外
+    for i, offset_x in enumerate([WIDTH, 2 * WIDTH, 3 * WIDTH]):
+        scan(tracker, 300.0 * (i + 1), offset_x)
+    assert tracker.get(first) is not None
+
+    again = scan(tracker, 1200.0, 0.0, [sitting])[0]['track_id']
+    assert again == first
+    assert tracker.get(first).still_seconds(1200.0) == 1200.0
+
+
+def test_stale_track_in_view_is_dropped():
+    """max_age 以上見えていないトラックが視野内で見つからなければすぐ削除"""
+    tracker = PersonTracker(max_age=600, max_misses=5)
+    track_id = scan(tracker, 0.0, 0.0, [person(100, 100, 200, 300)])[0]['track_id']
+
+    scan(tracker, 10.0, 0.0)
+    assert tracker.get(track_id) is not None
+    scan(tracker, 700.0, 0.0)
+    assert tracker.get(track_id) is None
+
+
+def test_track_dropped_after_misses_in_view():
+    tracker = PersonTracker(max_age=600, max_misses=2)
+    track_id = scan(tracker, 0.0, 0.0, [person(100, 100, 200, 300)])[0]['track_id']
+    for i in range(2):
+        scan(tracker, 0.1 * (i + 1), 0.0)
+        assert tracker.get(track_id) is not None
+    scan(tracker, 0.3, 0.0)
+    assert tracker.get(track_id) is None
+
+
+def test_offset_matches_same_person_from_other_angle():
+    """全方位座標に換算して、隣の角度から見た同じ人物を対応付ける"""
+    tracker = PersonTracker()
+    track_id = scan(tracker, 0.0, 0.0, [person(500, 100, 600, 300)])[0]['track_id']
+    # 視野を 320 ずらすと同じ人物は画像上で 320 左に写る
+    again = scan(tracker, 1.0, 320.0, [person(180, 100, 280, 300)])[0]['track_id']
+    assert again == track_id